@@ -1,8 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from Models.QueryPriceRequest import QueryPriceRequest
 from Models.CompleteTransactionRequest import CompleteTransactionRequest
-from Services.RenewalService import RenewalService
+from Models.WarmSessionRequest import WarmSessionRequest
+from Services.DriverPoolService import driver_pool
+from Services.StepTimingService import StepTimings
+from Services.ClerkErrors import ClerkAlertError, UnrecognizedPageError
+from Services.HttpRenewalService import HttpRenewalService, warm_http_pool
+from Services.QuoteCacheService import quote_cache, quote_key
+from Services.AlertCacheService import alert_cache
+from Services.CountyProfileService import county_profiles
+from Services.FeeEstimateService import fee_estimates
+from Services.SingleFlightService import quote_flights
+from Services.SessionStoreService import (
+    SPECULATIVE_SESSION_TTL, ParkedSession, parked_sessions, speculative_sessions,
+)
+from Services.AddressService import bulk_is_in_city_limits, full_address
+from Services.JobQueueService import InvalidCallbackError, QueueFullError, check_callback_url, job_queue
+from Services.MetricsService import HTTP_FAST_PATH, REQUESTS, SPECULATIVE_SESSIONS, THREAD_POOL_BUSY, registry
+from Services.BrowserAdmissionService import BrowserCapacityError, browser_admission
+from Services.ReadinessService import readiness
+from Services.DevToolsService import devtools_engine
+from Services.DeadlineService import REQUEST_DEADLINE, Deadline, DeadlineExceededError, RunCancelledError
 import os
+import json
 import logging
 from concurrent.futures import ThreadPoolExecutor
 import asyncio
@@ -10,69 +31,312 @@ from functools import partial
 
 app = FastAPI()
 renewal_service_url = os.getenv("RENEWAL_SERVICE_URL")
+http_fast_path_enabled = os.getenv("HTTP_FAST_PATH", "true").lower() in ("1", "true", "yes")
+# "devtools" runs browser price queries as tabs on the event loop instead of Selenium threads
+browser_engine = os.getenv("BROWSER_ENGINE", "selenium").lower()
+thread_pool_workers = int(os.getenv("THREAD_POOL_WORKERS", "10"))
+batch_max_size = int(os.getenv("BATCH_MAX_SIZE", "500"))
+batch_county_concurrency = int(os.getenv("BATCH_COUNTY_CONCURRENCY", "2"))
+# how long a full query waits for a warm-up of its plate that is still on its way
+speculative_attach_wait = float(os.getenv("SPECULATIVE_ATTACH_WAIT", "10"))
+# a warm-up only starts while this worker keeps this many browsers free for real requests
+speculative_browser_headroom = int(os.getenv("SPECULATIVE_BROWSER_HEADROOM", "1"))
+disconnect_poll_interval = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
 # Create a thread pool for handling Selenium operations
-thread_pool = ThreadPoolExecutor(max_workers=10)
+thread_pool = ThreadPoolExecutor(max_workers=thread_pool_workers)
 
 logging.basicConfig(level=logging.INFO)
 
+registry.gauge("thread_pool_size", "Renewal thread pool capacity", function=lambda: thread_pool_workers)
+registry.gauge("browsers_in_use", "Chrome drivers currently borrowed from the pool", function=lambda: driver_pool.in_use)
+registry.gauge("browsers_total", "Chrome drivers launched and held by the pool", function=lambda: driver_pool.size)
+registry.gauge("parked_sessions", "Browsers parked on the fee page awaiting completion",
+               function=lambda: parked_sessions.parked_count)
+registry.gauge("speculative_sessions", "Browsers a warm-up left part-way through a plate search",
+               function=lambda: speculative_sessions.parked_count)
+registry.gauge("browser_memory_committed_bytes", "Memory held by pooled browsers (measured RSS or estimate)",
+               function=browser_admission.worker_committed_bytes)
+registry.gauge("devtools_tabs_in_use", "DevTools engine tabs currently driving a renewal",
+               function=lambda: devtools_engine.in_use)
+registry.gauge("job_queue_depth", "Jobs waiting in the job queue", function=job_queue.depth)
+
+def occupying_thread(func, *args, **kwargs):
+    THREAD_POOL_BUSY.inc()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        THREAD_POOL_BUSY.dec()
+
 async def run_in_thread(func, *args, **kwargs):
     """Execute a function in a thread pool to prevent blocking"""
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(thread_pool, partial(func, *args, **kwargs))
+    return await loop.run_in_executor(thread_pool, partial(occupying_thread, func, *args, **kwargs))
+
+async def run_with_deadline(func, request):
+    """Await func(request, deadline=...) under a fresh REQUEST_DEADLINE; when the awaiting
+    task is cancelled the deadline is too, so a run on the thread pool stops at its next wait"""
+    deadline = Deadline(REQUEST_DEADLINE)
+    try:
+        return await func(request, deadline=deadline)
+    except asyncio.CancelledError:
+        deadline.cancel("caller stopped waiting")
+        raise
+
+async def until_disconnected(http_request: Request, awaitable):
+    """Await awaitable, cancelling it (and the renewal run behind it) once the client hangs up"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=disconnect_poll_interval)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise RunCancelledError("client disconnected")
+    finally:
+        task.cancel()
+
+def clerk_alert_response(request: QueryPriceRequest, e: ClerkAlertError):
+    """Remember the clerk's rejection so a retry of the same plate skips the browser, as a 400"""
+    category = alert_cache.put(request, e.alert_text)
+    logging.info(f"[Plate: {request.plateNumber}] Clerk rejected the plate ({category}): {e.alert_text}")
+    return HTTPException(status_code=400, detail=f"{e.alert_text}")
+
+async def raise_cached_alert(request: QueryPriceRequest):
+    """Answer a plate search the clerk rejected recently with the same 400, without a browser"""
+    cached = await asyncio.to_thread(alert_cache.get, request)
+    if cached:
+        logging.info(f"[Plate: {request.plateNumber}] Answered from alert cache ({cached['category']})")
+        raise HTTPException(status_code=400, detail=cached["alertText"])
 
-def process_renewal_query(request: QueryPriceRequest):
+def process_renewal_query(request: QueryPriceRequest, timings: StepTimings | None = None,
+                          deadline: Deadline | None = None):
     """Handle the renewal query process in a separate thread"""
+    if request.parkSession:
+        fee_summary = process_renewal_query_in_browser(request, timings, park=True, deadline=deadline)
+    else:
+        fee_summary = lookup_renewal_price(request, timings, deadline)
+    if fee_summary.get("Total"):
+        quote_cache.put(request, {k: v for k, v in fee_summary.items() if k != "sessionToken"})
+        fee_estimates.observe(request, fee_summary)
+    return fee_summary
+
+def lookup_renewal_price(request: QueryPriceRequest, timings: StepTimings | None = None,
+                         deadline: Deadline | None = None):
+    """Scrape the fee summary: in the browser a warm-up already advanced, else over plain
+    HTTP when possible"""
+    fee_summary = process_renewal_query_in_speculative_session(request, timings, deadline)
+    if fee_summary is None:
+        fee_summary = lookup_renewal_price_over_http(request, deadline)
+    if fee_summary is not None:
+        return fee_summary
+    return process_renewal_query_in_browser(request, timings, deadline=deadline)
+
+def lookup_renewal_price_over_http(request: QueryPriceRequest, deadline: Deadline | None = None):
+    """The fee summary from the HTTP fast path, or None when the browser has to take over"""
+    if not http_fast_path_enabled:
+        return None
     try:
-        renewal_service = RenewalService(request)
-        renewal_service.driver.get(renewal_service_url)
-        
-        renewal_service.beginning_county_selection()
-        current_page = renewal_service.check_current_page()
-        
-        alert = renewal_service.fill_street_number_page()
-        if alert:
-            raise HTTPException(status_code=400, detail=f"{alert}")
-        
-        current_page = renewal_service.check_current_page()
-        logging.info(f"current page {current_page}")
+        fee_summary = HttpRenewalService(request, deadline=deadline).process_query(renewal_service_url)
+        HTTP_FAST_PATH.inc(outcome="ok")
+        return fee_summary
+    except ClerkAlertError as e:
+        HTTP_FAST_PATH.inc(outcome="alert")
+        raise clerk_alert_response(request, e)
+    except UnrecognizedPageError as e:
+        HTTP_FAST_PATH.inc(outcome="fallback")
+        logging.info(f"[Plate: {request.plateNumber}] HTTP fast path gave up, using the browser: {e}")
+        return None
+
+async def process_renewal_query_async(request: QueryPriceRequest, timings: StepTimings | None = None,
+                                      deadline: Deadline | None = None):
+    """process_renewal_query for the DevTools engine: only the HTTP fast path, and a warmed-up
+    Selenium session, use a thread"""
+    fee_summary = await run_in_thread(process_renewal_query_in_speculative_session, request, timings, deadline)
+    if fee_summary is None:
+        fee_summary = await run_in_thread(lookup_renewal_price_over_http, request, deadline)
+    if fee_summary is None:
+        fee_summary = await process_renewal_query_in_devtools(request, timings, deadline)
+    if fee_summary.get("Total"):
+        await asyncio.to_thread(quote_cache.put, request, fee_summary)
+        await asyncio.to_thread(fee_estimates.observe, request, fee_summary)
+    return fee_summary
 
+async def process_renewal_query_in_devtools(request: QueryPriceRequest, timings: StepTimings | None = None,
+                                            deadline: Deadline | None = None):
+    """Look up the renewal price in a DevTools tab, with the same page handlers as Selenium"""
+    from Services.AsyncRenewalService import AsyncRenewalService
 
-        if current_page == "price_page" or renewal_service.has_shelby_address_verify():
-            logging.info("got price early")
-            return renewal_service.collect_form_data()
+    renewal_service = AsyncRenewalService(request, timings=timings, deadline=deadline)
+    try:
+        await renewal_service.load_county_profile()
+        await renewal_service.acquire_tab()
+        renewal_service.start_city_limits_lookup()
+        await renewal_service.open_landing_page(renewal_service_url)
 
-        renewal_service.fill_form_page()
+        await renewal_service.run_until("price_page")
+        await renewal_service.record_county_profile()
+        fee_summary = await renewal_service.collect_form_data()
+
+        if not fee_summary:
+            raise HTTPException(status_code=500, detail="Failed to retrieve fee summary")
+        return fee_summary
+    except ClerkAlertError as e:
+        raise await asyncio.to_thread(clerk_alert_response, request, e)
+    finally:
+        log_browser_run(renewal_service)
+        await renewal_service.release()
 
-        renewal_service.county_selection_element()
+def process_renewal_query_in_browser(request: QueryPriceRequest, timings: StepTimings | None = None,
+                                     park: bool = False, deadline: Deadline | None = None):
+    """Drive the clerk site with Selenium to look up the renewal price; with park=True the
+    browser is left on the fee page and its session token returned for the completion"""
+    from Services.RenewalService import RenewalService
 
+    try:
+        renewal_service = RenewalService(request, timings=timings, deadline=deadline)
+        renewal_service.start_city_limits_lookup()
+        renewal_service.open_landing_page(renewal_service_url)
+
+        renewal_service.run_until("price_page")
+        renewal_service.record_county_profile()
         fee_summary = renewal_service.collect_form_data()
-        
-        if fee_summary:
-            return fee_summary
-        raise HTTPException(status_code=500, detail="Failed to retrieve fee summary")
+
+        if not fee_summary:
+            raise HTTPException(status_code=500, detail="Failed to retrieve fee summary")
+        if park:
+            token = parked_sessions.park(renewal_service.driver, request)
+            if token:
+                # the parked session now owns the browser until completion or expiry
+                renewal_service.driver = None
+                fee_summary = {**fee_summary, "sessionToken": token}
+        return fee_summary
+    except ClerkAlertError as e:
+        raise clerk_alert_response(request, e)
+    finally:
+        # Hand the browser back to the pool
+        if 'renewal_service' in locals():
+            log_browser_run(renewal_service)
+            renewal_service.release()
+
+def process_renewal_query_in_speculative_session(request: QueryPriceRequest, timings: StepTimings | None = None,
+                                                 deadline: Deadline | None = None):
+    """Finish the price query in the browser a warm-up left on this plate's search results;
+    None when there is no such browser or its flow broke, for the caller to start afresh"""
+    wait = deadline.clamp(speculative_attach_wait) if deadline is not None else speculative_attach_wait
+    session = speculative_sessions.claim(None, request, wait=wait)
+    if session is None:
+        return None
+    from selenium.common.exceptions import WebDriverException
+    from Services.PageStateService import PageFlowError
+    from Services.RenewalService import RenewalService
+
+    SPECULATIVE_SESSIONS.inc(outcome="attached")
+    logging.info(f"[Plate: {request.plateNumber}] Continuing a warmed-up browser session")
+    broken = False
+    try:
+        # no landing_url: a broken flow falls back to a fresh run instead of restarting this browser
+        renewal_service = RenewalService(request, driver=session.driver, timings=timings, deadline=deadline)
+        renewal_service.start_city_limits_lookup()
+        renewal_service.run_until("price_page")
+        renewal_service.record_county_profile()
+        fee_summary = renewal_service.collect_form_data()
+        if not fee_summary:
+            raise PageFlowError("Failed to retrieve fee summary")
+        return fee_summary
+    except ClerkAlertError as e:
+        raise clerk_alert_response(request, e)
+    except (PageFlowError, WebDriverException) as e:
+        broken = True
+        SPECULATIVE_SESSIONS.inc(outcome="broken")
+        logging.info(f"[Plate: {request.plateNumber}] Warmed-up session unusable, starting afresh: {e}")
+        return None
+    finally:
+        if 'renewal_service' in locals():
+            log_browser_run(renewal_service)
+        speculative_sessions.finish(session, discard=broken)
+
+def warm_speculative_session(request: WarmSessionRequest, token: str):
+    """Select the county and search the plate in a spare browser, then park it for the full
+    query; the reserved slot is given back whatever happens short of parking"""
+    from Services.RenewalService import RenewalService
+
+    renewal_service = None
+    outcome = "failed"
+    try:
+        # never wait for a browser: a warm-up only runs on capacity nobody is queueing for
+        if driver_pool.in_use + speculative_browser_headroom >= driver_pool.max_size:
+            outcome = "skipped"
+            return
+        driver = driver_pool.acquire(timeout=0)
+        renewal_service = RenewalService(request, driver=driver, deadline=Deadline(SPECULATIVE_SESSION_TTL))
+        renewal_service.open_landing_page(renewal_service_url)
+        # the street number and the rest of the form arrive with the full query
+        renewal_service.run_until("street_number_page", "form_page", "price_page")
+        if speculative_sessions.park(renewal_service.driver, request, token=token):
+            renewal_service.driver = None
+            outcome = "parked"
+    except ClerkAlertError as e:
+        outcome = "alert"
+        logging.info(f"[Plate: {request.plateNumber}] Warm-up stopped by a clerk alert: {e.alert_text}")
+    except (TimeoutError, BrowserCapacityError):
+        outcome = "skipped"
     except Exception as e:
-        raise e
+        logging.error(f"[Plate: {request.plateNumber}] Warm-up failed: {e}")
     finally:
-        # Clean up
-        if 'renewal_service' in locals() and hasattr(renewal_service, 'driver'):
-            renewal_service.driver.quit()
+        SPECULATIVE_SESSIONS.inc(outcome=outcome)
+        if outcome != "parked":
+            speculative_sessions.cancel(token)
+        if renewal_service is not None:
+            log_browser_run(renewal_service)
+            renewal_service.release()
+
+def log_browser_run(renewal_service):
+    prefix = renewal_service.get_log_prefix()
+    logging.info(f"{prefix} Step timings: {renewal_service.timings.report()}")
+    logging.info(f"{prefix} Page transitions: {renewal_service.page_flow.trace}")
+    if renewal_service.page_flow.retries:
+        logging.info(f"{prefix} Step retries: {renewal_service.page_flow.retries}")
 
-def process_renewal_completion(request: CompleteTransactionRequest):
+def process_renewal_completion(request: CompleteTransactionRequest, timings: StepTimings | None = None,
+                               deadline: Deadline | None = None):
     """Handle the renewal completion process in a separate thread"""
+    if request.sessionToken:
+        session = parked_sessions.claim(request.sessionToken, request)
+        if session is not None:
+            return complete_parked_session(request, session, timings, deadline)
+        logging.info(f"[Plate: {request.plateNumber}] Parked session unavailable, replaying the renewal flow")
+    return process_renewal_completion_in_browser(request, timings, deadline)
+
+def complete_parked_session(request: CompleteTransactionRequest, session: ParkedSession,
+                            timings: StepTimings | None = None, deadline: Deadline | None = None):
+    """Pay on the browser the price query left parked on the fee page"""
+    from Services.RenewalService import RenewalService
+
     try:
-        renewal_service = RenewalService(request)
-        renewal_service.driver.get(renewal_service_url)
-        
-        renewal_service.beginning_county_selection()
+        renewal_service = RenewalService(request, driver=session.driver, timings=timings, deadline=deadline)
+        payment_process = renewal_service.handle_payment_processing()
 
-        alert = renewal_service.fill_street_number_page()
-        if alert:
-            raise HTTPException(status_code=400, detail=f"{alert}")
-        
-        renewal_service.fill_form_page()
-        renewal_service.county_selection_element()
-        fee_summary = renewal_service.collect_form_data()
+        current_page = renewal_service.check_current_page()
+
+        if current_page != "successful_payment":
+            raise HTTPException(status_code=500, detail="Payment processing failed")
+        return payment_process
+    finally:
+        parked_sessions.finish(session)
+
+def process_renewal_completion_in_browser(request: CompleteTransactionRequest, timings: StepTimings | None = None,
+                                          deadline: Deadline | None = None):
+    """Replay the whole renewal flow in a fresh browser and pay"""
+    from Services.RenewalService import RenewalService
+
+    try:
+        renewal_service = RenewalService(request, timings=timings, deadline=deadline)
+        renewal_service.start_city_limits_lookup()
+        renewal_service.open_landing_page(renewal_service_url)
 
+        renewal_service.run_until("price_page")
+        renewal_service.record_county_profile()
         payment_process = renewal_service.handle_payment_processing()
 
         current_page = renewal_service.check_current_page()
@@ -80,42 +344,311 @@ def process_renewal_completion(request: CompleteTransactionRequest):
         if current_page != "successful_payment":
             raise HTTPException(status_code=500, detail="Payment processing failed")
         return payment_process
-    except Exception as e:
-        raise e
+    except ClerkAlertError as e:
+        raise clerk_alert_response(request, e)
     finally:
-        # Clean up
-        if 'renewal_service' in locals() and hasattr(renewal_service, 'driver'):
-            renewal_service.driver.quit()
+        # Hand the browser back to the pool
+        if 'renewal_service' in locals():
+            log_browser_run(renewal_service)
+            renewal_service.release()
+
+async def resolve_price_quote(request: QueryPriceRequest):
+    """Answer from the quote cache when possible, otherwise scrape on the thread pool;
+    identical queries already in flight share that run instead of starting another"""
+    await raise_cached_alert(request)
+    if request.parkSession:
+        # a parked browser belongs to one caller, so these are never shared
+        return await run_with_deadline(partial(run_in_thread, process_renewal_query), request)
+    cached = await asyncio.to_thread(quote_cache.get, request)
+    if cached:
+        logging.info(f"[Plate: {request.plateNumber}] Answered from quote cache")
+        return cached
+    if browser_engine == "devtools":
+        run = partial(run_with_deadline, process_renewal_query_async, request)
+    else:
+        run = partial(run_with_deadline, partial(run_in_thread, process_renewal_query), request)
+    return await quote_flights.run(quote_key(request), run)
 
 @app.post('/query/price/tennessee')
-async def query_price(request: QueryPriceRequest):
+async def query_price(request: QueryPriceRequest, http_request: Request):
     logging.info("Received request to query price")
     try:
-        result = await run_in_thread(process_renewal_query, request)
+        result = await until_disconnected(http_request, resolve_price_quote(request))
         logging.info(result);
+        REQUESTS.inc(endpoint="query_price", status=200)
         return result
+    except (DeadlineExceededError, RunCancelledError) as ex:
+        logging.error(f"[Plate: {request.plateNumber}] Price query abandoned: {ex}")
+        REQUESTS.inc(endpoint="query_price", status=ex.status_code)
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except BrowserCapacityError as ex:
+        logging.error(f"Shedding price query: {ex}")
+        REQUESTS.inc(endpoint="query_price", status=503)
+        raise HTTPException(status_code=503, detail=str(ex), headers={"Retry-After": str(ex.retry_after)})
     except HTTPException as ex:
         logging.error(f"HTTPException: {ex.detail}")
+        REQUESTS.inc(endpoint="query_price", status=ex.status_code)
         raise
     except Exception as ex:
         logging.error(f"Exception: {ex}")
+        REQUESTS.inc(endpoint="query_price", status=500)
         raise HTTPException(status_code=500, detail=str(ex))
 
 @app.post('/complete/tennessee')
-async def complete_transaction(request: CompleteTransactionRequest):
+async def complete_transaction(request: CompleteTransactionRequest, http_request: Request):
     logging.info("Received request to complete transaction")
     try:
-        result = await run_in_thread(process_renewal_completion, request)
+        await raise_cached_alert(request)
+        result = await until_disconnected(
+            http_request, run_with_deadline(partial(run_in_thread, process_renewal_completion), request),
+        )
         logging.info(result);
+        REQUESTS.inc(endpoint="complete_transaction", status=200)
         return result
+    except (DeadlineExceededError, RunCancelledError) as ex:
+        logging.error(f"[Plate: {request.plateNumber}] Completion abandoned: {ex}")
+        REQUESTS.inc(endpoint="complete_transaction", status=ex.status_code)
+        raise HTTPException(status_code=ex.status_code, detail=ex.detail)
+    except BrowserCapacityError as ex:
+        logging.error(f"Shedding completion: {ex}")
+        REQUESTS.inc(endpoint="complete_transaction", status=503)
+        raise HTTPException(status_code=503, detail=str(ex), headers={"Retry-After": str(ex.retry_after)})
     except HTTPException as ex:
         logging.error(f"HTTPException: {ex.detail}")
+        REQUESTS.inc(endpoint="complete_transaction", status=400)
         raise HTTPException(status_code=400, detail=ex.detail)
     except Exception as ex:
         logging.error(f"Exception: {ex}")
+        REQUESTS.inc(endpoint="complete_transaction", status=400)
         raise HTTPException(status_code=400, detail=str(ex))
 
+@app.post('/query/price/tennessee/warm', status_code=202)
+async def warm_price_query(request: WarmSessionRequest):
+    """Start the clerk flow for a plate while the customer is still typing the address: the
+    county selection and plate search run in the background, and the full price query for
+    the same plate and county picks up the browser where they left it"""
+    token = await asyncio.to_thread(speculative_sessions.reserve, request)
+    if token is None:
+        SPECULATIVE_SESSIONS.inc(outcome="skipped")
+        return {"warming": False}
+    SPECULATIVE_SESSIONS.inc(outcome="started")
+    asyncio.get_running_loop().run_in_executor(thread_pool, partial(occupying_thread, warm_speculative_session,
+                                                                    request, token))
+    return {"warming": True, "expiresIn": SPECULATIVE_SESSION_TTL}
+
+@app.post('/query/price/tennessee/batch')
+async def query_price_batch(requests: list[QueryPriceRequest]):
+    """Quote many plates at once, streaming one NDJSON line per plate as soon as it finishes"""
+    logging.info(f"Received batch request to query {len(requests)} prices")
+    if len(requests) > batch_max_size:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {batch_max_size} plates")
+
+    loop = asyncio.get_running_loop()
+    capacity = asyncio.Semaphore(thread_pool_workers)
+    county_slots = {}
+    for request in requests:
+        county_slots.setdefault(request.county.strip().lower(), asyncio.Semaphore(batch_county_concurrency))
+    # resolve every Hamilton address in one Census batch call while the first plates run
+    hamilton_addresses = [full_address(r) for r in requests if r.county.strip().lower() == "hamilton"]
+    geocoded = loop.run_in_executor(thread_pool, bulk_is_in_city_limits, hamilton_addresses) \
+        if hamilton_addresses else None
+
+    async def quote(index: int, request: QueryPriceRequest):
+        line = {"index": index, "plateNumber": request.plateNumber, "county": request.county}
+        async with county_slots[request.county.strip().lower()], capacity:
+            try:
+                if geocoded is not None and request.county.strip().lower() == "hamilton":
+                    await asyncio.wait([geocoded])
+                line.update(status=200, result=await resolve_price_quote(request))
+            except (HTTPException, BrowserCapacityError, DeadlineExceededError, RunCancelledError) as ex:
+                line.update(status=ex.status_code, error=ex.detail)
+            except Exception as ex:
+                logging.error(f"[Plate: {request.plateNumber}] Batch quote failed: {ex}")
+                line.update(status=500, error=str(ex))
+        return line
+
+    async def stream():
+        tasks = [asyncio.create_task(quote(index, request)) for index, request in enumerate(requests)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def validate_callback_url(callback_url: str | None):
+    """Reject a callback URL the job queue will not POST to, before any work is queued"""
+    try:
+        check_callback_url(callback_url)
+    except InvalidCallbackError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+
+async def submit_job(kind: str, func, request, callback_url: str | None):
+    try:
+        job = await asyncio.to_thread(job_queue.submit, kind, func, request, callback_url)
+    except QueueFullError as ex:
+        logging.error(f"Rejecting {kind} job: {ex}")
+        raise HTTPException(status_code=429, detail=str(ex), headers={"Retry-After": str(ex.retry_after)})
+    return JSONResponse(status_code=202, content={"jobId": job.id, "status": "queued"})
+
+@app.post('/jobs/query/price/tennessee')
+async def submit_query_price_job(request: QueryPriceRequest, callback_url: str | None = None):
+    """Queue a price query and return its job id immediately"""
+    validate_callback_url(callback_url)
+    await raise_cached_alert(request)
+    cached = None if request.parkSession else await asyncio.to_thread(quote_cache.get, request)
+    if cached:
+        job = await asyncio.to_thread(job_queue.record, "quote", cached, callback_url)
+        return JSONResponse(status_code=202, content={"jobId": job.id, "status": "succeeded"})
+    return await submit_job("quote", process_renewal_query, request, callback_url)
+
+def verify_fee_estimate(request: QueryPriceRequest, estimate: dict | None = None):
+    """Scrape the live quote behind an estimate, caching it, and flag the fields it got wrong"""
+    fee_summary = process_renewal_query(request)
+    if estimate is None:
+        return fee_summary
+    return {**fee_summary, "estimateDisagreement": fee_estimates.check(request, estimate, fee_summary)}
+
+@app.post('/query/price/tennessee/estimate')
+async def estimate_price(request: QueryPriceRequest, callback_url: str | None = None):
+    """Answer at once with a fee estimate from the fee table learned from past quotes, while
+    the live quote is scraped as a job; poll the job, or take its callback, for the real one"""
+    validate_callback_url(callback_url)
+    await raise_cached_alert(request)
+    request = request.model_copy(update={"parkSession": False})
+    cached = await asyncio.to_thread(quote_cache.get, request)
+    if cached:
+        job = await asyncio.to_thread(job_queue.record, "quote", cached, callback_url)
+        return JSONResponse(status_code=200, content={
+            "jobId": job.id, "status": "succeeded", "quote": {**cached, "estimate": False},
+        })
+    estimate = await asyncio.to_thread(fee_estimates.estimate, request)
+    try:
+        job = await asyncio.to_thread(job_queue.submit, "quote", partial(verify_fee_estimate, estimate=estimate),
+                                      request, callback_url)
+    except QueueFullError as ex:
+        if estimate is None:
+            logging.error(f"Rejecting estimate verification job: {ex}")
+            raise HTTPException(status_code=429, detail=str(ex), headers={"Retry-After": str(ex.retry_after)})
+        # the estimate still beats nothing; it just goes unverified this time
+        return JSONResponse(status_code=200, content={"jobId": None, "status": "unverified", "quote": estimate})
+    return JSONResponse(status_code=202, content={"jobId": job.id, "status": "queued", "quote": estimate})
+
+@app.get('/estimates/disagreements')
+async def list_fee_disagreements(county: str | None = None, limit: int = 100):
+    """Live quotes that differed from the estimate given for them, for checking the fee table"""
+    return await asyncio.to_thread(fee_estimates.disagreements, county, limit)
+
+@app.post('/jobs/complete/tennessee')
+async def submit_complete_transaction_job(request: CompleteTransactionRequest, callback_url: str | None = None):
+    """Queue a renewal completion; completions run ahead of queued quotes"""
+    validate_callback_url(callback_url)
+    await raise_cached_alert(request)
+    return await submit_job("completion", process_renewal_completion, request, callback_url)
+
+@app.get('/jobs/stats')
+async def job_stats():
+    return await asyncio.to_thread(job_queue.stats)
+
+@app.get('/jobs/{job_id}')
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_queue.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+@app.get('/health')
+async def health():
+    """Liveness: answers as soon as the app is imported, before any browser exists"""
+    return {"status": "ok"}
+
+@app.get('/ready')
+async def ready():
+    """Readiness: 200 once every worker has warmed its browsers, 503 until then"""
+    workers = await asyncio.to_thread(readiness.workers)
+    container_ready = await asyncio.to_thread(readiness.container_ready)
+    body = {"ready": container_ready, "workers": {str(pid): state for pid, state in workers.items()}}
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+def warm_up():
+    """Launch the pool's browsers with the landing page preloaded, then report this worker ready"""
+    try:
+        if http_fast_path_enabled and renewal_service_url:
+            warm_http_pool(renewal_service_url)
+            readiness.phase("http_pool")
+        driver_pool.warm_up()
+        readiness.phase("browsers")
+    except Exception as e:
+        # the HTTP fast path still works without browsers; report ready rather than block traffic
+        logging.error(f"Warm-up failed: {e}")
+        readiness.fail(e)
+    finally:
+        readiness.mark_ready()
+
+@app.get('/metrics')
+async def metrics():
+    """Prometheus scrape endpoint covering every worker in the container"""
+    return PlainTextResponse(await asyncio.to_thread(registry.render), media_type="text/plain; version=0.0.4")
+
+@app.get('/browsers/stats')
+async def browser_stats():
+    return {
+        "pool_size": driver_pool.size,
+        "in_use": driver_pool.in_use,
+        "engine": browser_engine,
+        "devtools": devtools_engine.stats(),
+        **await asyncio.to_thread(browser_admission.stats),
+    }
+
+@app.get('/profiles/counties')
+async def list_county_profiles():
+    """The flow each county's clerk site showed on its latest runs"""
+    return await asyncio.to_thread(county_profiles.entries)
+
+@app.delete('/profiles/counties')
+async def invalidate_county_profiles(county: str | None = None):
+    return {"invalidated": await asyncio.to_thread(county_profiles.invalidate, county)}
+
+@app.get('/cache/quotes/stats')
+async def quote_cache_stats():
+    return await asyncio.to_thread(quote_cache.stats)
+
+@app.delete('/cache/quotes')
+async def invalidate_quotes(plate: str | None = None, county: str | None = None):
+    return {"invalidated": await asyncio.to_thread(quote_cache.invalidate, plate, county)}
+
+@app.get('/cache/alerts/stats')
+async def alert_cache_stats():
+    return await asyncio.to_thread(alert_cache.stats)
+
+@app.get('/cache/alerts')
+async def list_alerts(plate: str | None = None, county: str | None = None, category: str | None = None,
+                      limit: int = 100):
+    """Cached clerk rejections, for support staff checking why a plate is turned away"""
+    return await asyncio.to_thread(alert_cache.entries, plate, county, category, limit)
+
+@app.delete('/cache/alerts')
+async def invalidate_alerts(plate: str | None = None, county: str | None = None, category: str | None = None):
+    return {"invalidated": await asyncio.to_thread(alert_cache.invalidate, plate, county, category)}
+
+@app.on_event("startup")
+async def startup_event():
+    """Pre-launch browsers so the first requests only pay for navigation"""
+    readiness.phase("imports")
+    asyncio.get_running_loop().run_in_executor(thread_pool, warm_up)
+    parked_sessions.start_sweeper()
+    speculative_sessions.start_sweeper()
+    await asyncio.to_thread(job_queue.start)
+    registry.start_flusher()
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Cleanup thread pool on application shutdown"""
-    thread_pool.shutdown(wait=True)
\ No newline at end of file
+    """Cleanup thread pool and browsers on application shutdown"""
+    await asyncio.to_thread(job_queue.close)
+    thread_pool.shutdown(wait=True)
+    parked_sessions.close()
+    speculative_sessions.close()
+    driver_pool.close()
+    await devtools_engine.close()
\ No newline at end of file
@@ -6,3 +6,4 @@ class CompleteTransactionRequest(QueryPriceRequest):
     exp_month: str
     exp_year: str
     cv: str
+    sessionToken: str | None = None
@@ -0,0 +1,63 @@
+from decimal import Decimal, InvalidOperation
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
+
+
+def parse_amount(text: str):
+    """'$1,234.50' -> Decimal('1234.50'); blank or unreadable amounts -> None"""
+    cleaned = (text or "").replace("$", "").replace(",", "").strip()
+    if not cleaned:
+        return None
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return None
+
+
+# Fee page summary, typed; aliases are the keys the API has always returned
+class FeeSummary(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    county: str = Field("", alias="County")
+    license: str = Field("", alias="License")
+    make: str = Field("", alias="Make")
+    year: str = Field("", alias="Year")
+    exp_date: str = Field("", alias="Exp Date")
+    registration: Decimal | None = Field(None, alias="Registration")
+    online_fee: Decimal | None = Field(None, alias="Online Fee")
+    organ_donor_amount: Decimal | None = Field(None, alias="Organ Donor Amount")
+    county_wheel_tax: Decimal | None = Field(None, alias="County Wheel Tax")
+    city_wheel_tax: Decimal | None = Field(None, alias="City Wheel Tax")
+    mail_fee: Decimal | None = Field(None, alias="Mail Fee")
+    subtotal: Decimal | None = Field(None, alias="Subtotal")
+    processing_fee: Decimal | None = Field(None, alias="Processing Fee")
+    total: Decimal | None = Field(None, alias="Total")
+
+    # the amounts as the fee page showed them, which is what the API returns
+    _page_text: dict = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def from_fee_page(cls, values: dict):
+        """Build from the raw text of each fee page field, keyed by API name"""
+        parsed, page_text = {}, {}
+        for name, field in cls.model_fields.items():
+            text = (values.get(field.alias) or "").strip()
+            if field.annotation == Decimal | None:
+                parsed[name] = parse_amount(text)
+                page_text[name] = text.replace("$", "").strip()
+            else:
+                parsed[name] = text
+        summary = cls(**parsed)
+        summary._page_text = page_text
+        return summary
+
+    def to_response(self):
+        """The flat string dictionary returned by the price and completion endpoints; amounts
+        keep the fee page's text (less the "$"), separators and unreadable values included"""
+        response = {}
+        for name, field in type(self).model_fields.items():
+            value = getattr(self, name)
+            if name in self._page_text:
+                response[field.alias] = self._page_text[name]
+            else:
+                response[field.alias] = "" if value is None else str(value)
+        return response
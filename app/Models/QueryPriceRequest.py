@@ -15,3 +15,4 @@ class QueryPriceRequest(BaseModel):
     homePhone2: str
     email: str
     confirmEmail: str
+    parkSession: bool = False
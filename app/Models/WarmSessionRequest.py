@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+# Request Body Model for the speculative warm-up: what the customer has typed so far
+class WarmSessionRequest(BaseModel):
+    plateNumber: str
+    county: str
@@ -1,37 +1,286 @@
+import csv
+import io
 import json
 import logging
+import os
+import secrets
+import sqlite3
+import time
 import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from Services.MetricsService import CENSUS_DURATION, GEOCODE_CACHE_LOOKUPS
 
-CENSUS_GEOCODER_URL = "https://geocoding.geo.census.gov/geocoder/geographies/onelineaddress"
+CENSUS_GEOCODER_BASE_URL = os.getenv("CENSUS_GEOCODER_BASE_URL", "https://geocoding.geo.census.gov/geocoder")
+CENSUS_GEOCODER_URL = f"{CENSUS_GEOCODER_BASE_URL}/geographies/onelineaddress"
+CENSUS_BATCH_GEOCODER_URL = f"{CENSUS_GEOCODER_BASE_URL}/geographies/addressbatch"
+CENSUS_COORDINATES_URL = f"{CENSUS_GEOCODER_BASE_URL}/geographies/coordinates"
+CENSUS_BENCHMARK = "Public_AR_Current"
+CENSUS_VINTAGE = "Census2020_Current"
 
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "/tmp/geocode_cache.sqlite3")
+# a match (inside or outside city limits) is stable; a no-match may be fixed by a later Census release
+GEOCODE_POSITIVE_TTL = float(os.getenv("GEOCODE_POSITIVE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", "4"))
+# bulk /batch lookups get their own threads so a large batch cannot starve the renewals' prefetches
+GEOCODE_BATCH_WORKERS = int(os.getenv("GEOCODE_BATCH_WORKERS", "4"))
+# how long a renewal at the fee page waits for its city-limits answer before going on without one
+CITY_LIMITS_WAIT = float(os.getenv("CITY_LIMITS_WAIT", "10"))
+CENSUS_TIMEOUT = 5.0
 
-def is_in_city_limits(address: str, timeout: float = 5.0):
-    """Return True/False if Census matches the address to an incorporated place,
-    or None when the lookup is inconclusive (network failure / no match)."""
+STREET_SUFFIXES = {
+    "STREET": "ST", "AVENUE": "AVE", "ROAD": "RD", "DRIVE": "DR", "LANE": "LN", "COURT": "CT",
+    "BOULEVARD": "BLVD", "PLACE": "PL", "CIRCLE": "CIR", "PARKWAY": "PKWY", "HIGHWAY": "HWY",
+    "TERRACE": "TER", "TRAIL": "TRL", "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+    "APARTMENT": "APT", "SUITE": "STE",
+}
+
+_MISS = object()
+geocode_executor = ThreadPoolExecutor(max_workers=GEOCODE_WORKERS, thread_name_prefix="geocode")
+geocode_batch_executor = ThreadPoolExecutor(max_workers=GEOCODE_BATCH_WORKERS, thread_name_prefix="geocode-batch")
+
+
+def normalize_address(address: str):
+    """Canonical form of an address for use as a cache key: upper case, no
+    punctuation, single spaces and USPS-style suffix abbreviations."""
+    cleaned = "".join(ch if ch.isalnum() else " " for ch in (address or "").upper())
+    return " ".join(STREET_SUFFIXES.get(word, word) for word in cleaned.split())
+
+
+def full_address(form_data):
+    return f"{form_data.addressTwo}, {form_data.city}, {form_data.state} {form_data.zip}"
+
+
+class GeocodeCache:
+    """City-limits answers persisted in SQLite so they survive restarts and are shared by workers"""
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, positive_ttl=GEOCODE_POSITIVE_TTL,
+                 negative_ttl=GEOCODE_NEGATIVE_TTL):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocodes ("
+                " key TEXT PRIMARY KEY, in_limits INTEGER, expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, address: str):
+        """The cached answer (True/False/None), or _MISS when the address is not cached"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT in_limits FROM geocodes WHERE key = ? AND expires_at > ?",
+                    (normalize_address(address), time.time()),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Geocode cache lookup failed: {e}")
+            return _MISS
+        GEOCODE_CACHE_LOOKUPS.inc(result="miss" if row is None else "hit")
+        if row is None:
+            return _MISS
+        return None if row[0] is None else bool(row[0])
+
+    def put(self, address: str, in_limits):
+        ttl = self.negative_ttl if in_limits is None else self.positive_ttl
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocodes (key, in_limits, expires_at) VALUES (?, ?, ?)",
+                    (normalize_address(address), None if in_limits is None else int(in_limits), time.time() + ttl),
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Geocode cache store failed: {e}")
+
+
+geocode_cache = GeocodeCache()
+
+
+def _census_request(endpoint, request, timeout):
+    """urlopen + read, recorded in the Census latency histogram"""
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            body = resp.read()
+        outcome = "ok"
+        return body
+    finally:
+        CENSUS_DURATION.observe(time.monotonic() - started, endpoint=endpoint, outcome=outcome)
+
+
+def _fetch_json(endpoint, url, timeout):
+    return json.loads(_census_request(endpoint, url, timeout))
+
+
+def _incorporated_place(geographies):
+    places = geographies.get("Incorporated Places", []) or []
+    return bool(places), places[0].get("NAME") if places else None
+
+
+def lookup_city_limits(address: str, timeout: float = CENSUS_TIMEOUT):
+    """Ask Census directly. Returns (answer, cacheable): network failures are not cacheable."""
     params = {
         "address": address,
-        "benchmark": "Public_AR_Current",
-        "vintage": "Census2020_Current",
+        "benchmark": CENSUS_BENCHMARK,
+        "vintage": CENSUS_VINTAGE,
         "layers": "Incorporated_Places",
         "format": "json",
     }
     url = f"{CENSUS_GEOCODER_URL}?{urllib.parse.urlencode(params)}"
     try:
-        with urllib.request.urlopen(url, timeout=timeout) as resp:
-            data = json.load(resp)
+        data = _fetch_json("onelineaddress", url, timeout)
     except Exception as e:
         logging.error(f"Census geocoder lookup failed for {address!r}: {e}")
-        return None
+        return None, False
 
     matches = data.get("result", {}).get("addressMatches") or []
     if not matches:
         logging.info(f"Census geocoder returned no matches for {address!r}")
-        return None
-    places = matches[0].get("geographies", {}).get("Incorporated Places", []) or []
-    in_limits = bool(places)
-    place_name = places[0].get("NAME") if in_limits else None
+        return None, True
+    in_limits, place_name = _incorporated_place(matches[0].get("geographies", {}))
     logging.info(
         f"Census geocoder: {address!r} in_city_limits={in_limits} place={place_name!r}"
     )
+    return in_limits, True
+
+
+def is_in_city_limits(address: str, timeout: float = CENSUS_TIMEOUT):
+    """Return True/False if Census matches the address to an incorporated place,
+    or None when the lookup is inconclusive (network failure / no match)."""
+    cached = geocode_cache.get(address)
+    if cached is not _MISS:
+        logging.info(f"Geocode cache hit for {address!r}: in_city_limits={cached}")
+        return cached
+    in_limits, cacheable = lookup_city_limits(address, timeout)
+    if cacheable:
+        geocode_cache.put(address, in_limits)
     return in_limits
+
+
+def prefetch_city_limits(address: str, timeout: float = CENSUS_TIMEOUT):
+    """Start the city-limits lookup in the background; the Future resolves to is_in_city_limits"""
+    return geocode_executor.submit(is_in_city_limits, address, timeout)
+
+
+def _split_address(address: str):
+    """'street, city, ST zip' -> (street, city, state, zip) for the Census batch CSV"""
+    parts = [part.strip() for part in address.split(",")]
+    if len(parts) < 3:
+        return address, "", "", ""
+    state, _, zip_code = parts[-1].partition(" ")
+    return ", ".join(parts[:-2]), parts[-2], state, zip_code.strip()
+
+
+def _multipart(fields, files):
+    boundary = secrets.token_hex(16)
+    lines = []
+    for name, value in fields.items():
+        lines += [f"--{boundary}", f'Content-Disposition: form-data; name="{name}"', "", value]
+    for name, (filename, content) in files.items():
+        lines += [
+            f"--{boundary}",
+            f'Content-Disposition: form-data; name="{name}"; filename="{filename}"',
+            "Content-Type: text/csv",
+            "",
+            content,
+        ]
+    lines += [f"--{boundary}--", ""]
+    return "\r\n".join(lines).encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def _place_for_coordinates(coordinates: str, timeout: float):
+    """Census geographies for a 'lon,lat' pair from the batch output"""
+    lon, _, lat = coordinates.partition(",")
+    params = {
+        "x": lon,
+        "y": lat,
+        "benchmark": CENSUS_BENCHMARK,
+        "vintage": CENSUS_VINTAGE,
+        "layers": "Incorporated_Places",
+        "format": "json",
+    }
+    data = _fetch_json("coordinates", f"{CENSUS_COORDINATES_URL}?{urllib.parse.urlencode(params)}", timeout)
+    return _incorporated_place(data.get("result", {}).get("geographies", {}))[0]
+
+
+def _batch_lookup(addresses, timeout: float):
+    """Geocode many addresses with one Census batch upload.
+
+    The batch geographies output only carries state/county/tract/block codes, so matched
+    coordinates are resolved to an incorporated place with concurrent coordinate lookups.
+    """
+    rows = io.StringIO()
+    writer = csv.writer(rows)
+    for index, address in enumerate(addresses):
+        writer.writerow([index, *_split_address(address)])
+    body, content_type = _multipart(
+        {"benchmark": CENSUS_BENCHMARK, "vintage": CENSUS_VINTAGE},
+        {"addressFile": ("addresses.csv", rows.getvalue())},
+    )
+    request = urllib.request.Request(
+        CENSUS_BATCH_GEOCODER_URL, data=body, headers={"Content-Type": content_type}, method="POST"
+    )
+    output = _census_request("addressbatch", request, timeout).decode("utf-8", errors="replace")
+
+    results, coordinates = {}, {}
+    for row in csv.reader(io.StringIO(output)):
+        if len(row) < 3 or not row[0].strip().isdigit():
+            continue
+        address = addresses[int(row[0])]
+        if row[2].strip().lower() == "match" and len(row) > 5:
+            coordinates[address] = row[5]
+        else:
+            results[address] = (None, True)
+
+    futures = {
+        address: geocode_batch_executor.submit(_place_for_coordinates, coords, timeout)
+        for address, coords in coordinates.items()
+    }
+    for address, future in futures.items():
+        try:
+            results[address] = (future.result(), True)
+        except Exception as e:
+            logging.error(f"Census coordinate lookup failed for {address!r}: {e}")
+            results[address] = (None, False)
+    return results
+
+
+def bulk_is_in_city_limits(addresses, timeout: float = 30.0):
+    """Resolve many addresses at once: cached answers first, then one Census batch call.
+    Returns {address: True/False/None}."""
+    answers, misses = {}, []
+    for address in dict.fromkeys(addresses):
+        cached = geocode_cache.get(address)
+        if cached is _MISS:
+            misses.append(address)
+        else:
+            answers[address] = cached
+    if not misses:
+        return answers
+
+    try:
+        looked_up = _batch_lookup(misses, timeout)
+    except Exception as e:
+        logging.error(f"Census batch geocode failed for {len(misses)} addresses, looking up one by one: {e}")
+        futures = {address: geocode_batch_executor.submit(lookup_city_limits, address) for address in misses}
+        looked_up = {address: future.result() for address, future in futures.items()}
+
+    for address in misses:
+        in_limits, cacheable = looked_up.get(address, (None, False))
+        if cacheable:
+            geocode_cache.put(address, in_limits)
+        answers[address] = in_limits
+    logging.info(f"Bulk geocode resolved {len(misses)} of {len(answers)} addresses remotely")
+    return answers
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from Models.QueryPriceRequest import QueryPriceRequest
+from Services.MetricsService import ALERT_CACHE_LOOKUPS, registry
+
+ALERT_CACHE_PATH = os.getenv("ALERT_CACHE_PATH", "/tmp/alert_cache.sqlite3")
+# short: a customer fixing the plate at the clerk's office should not be turned away for long
+ALERT_CACHE_TTL = float(os.getenv("ALERT_CACHE_TTL", "300"))
+ALERT_CACHE_MAX_ENTRIES = int(os.getenv("ALERT_CACHE_MAX_ENTRIES", "10000"))
+
+# First match wins. site_error alerts are about the clerk site, not the plate, and are never cached.
+ALERT_CATEGORIES = (
+    ("site_error", re.compile(r"temporar|try again|unavailable|system error|error occurred", re.I)),
+    ("not_eligible", re.compile(r"not eligible|ineligible|cannot be renewed online|in person|\bhold\b|suspend", re.I)),
+    ("not_found", re.compile(r"no record|not found|unable to (find|locate)|invalid plate", re.I)),
+    ("street_number_mismatch", re.compile(r"street number|address (does not|doesn't) match", re.I)),
+)
+UNCACHED_CATEGORIES = {"site_error"}
+
+
+def alert_category(alert_text):
+    for category, pattern in ALERT_CATEGORIES:
+        if pattern.search(alert_text or ""):
+            return category
+    return "other"
+
+
+def street_number(request: QueryPriceRequest):
+    return (request.addressTwo or "").strip().split(" ")[0].upper()
+
+
+def alert_key(request: QueryPriceRequest):
+    """Plate + county + street number: the fields the clerk's plate search looks at"""
+    raw = f"{request.plateNumber.strip().upper()}|{request.county.strip().lower()}|{street_number(request)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class AlertCache:
+    """Clerk rejections (plate not found, not eligible, wrong street number) shared by every
+    uvicorn worker, so a retry of the same bad plate is answered without a browser"""
+
+    def __init__(self, path=ALERT_CACHE_PATH, ttl=ALERT_CACHE_TTL, max_entries=ALERT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                " key TEXT PRIMARY KEY, plate TEXT NOT NULL, county TEXT NOT NULL, street_number TEXT NOT NULL,"
+                " category TEXT NOT NULL, alert_text TEXT NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS alerts_expires_at ON alerts (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS alerts_plate ON alerts (plate, county)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, request: QueryPriceRequest):
+        """The cached rejection for this plate search as {"alertText", "category"}, or None.
+        A read only: hits are counted in the worker's metrics, not in SQLite."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT alert_text, category FROM alerts WHERE key = ? AND expires_at > ?",
+                    (alert_key(request), time.time()),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Alert cache lookup failed: {e}")
+            return None
+        ALERT_CACHE_LOOKUPS.inc(result="hit" if row else "miss", category=row[1] if row else "")
+        return {"alertText": row[0], "category": row[1]} if row else None
+
+    def put(self, request: QueryPriceRequest, alert_text):
+        """Remember the clerk's alert for this plate search; returns its category"""
+        category = alert_category(alert_text)
+        if not alert_text or category in UNCACHED_CATEGORIES:
+            return category
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO alerts"
+                    " (key, plate, county, street_number, category, alert_text, created_at, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (alert_key(request), request.plateNumber.strip().upper(), request.county.strip().lower(),
+                     street_number(request), category, alert_text, now, now + self.ttl),
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logging.error(f"Alert cache store failed: {e}")
+        return category
+
+    def _evict(self, conn, now):
+        expired = conn.execute("DELETE FROM alerts WHERE expires_at <= ?", (now,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM alerts WHERE key IN ("
+            " SELECT key FROM alerts ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        return expired + overflow
+
+    def _filter(self, plate=None, county=None, category=None):
+        clauses, params = [], []
+        if plate:
+            clauses.append("plate = ?")
+            params.append(plate.strip().upper())
+        if county:
+            clauses.append("county = ?")
+            params.append(county.strip().lower())
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def entries(self, plate=None, county=None, category=None, limit=100):
+        """Live cached alerts, newest first, for support staff to inspect"""
+        where, params = self._filter(plate, county, category)
+        where += (" AND" if where else " WHERE") + " expires_at > ?"
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT plate, county, street_number, category, alert_text, created_at, expires_at"
+                f" FROM alerts{where} ORDER BY created_at DESC LIMIT ?",
+                (*params, time.time(), limit),
+            ).fetchall()
+        columns = ("plate", "county", "streetNumber", "category", "alertText", "createdAt", "expiresAt")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def invalidate(self, plate=None, county=None, category=None):
+        """Drop cached alerts matching every given filter, or everything when none is given"""
+        where, params = self._filter(plate, county, category)
+        with self._connect() as conn:
+            return conn.execute(f"DELETE FROM alerts{where}", params).rowcount
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT category, COUNT(*) FROM alerts WHERE expires_at > ? GROUP BY category",
+                (time.time(),),
+            ).fetchall()
+        # hits since the workers started, from every worker's alert_cache_lookups_total
+        hits = {category: count for (result, category), count in registry.totals(ALERT_CACHE_LOOKUPS.name).items()
+                if result == "hit"}
+        by_category = {category: {"entries": count, "hits": hits.get(category, 0)} for category, count in rows}
+        for category, count in hits.items():
+            by_category.setdefault(category, {"entries": 0, "hits": count})
+        return {
+            "entries": sum(count for _, count in rows),
+            "hits": sum(hits.values()),
+            "by_category": by_category,
+        }
+
+
+alert_cache = AlertCache()
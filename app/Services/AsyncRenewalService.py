@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import time
+from Models.QueryPriceRequest import QueryPriceRequest
+from Models.FeeSummary import FeeSummary
+from Services.AddressService import (
+    CENSUS_TIMEOUT, CITY_LIMITS_WAIT, full_address, is_in_city_limits, prefetch_city_limits,
+)
+from Services.DevToolsService import (
+    DEVTOOLS_COMMAND_TIMEOUT, DevToolsError, DevToolsTimeoutError, JavascriptError, NoSuchElementError,
+    devtools_engine,
+)
+from Services.DriverPoolService import DRIVER_POOL_ACQUIRE_TIMEOUT
+from Services.DeadlineService import Deadline, DeadlineExceededError, RunCancelledError, no_deadline
+from Services.StepTimingService import StepTimings
+from Services.FeePageService import FEE_PAGE_SCRIPT, FEE_SUMMARY_SELECTORS
+from Services.MetricsService import (
+    FORM_RETRIES, FORM_VALIDATION_ERRORS, SESSION_RESTARTS, STAGE_DURATION, WAIT_DURATION, county_label,
+    timed_stage,
+)
+from Services.PageStateService import PAGE_FLOW_RESTARTS, PAGE_IDLE_SCRIPT, AsyncPageStateMachine, PageFlowError
+from Services.ClerkErrors import FORM_PAGE_FIELDS, ClerkAlertError
+from Services.CountyProfileService import SELECT_VALUE_SCRIPT, county_profiles
+
+WAIT_POLL_INTERVAL = 0.1
+
+# Picks the first option whose text contains the wanted text (case-insensitively when asked)
+# and fires change, as Select.select_by_visible_text does; the county list submits on change.
+# Returns [text, value] of the option picked.
+SELECT_OPTION_SCRIPT = """
+var select = document.querySelector(arguments[0]), wanted = arguments[1], ignoreCase = arguments[2];
+if (!select) return null;
+for (var i = 0; i < select.options.length; i++) {
+    var text = select.options[i].text;
+    if ((ignoreCase ? text.toUpperCase().indexOf(wanted.toUpperCase()) : text.indexOf(wanted)) !== -1) {
+        select.selectedIndex = i;
+        select.dispatchEvent(new Event('change', {bubbles: true}));
+        return [text, select.options[i].value];
+    }
+}
+return null;
+"""
+
+# Ticks the Shelby address checkbox when the form has one; returns whether it has
+SHELBY_VERIFY_SCRIPT = """
+var el = document.querySelector('#shelby_address_verify');
+if (el && !el.checked) el.click();
+return !!el;
+"""
+
+# Focuses the index-th match and clears it so Input.insertText types into an empty field;
+# selects take the first option starting with the value, as typing into them would
+FOCUS_FIELD_SCRIPT = """
+var el = document.querySelectorAll(arguments[0])[arguments[1]], value = arguments[2];
+if (!el) return null;
+if (el.tagName === 'SELECT') {
+    for (var i = 0; i < el.options.length; i++) {
+        if (el.options[i].text.toUpperCase().indexOf(value.toUpperCase()) === 0
+            || el.options[i].value.toUpperCase() === value.toUpperCase()) {
+            el.selectedIndex = i;
+            el.dispatchEvent(new Event('change', {bubbles: true}));
+            break;
+        }
+    }
+    return 'select';
+}
+el.focus();
+if (el.tagName === 'INPUT' || el.tagName === 'TEXTAREA') el.value = '';
+return 'text';
+"""
+
+BLUR_FIELD_SCRIPT = """
+var el = document.querySelectorAll(arguments[0])[arguments[1]];
+if (el) { el.dispatchEvent(new Event('change', {bubbles: true})); el.blur(); }
+"""
+
+COUNT_SCRIPT = "return document.querySelectorAll(arguments[0]).length;"
+CLICK_SCRIPT = "var el = document.querySelector(arguments[0]); if (!el) return false; el.click(); return true;"
+SUBMIT_SCRIPT = "var el = document.querySelector(arguments[0]); if (!el) return false; el.submit(); return true;"
+TEXT_SCRIPT = "var el = document.querySelector(arguments[0]); return el ? (el.innerText || '').trim() : null;"
+
+SET_CITY_QTY_SCRIPT = """
+var el = document.getElementById('MVCityQty');
+if (!el) return false;
+el.value = '1';
+el.dispatchEvent(new Event('change', {bubbles: true}));
+el.dispatchEvent(new Event('input', {bubbles: true}));
+return true;
+"""
+
+
+class AsyncRenewalService:
+    """RenewalService ported to a DevToolsTab: the same page handlers, awaited on the event
+    loop instead of blocking a thread. Covers the price query; payment stays on Selenium."""
+    # a script hitting a page mid-render, an element not rendered yet, or a slow command, is
+    # retried on the same page
+    TRANSIENT_ERRORS = (JavascriptError, NoSuchElementError, DevToolsTimeoutError)
+
+    def __init__(self, form_data: QueryPriceRequest, tab=None, timings: StepTimings | None = None,
+                 deadline: Deadline | None = None):
+        plate_info = f" [Plate: {form_data.plateNumber}]" if hasattr(form_data, 'plateNumber') else ""
+        logging.info(f"Initializing AsyncRenewalService{plate_info}")
+        self.tab = tab
+        self.deadline = deadline if deadline is not None else no_deadline()
+        self.form_data = form_data
+        self.timings = timings if timings is not None else StepTimings()
+        self.city_limits_lookup = None
+        self.landing_url = None
+        self.page_flow = AsyncPageStateMachine(self)
+        # loaded by load_county_profile, off the event loop
+        self.county_profile = {}
+        self.profile_observations = {}
+
+    async def load_county_profile(self):
+        self.county_profile = await asyncio.to_thread(county_profiles.get, self.form_data.county) or {}
+
+    async def acquire_tab(self):
+        if self.tab is None:
+            self.deadline.check()
+            with STAGE_DURATION.time(stage="driver_start", county=self.county_label(self.form_data)):
+                self.tab = await devtools_engine.acquire(timeout=self.deadline.clamp(DRIVER_POOL_ACQUIRE_TIMEOUT))
+
+    async def release(self):
+        """Close the tab's browser context once the request is finished with it"""
+        if self.tab is None:
+            return
+        tab, self.tab = self.tab, None
+        tab.usage.record_metrics()
+        logging.info(f"{self.get_log_prefix()} Browser network usage: {tab.usage.report()}")
+        await devtools_engine.release(tab)
+
+    @staticmethod
+    def county_label(form_data):
+        return county_label(form_data.county)
+
+    @timed_stage("driver_get")
+    async def open_landing_page(self, url):
+        self.landing_url = url
+        await self.tab.get(url, timeout=self.deadline.clamp(DEVTOOLS_COMMAND_TIMEOUT))
+
+    def get_log_prefix(self):
+        return f"[Plate: {self.form_data.plateNumber}]" if hasattr(self.form_data, 'plateNumber') else ""
+
+    async def wait_for_condition(self, step, condition, timeout=10):
+        """Poll an async condition until it returns something truthy; None on timeout"""
+        started = time.monotonic()
+        timeout = self.deadline.clamp(timeout)
+        result, outcome = None, "timeout"
+        with self.timings.measure(step):
+            while True:
+                self.deadline.check()
+                result = await condition()
+                if result:
+                    outcome = "met"
+                    break
+                if time.monotonic() - started >= timeout:
+                    logging.info(f"{self.get_log_prefix()} Timed out waiting for {step}")
+                    result = None
+                    break
+                await asyncio.sleep(WAIT_POLL_INTERVAL)
+        WAIT_DURATION.observe(time.monotonic() - started, step=step, outcome=outcome)
+        return result
+
+    async def wait_for_page_idle(self, step, timeout=10):
+        return await self.wait_for_condition(step, lambda: self.tab.execute_script(PAGE_IDLE_SCRIPT), timeout)
+
+    async def run_until(self, *targets):
+        """Drive the clerk site until one of the target page states, starting over in a new
+        browser context when the page state is unrecoverable"""
+        restarts = 0
+        while True:
+            try:
+                return await self.page_flow.run(targets)
+            except (PageFlowError, DevToolsError) as e:
+                if restarts >= PAGE_FLOW_RESTARTS or self.landing_url is None:
+                    raise
+                self.deadline.check()
+                restarts += 1
+                logging.info(f"{self.get_log_prefix()} Restarting the browser session: {e}")
+                await self.restart_session()
+
+    async def restart_session(self):
+        SESSION_RESTARTS.inc(county=self.county_label(self.form_data))
+        await self.release()
+        await self.acquire_tab()
+        self.page_flow.restart()
+        await self.open_landing_page(self.landing_url)
+
+    def first_visit(self, state):
+        return self.page_flow.visits.get(state, 0) <= 1
+
+    async def select_county(self, state, css_selector, field, ignore_case):
+        """Select the county by its profiled value, else by text; the option text, or None"""
+        value = self.county_profile.get(field)
+        if value and self.first_visit(state):
+            selected = await self.tab.execute_script(SELECT_VALUE_SCRIPT, css_selector, value)
+            if selected is not None:
+                self.profile_observations[field] = value
+                return selected
+            logging.info(f"{self.get_log_prefix()} Profiled {field} {value!r} is gone, matching by text")
+        selected = await self.tab.execute_script(SELECT_OPTION_SCRIPT, css_selector, self.form_data.county, ignore_case)
+        if selected is None:
+            return None
+        text, self.profile_observations[field] = selected
+        return text
+
+    async def record_county_profile(self):
+        await asyncio.to_thread(county_profiles.learn, self.form_data.county, self.profile_observations)
+
+    async def check_current_page(self):
+        return await self.page_flow.detect()
+
+    async def handle_county_list(self):
+        selected = await self.select_county("county_list", "select[name='countylist']", "countylist_value", True)
+        if selected is None:
+            raise PageFlowError(f"County {self.form_data.county!r} not in countylist")
+        logging.info(f"{self.get_log_prefix()} Selected county: {selected}")
+
+    async def handle_services_page(self):
+        await self.run_on_element(SUBMIT_SCRIPT, "form[name^='myform']")
+        logging.info(f"{self.get_log_prefix()} Opened Plate Renewals")
+
+    async def handle_plate_search_page(self):
+        await self.fill_field("input[name='plateNumber']", self.form_data.plateNumber)
+        await self.tab.execute_script("document.expressRenew.submit();")
+
+    async def handle_street_number_page(self):
+        await self.fill_field("#streetnum", self.form_data.addressTwo.split(" ")[0])
+        await self.fill_field("input[name='platenum']", self.form_data.plateNumber)
+        await self.run_on_element(SUBMIT_SCRIPT, "#renewalSearchForm")
+
+    async def handle_clerk_alert(self):
+        alert_text = self.page_flow.alert_text
+        logging.info(f"{self.get_log_prefix()} Clerk site alert: {alert_text}")
+        raise ClerkAlertError(alert_text)
+
+    async def handle_form_page(self):
+        logging.info(f"{self.get_log_prefix()} Filling out the form page")
+        if self.county_profile.get("shelby_address_verify") is not False or not self.first_visit("form_page"):
+            self.profile_observations["shelby_address_verify"] = await self.tab.execute_script(SHELBY_VERIFY_SCRIPT)
+        for field in FORM_PAGE_FIELDS:
+            await self.fill_field(f"#{field}", getattr(self.form_data, field))
+            if field == "zip":
+                await self.wait_for_page_idle("zip_lookup")
+        await self.fill_field("#confirmemail", self.form_data.email)
+        await self.run_on_element(CLICK_SCRIPT, "#payrenewal_None")
+
+    async def run_on_element(self, script, css_selector):
+        """Click or submit the element, as Selenium's find_element(...).click() would; raises
+        NoSuchElementError when it is not on the page, so the step is retried"""
+        if not await self.tab.execute_script(script, css_selector):
+            raise NoSuchElementError(f"No element matches {css_selector}")
+
+    async def fill_field(self, css_selector, value):
+        """Clear and type value into every element matching css_selector"""
+        for index in range(await self.tab.execute_script(COUNT_SCRIPT, css_selector) or 0):
+            kind = await self.tab.execute_script(FOCUS_FIELD_SCRIPT, css_selector, index, value)
+            if kind == "text":
+                await self.tab.insert_text(value)
+                await self.tab.execute_script(BLUR_FIELD_SCRIPT, css_selector, index)
+
+    async def handle_validation_dialog(self):
+        logging.info(f"{self.get_log_prefix()} Validation error found, retrying form submission")
+        FORM_VALIDATION_ERRORS.inc(county=self.county_label(self.form_data))
+        FORM_RETRIES.inc(county=self.county_label(self.form_data))
+        await self.run_on_element(CLICK_SCRIPT, "button.swal2-confirm.swal2-styled")
+
+    async def handle_county_page(self):
+        await self.select_county("county_page", "#newCountyID", "county_page_value", False)
+        await self.run_on_element(CLICK_SCRIPT, "#zipCodeSubmit")
+        logging.info(f"{self.get_log_prefix()} County selected successfully")
+
+    @timed_stage("collect_form_data")
+    async def collect_form_data(self):
+        logging.info(f"{self.get_log_prefix()} Collecting form data")
+        try:
+            found = await self.wait_for_condition(
+                "fee_page", lambda: self.tab.execute_script(COUNT_SCRIPT, "#Total\\ Display"), timeout=15,
+            )
+            if not found:
+                raise PageFlowError("Fee page has no total")
+            await self.apply_hamilton_city_qty()
+            values = await self.tab.execute_script(FEE_PAGE_SCRIPT, FEE_SUMMARY_SELECTORS)
+            return FeeSummary.from_fee_page(values).to_response()
+        except (DeadlineExceededError, RunCancelledError):
+            raise
+        except Exception as e:
+            logging.error(f"{self.get_log_prefix()} collect_form_data failed: {e}")
+            return None
+
+    def is_hamilton(self):
+        return (self.form_data.county or "").strip().lower() == "hamilton"
+
+    def start_city_limits_lookup(self):
+        if self.is_hamilton() and self.city_limits_lookup is None:
+            self.city_limits_lookup = prefetch_city_limits(full_address(self.form_data))
+
+    async def city_limits(self):
+        """RenewalService.city_limits, awaited"""
+        self.deadline.check()
+        if self.city_limits_lookup is None:
+            return await asyncio.to_thread(
+                is_in_city_limits, full_address(self.form_data), self.deadline.clamp(CENSUS_TIMEOUT),
+            )
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(self.city_limits_lookup), self.deadline.clamp(CITY_LIMITS_WAIT),
+            )
+        except asyncio.TimeoutError:
+            self.deadline.check()
+            logging.error(f"{self.get_log_prefix()} City limits lookup did not finish in {CITY_LIMITS_WAIT:g}s")
+            return None
+
+    async def apply_hamilton_city_qty(self):
+        if not self.is_hamilton():
+            return
+        with STAGE_DURATION.time(stage="census_lookup", county="hamilton"):
+            in_limits = await self.city_limits()
+        if not in_limits:
+            logging.info(
+                f"{self.get_log_prefix()} Hamilton county, in_limits={in_limits} — leaving MVCityQty alone"
+            )
+            return
+        try:
+            total_before = await self.tab.execute_script(TEXT_SCRIPT, "#Total\\ Display")
+            if not await self.tab.execute_script(SET_CITY_QTY_SCRIPT):
+                raise PageFlowError("MVCityQty not on the fee page")
+
+            async def recomputed():
+                return await self.tab.execute_script(TEXT_SCRIPT, "#Total\\ Display") != total_before
+
+            await self.wait_for_condition("hamilton_total_recompute", recomputed, timeout=3)
+            logging.info(f"{self.get_log_prefix()} Set MVCityQty=1 (Hamilton, in city limits)")
+        except Exception as e:
+            logging.error(f"{self.get_log_prefix()} Failed to set MVCityQty: {e}")
@@ -0,0 +1,248 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from Services.MetricsService import BROWSER_RECYCLES
+
+BROWSER_ADMISSION_PATH = os.getenv("BROWSER_ADMISSION_PATH", "/tmp/browser_admission.sqlite3")
+# share of the container's memory Chrome may use; the rest is for the uvicorn workers and the OS
+BROWSER_MEMORY_FRACTION = float(os.getenv("BROWSER_MEMORY_FRACTION", "0.7"))
+BROWSER_MEMORY_BUDGET_MB = int(os.getenv("BROWSER_MEMORY_BUDGET_MB", "0"))
+BROWSER_MIN_AVAILABLE_MB = int(os.getenv("BROWSER_MIN_AVAILABLE_MB", "200"))
+BROWSER_RSS_ESTIMATE_MB = int(os.getenv("BROWSER_RSS_ESTIMATE_MB", "250"))
+BROWSER_RSS_RECYCLE_MB = int(os.getenv("BROWSER_RSS_RECYCLE_MB", "600"))
+ADMISSION_POLL_INTERVAL = 0.5
+CAPACITY_RETRY_AFTER = 5
+MB = 1024 * 1024
+
+
+class BrowserCapacityError(Exception):
+    """No memory for another browser within the admission timeout; the caller should retry later"""
+    status_code = 503
+
+    def __init__(self, retry_after):
+        super().__init__(f"Browser capacity exhausted, retry after {retry_after}s")
+        self.detail = str(self)
+        self.retry_after = retry_after
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return None if value == "max" else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def _meminfo(field):
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def memory_limit_bytes():
+    """The container's memory limit (cgroup v2, then v1), or the host's total memory"""
+    total = _meminfo("MemTotal")
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        limit = _read_int(path)
+        # cgroup v1 reports "no limit" as a huge number
+        if limit and (total is None or limit < total):
+            return limit
+    return total
+
+
+def memory_available_bytes():
+    """Memory that can still be allocated before the container limit or the host runs out"""
+    candidates = [_meminfo("MemAvailable")]
+    limit = memory_limit_bytes()
+    for path in ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory/memory.usage_in_bytes"):
+        usage = _read_int(path)
+        if usage is not None and limit:
+            candidates.append(limit - usage)
+            break
+    candidates = [value for value in candidates if value is not None]
+    return min(candidates) if candidates else None
+
+
+def process_tree_rss(pid):
+    """Resident set size in bytes of pid and all of its descendants (chromedriver -> Chrome)"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def driver_rss(driver):
+    """RSS of a locally launched driver's process tree, or None when it cannot be measured.
+    Takes a chromedriver-backed WebDriver or a DevTools ChromeProcess."""
+    service = getattr(driver, "service", None)
+    process = getattr(service, "process", None) if service is not None else getattr(driver, "process", None)
+    pid = getattr(process, "pid", None)
+    if pid is None:
+        return None
+    return process_tree_rss(pid) or None
+
+
+def _worker_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class BrowserAdmission:
+    """Container-wide browser memory accounting shared by every uvicorn worker through SQLite.
+
+    Each browser holds a lease recording its last measured RSS. A new browser is admitted
+    only while the leases plus an estimate of its size fit in the memory budget and the
+    container still has BROWSER_MIN_AVAILABLE_MB free once it is running.
+    """
+
+    def __init__(self, path=BROWSER_ADMISSION_PATH, budget_bytes=None, min_available_bytes=None,
+                 estimate_bytes=None, recycle_bytes=None):
+        self.path = path
+        if budget_bytes is None:
+            limit = memory_limit_bytes()
+            budget_bytes = BROWSER_MEMORY_BUDGET_MB * MB if BROWSER_MEMORY_BUDGET_MB else \
+                int((limit or 2048 * MB) * BROWSER_MEMORY_FRACTION)
+        self.budget_bytes = budget_bytes
+        self.min_available_bytes = BROWSER_MIN_AVAILABLE_MB * MB if min_available_bytes is None \
+            else min_available_bytes
+        self.default_estimate_bytes = BROWSER_RSS_ESTIMATE_MB * MB if estimate_bytes is None else estimate_bytes
+        self.recycle_bytes = BROWSER_RSS_RECYCLE_MB * MB if recycle_bytes is None else recycle_bytes
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                " id TEXT PRIMARY KEY, worker_pid INTEGER NOT NULL, rss INTEGER NOT NULL,"
+                " measured INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+            )
+            # a recycled pid cannot own the leases of the process that used it before
+            conn.execute("DELETE FROM leases WHERE worker_pid = ?", (os.getpid(),))
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _prune(self, conn):
+        for (pid,) in conn.execute("SELECT DISTINCT worker_pid FROM leases").fetchall():
+            if not _worker_alive(pid):
+                conn.execute("DELETE FROM leases WHERE worker_pid = ?", (pid,))
+
+    def _estimate(self, conn):
+        """Expected size of a new browser: the average measured RSS, at least the configured estimate"""
+        (average,) = conn.execute("SELECT AVG(rss) FROM leases WHERE measured = 1").fetchone()
+        return max(self.default_estimate_bytes, int(average or 0))
+
+    def try_admit(self, lease_id):
+        """Reserve memory for a browser about to launch; False when it does not fit right now"""
+        available = memory_available_bytes()
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._prune(conn)
+                    estimate = self._estimate(conn)
+                    (committed,) = conn.execute("SELECT COALESCE(SUM(rss), 0) FROM leases").fetchone()
+                    admitted = committed + estimate <= self.budget_bytes and (
+                        available is None or available - estimate >= self.min_available_bytes
+                    )
+                    if admitted:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO leases (id, worker_pid, rss, measured, updated_at)"
+                            " VALUES (?, ?, ?, 0, ?)",
+                            (lease_id, os.getpid(), estimate, time.time()),
+                        )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            # accounting is best effort; never refuse work because the lease table is unavailable
+            logging.error(f"Browser admission check failed: {e}")
+            return True
+        if not admitted:
+            logging.info(
+                f"Browser admission deferred: committed={committed // MB}MB estimate={estimate // MB}MB "
+                f"budget={self.budget_bytes // MB}MB available={'?' if available is None else available // MB}MB"
+            )
+        return admitted
+
+    def update(self, lease_id, driver):
+        """Record the browser's current RSS; returns it in bytes, or None when not measurable"""
+        rss = driver_rss(driver)
+        if rss is None:
+            return None
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE leases SET rss = ?, measured = 1, updated_at = ? WHERE id = ?",
+                    (rss, time.time(), lease_id),
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Browser lease update failed: {e}")
+        return rss
+
+    def should_recycle(self, rss):
+        if rss is not None and rss > self.recycle_bytes:
+            BROWSER_RECYCLES.inc(reason="memory")
+            return True
+        return False
+
+    def release(self, lease_id):
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+        except sqlite3.Error as e:
+            logging.error(f"Browser lease release failed: {e}")
+
+    def worker_committed_bytes(self):
+        """Memory held by this worker's browsers; /metrics sums it across workers"""
+        with self._connect() as conn:
+            (committed,) = conn.execute(
+                "SELECT COALESCE(SUM(rss), 0) FROM leases WHERE worker_pid = ?", (os.getpid(),)
+            ).fetchone()
+        return committed
+
+    def stats(self):
+        available = memory_available_bytes()
+        with self._connect() as conn:
+            self._prune(conn)
+            count, committed = conn.execute("SELECT COUNT(*), COALESCE(SUM(rss), 0) FROM leases").fetchone()
+            estimate = self._estimate(conn)
+        return {
+            "browsers": count,
+            "committed_mb": committed // MB,
+            "budget_mb": self.budget_bytes // MB,
+            "estimate_mb": estimate // MB,
+            "available_mb": None if available is None else available // MB,
+            "recycle_mb": self.recycle_bytes // MB,
+        }
+
+
+browser_admission = BrowserAdmission()
@@ -0,0 +1,16 @@
+# Renewal form fields every engine fills from the request, by element id
+FORM_PAGE_FIELDS = (
+    "name", "addressTwo", "city", "state", "homePhone0", "homePhone1", "homePhone2", "email", "zip",
+)
+
+
+class UnrecognizedPageError(Exception):
+    """The clerk site returned a page the HTTP engine does not know how to drive"""
+
+
+class ClerkAlertError(Exception):
+    """The clerk site rejected the search with an alert (plate not found, not eligible, ...)"""
+
+    def __init__(self, alert_text):
+        super().__init__(alert_text)
+        self.alert_text = alert_text
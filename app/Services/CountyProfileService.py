@@ -0,0 +1,160 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from Services.MetricsService import COUNTY_PROFILE_RUNS, county_label
+
+COUNTY_PROFILE_PATH = os.getenv("COUNTY_PROFILE_PATH", "/tmp/county_profiles.sqlite3")
+
+# Selects the option with exactly this value and fires change, as a user picking it would;
+# returns the option text, or null when the county's value is gone from the list
+SELECT_VALUE_SCRIPT = """
+var select = document.querySelector(arguments[0]), value = arguments[1];
+if (!select) return null;
+for (var i = 0; i < select.options.length; i++) {
+    if (select.options[i].value === value) {
+        select.selectedIndex = i;
+        select.dispatchEvent(new Event('change', {bubbles: true}));
+        return select.options[i].text;
+    }
+}
+return null;
+"""
+
+# What a run can observe about its county, and so what a profile holds
+PROFILE_FIELDS = ("countylist_value", "county_page_value", "shelby_address_verify")
+
+
+def county_key(county):
+    return (county or "").strip().lower()
+
+
+class CountyProfiles:
+    """What each county's clerk flow looks like, learned from completed runs and shared by
+    every uvicorn worker: the county's option values and whether its form has the Shelby
+    address checkbox.
+
+    Engines select counties by the stored value instead of scanning the options, and skip
+    probes for elements the county never has. A run that sees something else replaces the
+    profile with what it saw.
+    """
+
+    def __init__(self, path=COUNTY_PROFILE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS county_profiles ("
+                " county TEXT PRIMARY KEY, countylist_value TEXT, county_page_value TEXT,"
+                " shelby_address_verify INTEGER, runs INTEGER NOT NULL DEFAULT 0,"
+                " divergences INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+            )
+            # older stores also kept each county's page order, which neither engine read
+            conn.execute("BEGIN IMMEDIATE")
+            if "pages" in [column[1] for column in conn.execute("PRAGMA table_info(county_profiles)")]:
+                conn.execute("ALTER TABLE county_profiles DROP COLUMN pages")
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _profile(row):
+        county, countylist_value, county_page_value, shelby_address_verify, runs, divergences, updated_at = row
+        return {
+            "county": county,
+            "countylist_value": countylist_value,
+            "county_page_value": county_page_value,
+            "shelby_address_verify": None if shelby_address_verify is None else bool(shelby_address_verify),
+            "runs": runs,
+            "divergences": divergences,
+            "updatedAt": updated_at,
+        }
+
+    def get(self, county):
+        """The county's profile, or None until a run has completed there"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT county, countylist_value, county_page_value, shelby_address_verify, runs,"
+                    " divergences, updated_at FROM county_profiles WHERE county = ?",
+                    (county_key(county),),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"County profile lookup failed: {e}")
+            return None
+        return self._profile(row) if row else None
+
+    def learn(self, county, observed):
+        """Fold a run that reached its target into the county's profile.
+
+        observed holds what the run saw of PROFILE_FIELDS; fields it did not see keep their
+        stored value. Returns "learned" for a new county, "matched" when the run agrees with
+        the profile, or "diverged" when the profile was replaced.
+        """
+        key = county_key(county)
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT county, countylist_value, county_page_value, shelby_address_verify, runs,"
+                        " divergences, updated_at FROM county_profiles WHERE county = ?",
+                        (key,),
+                    ).fetchone()
+                    outcome, profile = self._merge(self._profile(row) if row else None, observed)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO county_profiles (county, countylist_value, county_page_value,"
+                        " shelby_address_verify, runs, divergences, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, profile["countylist_value"], profile["county_page_value"],
+                         profile["shelby_address_verify"], profile["runs"], profile["divergences"], time.time()),
+                    )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logging.error(f"County profile update failed: {e}")
+            return None
+        COUNTY_PROFILE_RUNS.inc(county=county_label(key), outcome=outcome)
+        if outcome == "diverged":
+            logging.info(f"County profile for {key} refreshed from a diverging run: {profile}")
+        return outcome
+
+    @staticmethod
+    def _merge(profile, observed):
+        seen = {field: observed[field] for field in PROFILE_FIELDS if observed.get(field) is not None}
+        if profile is None:
+            return "learned", {**dict.fromkeys(PROFILE_FIELDS), **seen, "runs": 1, "divergences": 0}
+        # a field never seen before was not known: nothing to diverge from
+        diverged = any(profile[field] is not None and profile[field] != value for field, value in seen.items())
+        merged = {**profile, **seen, "runs": profile["runs"] + 1}
+        if diverged:
+            merged["divergences"] += 1
+        return ("diverged" if diverged else "matched"), merged
+
+    def entries(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT county, countylist_value, county_page_value, shelby_address_verify, runs,"
+                " divergences, updated_at FROM county_profiles ORDER BY county"
+            ).fetchall()
+        return [self._profile(row) for row in rows]
+
+    def invalidate(self, county=None):
+        """Forget one county's profile, or every profile; the next run there learns it again"""
+        with self._connect() as conn:
+            if county:
+                return conn.execute("DELETE FROM county_profiles WHERE county = ?", (county_key(county),)).rowcount
+            return conn.execute("DELETE FROM county_profiles").rowcount
+
+
+county_profiles = CountyProfiles()
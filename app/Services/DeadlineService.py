@@ -0,0 +1,84 @@
+import math
+import os
+import threading
+import time
+from Services.MetricsService import ABANDONED_RUNS
+
+# Lambda stops the invocation at 120s; leave room to release the browser and answer
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "100"))
+
+
+class DeadlineExceededError(Exception):
+    """The run used up its request's time budget"""
+    status_code = 504
+
+    def __init__(self, seconds):
+        super().__init__(f"Renewal run exceeded its {seconds:g}s deadline")
+        self.detail = str(self)
+
+
+class RunCancelledError(Exception):
+    """The caller gave up on the run (client disconnected, request cancelled)"""
+    status_code = 499
+
+    def __init__(self, reason):
+        super().__init__(f"Renewal run cancelled: {reason}")
+        self.detail = str(self)
+
+
+class Deadline:
+    """Time budget and cancellation flag of one renewal run.
+
+    The request handler creates it and may cancel it from the event loop; the run checks it
+    between steps and bounds every wait by what is left, so an abandoned or overdue run stops
+    at its next wait and frees its browser.
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self.reason = None
+        self._cancelled = threading.Event()
+        self._abandoned = False
+
+    def remaining(self):
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self, reason):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self):
+        """Raise when the run should stop: cancelled, or out of time"""
+        if self._cancelled.is_set():
+            self._abandon("cancelled")
+            raise RunCancelledError(self.reason)
+        if self.remaining() <= 0:
+            self._abandon("deadline")
+            raise DeadlineExceededError(self.seconds)
+
+    def _abandon(self, reason):
+        if not self._abandoned:
+            self._abandoned = True
+            ABANDONED_RUNS.inc(reason=reason)
+
+    def clamp(self, timeout):
+        """timeout, cut down to the time left"""
+        return min(timeout, self.remaining())
+
+    def sleep(self, seconds):
+        """Sleep that wakes up early, and raises, when the run is cancelled or runs out of time"""
+        self._cancelled.wait(self.clamp(seconds))
+        self.check()
+
+
+def no_deadline():
+    """For runs nobody waits on synchronously (queued jobs): never expires, never cancelled"""
+    return Deadline(None)
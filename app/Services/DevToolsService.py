@@ -0,0 +1,539 @@
+"""Asyncio browser engine speaking the Chrome DevTools protocol directly.
+
+A few Chrome processes are launched with --remote-debugging-port and each renewal gets its
+own browser context (an incognito-like profile with separate cookies and storage) holding a
+single tab. Every tab is driven over the browser's one websocket in flattened session mode,
+so one event loop can run many renewals without a thread or a chromedriver per request.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from urllib.parse import urlsplit
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import (
+    AcceptConnection, BytesMessage, CloseConnection, Ping, RejectConnection, Request, TextMessage,
+)
+from Services.MetricsService import BROWSER_ADMISSIONS, BROWSER_LAUNCH_DURATION, BROWSER_RECYCLES
+from Services.BrowserAdmissionService import (
+    ADMISSION_POLL_INTERVAL, CAPACITY_RETRY_AFTER, BrowserCapacityError, browser_admission,
+)
+from Services.DriverPoolService import CHROME_ARGUMENTS, DRIVER_POOL_ACQUIRE_TIMEOUT, DRIVER_POOL_MAX_USES
+from Services.ResourceBlockingService import RESOURCE_USAGE_LOG_ENABLED, ResourceUsage, apply_tab_resource_blocking
+
+DEVTOOLS_BROWSERS = int(os.getenv("DEVTOOLS_BROWSERS", "2"))
+DEVTOOLS_CONTEXTS_PER_BROWSER = int(os.getenv("DEVTOOLS_CONTEXTS_PER_BROWSER", "8"))
+DEVTOOLS_LAUNCH_TIMEOUT = float(os.getenv("DEVTOOLS_LAUNCH_TIMEOUT", "30"))
+DEVTOOLS_COMMAND_TIMEOUT = float(os.getenv("DEVTOOLS_COMMAND_TIMEOUT", "30"))
+CHROME_BINARIES = ("chromium-browser", "chromium", "google-chrome", "google-chrome-stable", "chrome")
+READ_CHUNK = 65536
+
+
+class DevToolsError(Exception):
+    """A DevTools command failed, or the connection to Chrome was lost"""
+
+
+class JavascriptError(DevToolsError):
+    """A script evaluated in the page threw"""
+
+
+class NoSuchElementError(DevToolsError):
+    """A script found nothing on the page for its selector"""
+
+
+class DevToolsTimeoutError(DevToolsError):
+    """Chrome did not answer a command, or a page did not load, in time"""
+
+
+def find_chrome_binary():
+    configured = os.getenv("CHROME_BIN")
+    if configured and os.path.exists(configured):
+        return configured
+    for name in CHROME_BINARIES:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise DevToolsError("No Chrome binary found; set CHROME_BIN")
+
+
+class DevToolsConnection:
+    """One websocket to Chrome's browser endpoint, shared by every tab of that browser.
+
+    Command replies are matched to their futures by id; events are routed by sessionId to
+    the listener of the tab they belong to.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = {}
+        self._ws = WSConnection(ConnectionType.CLIENT)
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._fragments = []
+
+    async def connect(self):
+        parts = urlsplit(self.url)
+        self._reader, self._writer = await asyncio.open_connection(parts.hostname, parts.port)
+        self._writer.write(self._ws.send(Request(host=parts.netloc, target=parts.path)))
+        await self._writer.drain()
+        while True:
+            data = await self._reader.read(READ_CHUNK)
+            if not data:
+                raise DevToolsError(f"DevTools closed the connection to {self.url} during the handshake")
+            self._ws.receive_data(data)
+            events = list(self._ws.events())
+            for index, event in enumerate(events):
+                if isinstance(event, RejectConnection):
+                    raise DevToolsError(f"DevTools refused the connection to {self.url}: {event.status_code}")
+                if isinstance(event, AcceptConnection):
+                    self._dispatch(events[index + 1:])
+                    self._read_task = asyncio.create_task(self._read_loop())
+                    return
+
+    def listen(self, session_id, listener):
+        self._listeners[session_id] = listener
+
+    def unlisten(self, session_id):
+        self._listeners.pop(session_id, None)
+
+    async def send(self, method, params=None, session_id=None, timeout=DEVTOOLS_COMMAND_TIMEOUT):
+        if self.closed:
+            raise DevToolsError(f"DevTools connection closed, cannot send {method}")
+        message_id = next(self._ids)
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        reply = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = reply
+        try:
+            self._writer.write(self._ws.send(TextMessage(data=json.dumps(message))))
+            await self._writer.drain()
+            return await asyncio.wait_for(reply, timeout)
+        except asyncio.TimeoutError:
+            raise DevToolsTimeoutError(f"{method} got no reply within {timeout}s") from None
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def close(self):
+        if self._writer is not None and not self.closed:
+            try:
+                self._writer.write(self._ws.send(CloseConnection(code=1000)))
+                await self._writer.drain()
+            except Exception:
+                pass
+        self._closed("DevTools connection closed")
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                data = await self._reader.read(READ_CHUNK)
+                if not data:
+                    break
+                self._ws.receive_data(data)
+                self._dispatch(self._ws.events())
+        except (ConnectionError, OSError) as e:
+            logging.info(f"DevTools connection to {self.url} failed: {e}")
+        finally:
+            self._closed("Chrome closed the DevTools connection")
+
+    def _dispatch(self, events):
+        for event in events:
+            if isinstance(event, TextMessage | BytesMessage):
+                self._fragments.append(event.data if isinstance(event, TextMessage) else event.data.decode())
+                if event.message_finished:
+                    message, self._fragments = "".join(self._fragments), []
+                    self._handle(json.loads(message))
+            elif isinstance(event, Ping):
+                self._writer.write(self._ws.send(event.response()))
+            elif isinstance(event, CloseConnection):
+                self._closed("Chrome closed the DevTools connection")
+
+    def _handle(self, message):
+        if "id" in message:
+            reply = self._pending.get(message["id"])
+            if reply is None or reply.done():
+                return
+            if "error" in message:
+                reply.set_exception(DevToolsError(message["error"].get("message", str(message["error"]))))
+            else:
+                reply.set_result(message.get("result", {}))
+            return
+        listener = self._listeners.get(message.get("sessionId"))
+        if listener is not None:
+            try:
+                listener(message.get("method"), message.get("params", {}))
+            except Exception as e:
+                logging.error(f"DevTools event listener failed on {message.get('method')}: {e}")
+
+    def _closed(self, reason):
+        if self.closed:
+            return
+        self.closed = True
+        for reply in self._pending.values():
+            if not reply.done():
+                reply.set_exception(DevToolsError(reason))
+
+
+class DevToolsTab:
+    """One page in its own browser context. Offers the slice of the WebDriver API the
+    renewal flow uses, as coroutines: get, execute_script, current_url"""
+
+    def __init__(self, browser, context_id, target_id, session_id):
+        self.browser = browser
+        self.context_id = context_id
+        self.target_id = target_id
+        self.session_id = session_id
+        self.usage = ResourceUsage()
+        self._dialog_text = None
+        self._waiters = {}
+
+    async def send(self, method, params=None, timeout=DEVTOOLS_COMMAND_TIMEOUT):
+        return await self.browser.connection.send(method, params, self.session_id, timeout)
+
+    def on_event(self, method, params):
+        if method == "Page.javascriptDialogOpening":
+            # accept at once so scripts and navigations are not held up, like chromedriver does
+            self._dialog_text = params.get("message", "")
+            asyncio.get_running_loop().create_task(self._accept_dialog())
+        elif method.startswith("Network."):
+            self.usage.add_event(method, params)
+        for waiter in self._waiters.pop(method, ()):
+            if not waiter.done():
+                waiter.set_result(params)
+
+    async def _accept_dialog(self):
+        try:
+            await self.send("Page.handleJavaScriptDialog", {"accept": True})
+        except DevToolsError as e:
+            logging.info(f"Accepting a page dialog failed: {e}")
+
+    def take_dialog_text(self):
+        """Text of the dialog the page opened since the last call, or None"""
+        text, self._dialog_text = self._dialog_text, None
+        return text
+
+    def expect_event(self, method):
+        """A future resolved with the params of the next such event; create it before the
+        command that causes the event"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(method, []).append(waiter)
+        return waiter
+
+    async def get(self, url, timeout=DEVTOOLS_COMMAND_TIMEOUT):
+        """Navigate and wait for the load event, as WebDriver.get does"""
+        loaded = self.expect_event("Page.loadEventFired")
+        result = await self.send("Page.navigate", {"url": url}, timeout)
+        if result.get("errorText"):
+            loaded.cancel()
+            raise DevToolsError(f"Navigating to {url} failed: {result['errorText']}")
+        try:
+            await asyncio.wait_for(loaded, timeout)
+        except asyncio.TimeoutError:
+            raise DevToolsTimeoutError(f"{url} did not finish loading within {timeout}s") from None
+
+    async def execute_script(self, script, *args):
+        """Run a WebDriver-style script body (it sees `arguments` and returns a value) in the page"""
+        expression = f"(function () {{\n{script}\n}}).apply(null, {json.dumps(args)})"
+        result = await self.send("Runtime.evaluate", {
+            "expression": expression, "returnByValue": True, "awaitPromise": True,
+        })
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise JavascriptError(details.get("exception", {}).get("description") or details.get("text"))
+        return result.get("result", {}).get("value")
+
+    async def current_url(self):
+        return await self.execute_script("return location.href;")
+
+    async def insert_text(self, text):
+        """Type text into the focused element, firing the same input events as a keyboard"""
+        await self.send("Input.insertText", {"text": text})
+
+
+class ChromeProcess:
+    """A Chrome launched with a DevTools port, holding up to contexts_per_browser tabs"""
+
+    def __init__(self, process, connection, user_data_dir, lease_id=None):
+        self.process = process
+        self.connection = connection
+        self.user_data_dir = user_data_dir
+        self.lease_id = lease_id
+        self.tabs = 0
+        self.uses = 0
+        self._stderr_task = None
+
+    @classmethod
+    async def launch(cls, binary, lease_id=None, timeout=DEVTOOLS_LAUNCH_TIMEOUT):
+        user_data_dir = tempfile.mkdtemp(prefix="vrs-chrome-")
+        process = await asyncio.create_subprocess_exec(
+            binary, *CHROME_ARGUMENTS, "--remote-debugging-port=0", f"--user-data-dir={user_data_dir}",
+            "--no-first-run", "about:blank",
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        browser = cls(process, None, user_data_dir, lease_id)
+        try:
+            url = await asyncio.wait_for(browser._devtools_url(), timeout)
+            browser.connection = DevToolsConnection(url)
+            await browser.connection.connect()
+        except BaseException:
+            await browser.close()
+            raise
+        # Chrome blocks once the stderr pipe is full, so keep reading it
+        browser._stderr_task = asyncio.create_task(browser._drain_stderr())
+        return browser
+
+    async def _devtools_url(self):
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                raise DevToolsError(f"Chrome exited with {await self.process.wait()} before opening DevTools")
+            text = line.decode(errors="replace").strip()
+            if text.startswith("DevTools listening on "):
+                return text.removeprefix("DevTools listening on ")
+
+    async def _drain_stderr(self):
+        while await self.process.stderr.readline():
+            pass
+
+    @property
+    def alive(self):
+        return self.process.returncode is None and self.connection is not None and not self.connection.closed
+
+    async def open_tab(self):
+        created = await self.connection.send("Target.createBrowserContext", {"disposeOnDetach": True})
+        context_id = created["browserContextId"]
+        try:
+            target = await self.connection.send(
+                "Target.createTarget", {"url": "about:blank", "browserContextId": context_id},
+            )
+            attached = await self.connection.send(
+                "Target.attachToTarget", {"targetId": target["targetId"], "flatten": True},
+            )
+            tab = DevToolsTab(self, context_id, target["targetId"], attached["sessionId"])
+            self.connection.listen(tab.session_id, tab.on_event)
+            await tab.send("Page.enable")
+            if RESOURCE_USAGE_LOG_ENABLED:
+                await tab.send("Network.enable")
+            await apply_tab_resource_blocking(tab)
+            return tab
+        except BaseException:
+            await self._dispose(context_id)
+            raise
+
+    async def close_tab(self, tab):
+        self.connection.unlisten(tab.session_id)
+        await self._dispose(tab.context_id)
+
+    async def _dispose(self, context_id):
+        try:
+            # closes the context's tab and drops its cookies and storage
+            await self.connection.send("Target.disposeBrowserContext", {"browserContextId": context_id})
+        except DevToolsError as e:
+            logging.info(f"Disposing browser context failed: {e}")
+
+    async def close(self):
+        if self.connection is not None:
+            try:
+                await self.connection.send("Browser.close", timeout=5)
+            except DevToolsError:
+                pass
+            await self.connection.close()
+        if self.process.returncode is None:
+            self.process.kill()
+        await self.process.wait()
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+class DevToolsEngine:
+    """Tabs for concurrent renewals, spread over at most max_browsers Chrome processes.
+
+    Mirrors DriverPool: a new Chrome is launched only when every running one is full and the
+    container-wide memory admission accepts it; otherwise callers wait for a free tab and are
+    shed with BrowserCapacityError at the deadline.
+    """
+
+    def __init__(self, max_browsers=DEVTOOLS_BROWSERS, contexts_per_browser=DEVTOOLS_CONTEXTS_PER_BROWSER,
+                 max_uses=DRIVER_POOL_MAX_USES * DEVTOOLS_CONTEXTS_PER_BROWSER, admission=browser_admission,
+                 launcher=ChromeProcess.launch):
+        self.max_browsers = max(1, max_browsers)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.max_uses = max_uses
+        self.admission = admission
+        self.launcher = launcher
+        self._browsers = []
+        self._launching = 0
+        self._closed = False
+        self._condition = asyncio.Condition()
+
+    @property
+    def in_use(self):
+        return sum(browser.tabs for browser in self._browsers)
+
+    @property
+    def size(self):
+        return len(self._browsers)
+
+    async def acquire(self, timeout=DRIVER_POOL_ACQUIRE_TIMEOUT):
+        """A fresh tab in its own browser context"""
+        deadline = time.monotonic() + timeout
+        queued_for_memory = False
+        while True:
+            async with self._condition:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("DevTools engine is closed")
+                    for crashed in [b for b in self._browsers if not b.alive and not b.tabs]:
+                        self._browsers.remove(crashed)
+                        BROWSER_RECYCLES.inc(reason="unhealthy")
+                        asyncio.get_running_loop().create_task(self._quit(crashed))
+                    browser = min(
+                        (b for b in self._browsers if b.alive and b.tabs < self.contexts_per_browser
+                         and b.uses < self.max_uses),
+                        key=lambda b: b.tabs, default=None,
+                    )
+                    if browser is not None:
+                        browser.tabs += 1
+                        break
+                    if len(self._browsers) + self._launching < self.max_browsers:
+                        self._launching += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No browser tab available after {timeout}s")
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+
+            if browser is None:
+                browser = await self._launch(deadline, queued_for_memory)
+                if browser is None:
+                    queued_for_memory = True
+                    continue
+            try:
+                return await browser.open_tab()
+            except BaseException:
+                await self._returned(browser)
+                raise
+
+    async def _launch(self, deadline, queued_for_memory):
+        """Start a Chrome for the caller, or None when memory admission asks it to wait"""
+        lease_id = uuid.uuid4().hex
+        admitted = self.admission is None or await asyncio.to_thread(self.admission.try_admit, lease_id)
+        if not admitted:
+            async with self._condition:
+                self._launching -= 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    BROWSER_ADMISSIONS.inc(outcome="shed")
+                    raise BrowserCapacityError(CAPACITY_RETRY_AFTER)
+                # a tab freed meanwhile is reused instead of launching a browser
+                try:
+                    await asyncio.wait_for(self._condition.wait(), min(ADMISSION_POLL_INTERVAL, remaining))
+                except asyncio.TimeoutError:
+                    pass
+            return None
+        BROWSER_ADMISSIONS.inc(outcome="queued" if queued_for_memory else "admitted")
+        started = time.monotonic()
+        try:
+            browser = await self.launcher(find_chrome_binary(), lease_id)
+        except BaseException as e:
+            BROWSER_LAUNCH_DURATION.observe(time.monotonic() - started, outcome="error")
+            if self.admission is not None:
+                await asyncio.to_thread(self.admission.release, lease_id)
+            async with self._condition:
+                self._launching -= 1
+                self._condition.notify()
+            if isinstance(e, Exception):
+                logging.error(f"Failed to launch Chrome for DevTools: {e}")
+                raise RuntimeError("Failed to launch Chrome") from e
+            raise
+        BROWSER_LAUNCH_DURATION.observe(time.monotonic() - started, outcome="ok")
+        async with self._condition:
+            self._launching -= 1
+            browser.tabs = 1
+            self._browsers.append(browser)
+        return browser
+
+    async def release(self, tab):
+        """Close the tab's browser context; the Chrome is kept for the next tab unless it is
+        spent, too large or gone"""
+        browser = tab.browser
+        if browser.alive:
+            await browser.close_tab(tab)
+        browser.uses += 1
+        await self._returned(browser)
+
+    async def _returned(self, browser):
+        measure = False
+        async with self._condition:
+            browser.tabs -= 1
+            retire = not browser.alive or self._closed
+            if not retire and browser.tabs == 0:
+                if browser.uses >= self.max_uses:
+                    BROWSER_RECYCLES.inc(reason="uses")
+                    retire = True
+                else:
+                    measure = self.admission is not None and bool(browser.lease_id)
+            if not measure:
+                retire = self._retire_if_idle(browser, retire)
+        if measure:
+            # the SQLite admission update runs without holding the condition, so other tabs
+            # come and go meanwhile; the browser is only retired if it is still idle after
+            rss = await asyncio.to_thread(self.admission.update, browser.lease_id, browser)
+            async with self._condition:
+                retire = self._retire_if_idle(browser, self.admission.should_recycle(rss))
+        if retire:
+            await self._quit(browser)
+
+    def _retire_if_idle(self, browser, retire):
+        """Take the browser out of the pool when it is to be retired and no tab uses it;
+        whether it was. Called holding the condition"""
+        if retire and browser.tabs == 0 and browser in self._browsers:
+            self._browsers.remove(browser)
+        else:
+            retire = False
+        self._condition.notify_all()
+        return retire
+
+    async def _quit(self, browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            logging.error(f"Failed to close Chrome: {e}")
+        if self.admission is not None and browser.lease_id:
+            await asyncio.to_thread(self.admission.release, browser.lease_id)
+
+    async def close(self):
+        async with self._condition:
+            self._closed = True
+            browsers, self._browsers = self._browsers, []
+            self._condition.notify_all()
+        for browser in browsers:
+            await self._quit(browser)
+
+    def stats(self):
+        return {
+            "browsers": self.size,
+            "tabs_in_use": self.in_use,
+            "tabs_per_browser": self.contexts_per_browser,
+            "max_browsers": self.max_browsers,
+        }
+
+
+devtools_engine = DevToolsEngine()
@@ -0,0 +1,317 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from functools import cache
+from Services.MetricsService import BROWSER_ADMISSIONS, BROWSER_LAUNCH_DURATION, BROWSER_RECYCLES
+from Services.BrowserAdmissionService import (
+    ADMISSION_POLL_INTERVAL, CAPACITY_RETRY_AFTER, BrowserCapacityError, browser_admission,
+)
+from Services.ResourceBlockingService import (
+    RESOURCE_USAGE_LOG_ENABLED, apply_resource_blocking, read_performance_log,
+)
+
+DRIVER_POOL_MIN_SIZE = int(os.getenv("DRIVER_POOL_MIN_SIZE", "1"))
+DRIVER_POOL_MAX_SIZE = int(os.getenv("DRIVER_POOL_MAX_SIZE", "3"))
+DRIVER_POOL_MAX_USES = int(os.getenv("DRIVER_POOL_MAX_USES", "25"))
+DRIVER_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DRIVER_POOL_ACQUIRE_TIMEOUT", "60"))
+# warm browsers load this once so DNS, TLS and the HTTP cache are hot for the first request
+DRIVER_POOL_PRELOAD_URL = os.getenv("DRIVER_POOL_PRELOAD_URL", os.getenv("RENEWAL_SERVICE_URL", ""))
+
+# Command-line switches for every Chrome the service launches, through chromedriver or DevTools
+CHROME_ARGUMENTS = (
+    "--headless",
+    "--no-sandbox",  # For environments like Docker
+    "--disable-dev-shm-usage",  # Prevents memory issues in headless mode
+    "--disable-gpu",
+    "--disable-software-rasterizer",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-client-side-phishing-detection",
+    "--disable-default-apps",
+    "--disable-extensions",
+    "--disable-sync",
+)
+
+# selenium is imported when the first browser launches, not when the API starts
+
+
+def build_chrome_options():
+    """Chrome options shared by every driver the service launches"""
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    prefs = {"profile.managed_default_content_settings.images": 2}
+    options.add_experimental_option("prefs", prefs)
+    if RESOURCE_USAGE_LOG_ENABLED:
+        # network events feed the per-run blocked request and transferred byte counters
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return options
+
+
+def create_driver():
+    from selenium import webdriver
+
+    driver = webdriver.Chrome(options=build_chrome_options())
+    apply_resource_blocking(driver)
+    return driver
+
+
+class PooledDriver:
+    """A launched Chrome driver plus the bookkeeping the pool needs to recycle it"""
+
+    def __init__(self, driver, lease_id=None):
+        self.driver = driver
+        self.lease_id = lease_id
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+
+class DriverPool:
+
+    def __init__(self, min_size=DRIVER_POOL_MIN_SIZE, max_size=DRIVER_POOL_MAX_SIZE,
+                 max_uses=DRIVER_POOL_MAX_USES, driver_factory=create_driver, admission=browser_admission,
+                 preload_url=DRIVER_POOL_PRELOAD_URL):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.max_uses = max_uses
+        self.driver_factory = driver_factory
+        self.admission = admission
+        self.preload_url = preload_url
+        self._idle = []
+        self._in_use = {}
+        self._launching = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def size(self):
+        with self._condition:
+            return len(self._idle) + len(self._in_use) + self._launching
+
+    @property
+    def in_use(self):
+        with self._condition:
+            return len(self._in_use)
+
+    def warm_up(self):
+        """Launch drivers until the pool holds at least min_size of them, each having
+        loaded the preload URL once"""
+        while True:
+            with self._condition:
+                if self._closed or len(self._idle) + len(self._in_use) + self._launching >= self.min_size:
+                    return
+                self._launching += 1
+            lease_id = uuid.uuid4().hex
+            # warming up is opportunistic: never hold memory other workers need for requests
+            pooled = self._launch(lease_id) if self._admit(lease_id) else None
+            if pooled is not None and not self._preload(pooled):
+                self._quit(pooled)
+                pooled = None
+            with self._condition:
+                self._launching -= 1
+                if pooled is None:
+                    self._condition.notify()
+                    return
+                self._idle.append(pooled)
+                self._condition.notify()
+
+    def acquire(self, timeout=DRIVER_POOL_ACQUIRE_TIMEOUT):
+        """Borrow a healthy driver, launching a new one when the pool has room and the
+        container has memory for it; otherwise wait, and shed the request at the deadline"""
+        deadline = time.monotonic() + timeout
+        queued_for_memory = False
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Driver pool is closed")
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        launch = False
+                        break
+                    if len(self._in_use) + self._launching < self.max_size:
+                        self._launching += 1
+                        pooled = None
+                        launch = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No browser available after {timeout}s")
+                    self._condition.wait(remaining)
+
+            if launch:
+                lease_id = uuid.uuid4().hex
+                if not self._admit(lease_id):
+                    with self._condition:
+                        self._launching -= 1
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            BROWSER_ADMISSIONS.inc(outcome="shed")
+                            raise BrowserCapacityError(CAPACITY_RETRY_AFTER)
+                        queued_for_memory = True
+                        # a driver released meanwhile is reused instead of launching one
+                        self._condition.wait(min(ADMISSION_POLL_INTERVAL, remaining))
+                    continue
+                BROWSER_ADMISSIONS.inc(outcome="queued" if queued_for_memory else "admitted")
+                pooled = self._launch(lease_id)
+                with self._condition:
+                    self._launching -= 1
+                    if pooled is None:
+                        self._condition.notify()
+                        raise RuntimeError("Failed to launch Chrome driver")
+                    self._in_use[id(pooled.driver)] = pooled
+                return pooled.driver
+
+            if self._is_healthy(pooled):
+                with self._condition:
+                    self._in_use[id(pooled.driver)] = pooled
+                return pooled.driver
+
+            logging.info("Discarding unhealthy pooled driver")
+            BROWSER_RECYCLES.inc(reason="unhealthy")
+            self._quit(pooled)
+            with self._condition:
+                self._condition.notify()
+
+    def release(self, driver, discard=False):
+        """Return a borrowed driver; it is reset for the next request or recycled"""
+        with self._condition:
+            pooled = self._in_use.pop(id(driver), None)
+        if pooled is None:
+            self._quit(PooledDriver(driver))
+            return
+
+        pooled.uses += 1
+        keep = not discard and not self._closed and pooled.uses < self.max_uses
+        if keep:
+            keep = self._reset(pooled)
+        elif not discard:
+            logging.info(f"Recycling driver after {pooled.uses} uses")
+            BROWSER_RECYCLES.inc(reason="uses")
+        if keep and self.admission is not None:
+            rss = self.admission.update(pooled.lease_id, pooled.driver)
+            if self.admission.should_recycle(rss):
+                logging.info(f"Recycling driver using {rss // (1024 * 1024)}MB")
+                keep = False
+
+        if keep:
+            with self._condition:
+                if not self._closed:
+                    self._idle.append(pooled)
+                    self._condition.notify()
+                    return
+        self._quit(pooled)
+        with self._condition:
+            self._condition.notify()
+            below_min = len(self._idle) + len(self._in_use) + self._launching < self.min_size
+        if below_min and not self._closed:
+            threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            drivers = self._idle + list(self._in_use.values())
+            self._idle = []
+            self._in_use = {}
+            self._condition.notify_all()
+        for pooled in drivers:
+            self._quit(pooled)
+
+    def _admit(self, lease_id):
+        return self.admission is None or self.admission.try_admit(lease_id)
+
+    def _launch(self, lease_id=None):
+        started = time.monotonic()
+        try:
+            pooled = PooledDriver(self.driver_factory(), lease_id)
+        except Exception as e:
+            logging.error(f"Failed to launch Chrome driver: {e}")
+            BROWSER_LAUNCH_DURATION.observe(time.monotonic() - started, outcome="error")
+            if self.admission is not None and lease_id:
+                self.admission.release(lease_id)
+            return None
+        BROWSER_LAUNCH_DURATION.observe(time.monotonic() - started, outcome="ok")
+        if self.admission is not None and lease_id:
+            self.admission.update(lease_id, pooled.driver)
+        return pooled
+
+    def _preload(self, pooled):
+        if not self.preload_url:
+            return True
+        try:
+            pooled.driver.get(self.preload_url)
+        except Exception as e:
+            logging.info(f"Preloading {self.preload_url} failed: {e}")
+        # start the first request from a clean session; open connections stay warm
+        return self._reset(pooled)
+
+    def _is_healthy(self, pooled):
+        try:
+            return pooled.driver.execute_script("return 1;") == 1
+        except Exception as e:
+            logging.info(f"Pooled driver failed health check: {e}")
+            return False
+
+    def _reset(self, pooled):
+        """Clear cookies and web storage so the next request starts a fresh clerk session"""
+        driver = pooled.driver
+        try:
+            driver.switch_to.alert.dismiss()
+        except Exception:
+            pass
+        try:
+            driver.switch_to.default_content()
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        except Exception:
+            # storage is not accessible on some pages (e.g. about:blank); cookies are what matter
+            pass
+        try:
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.get("about:blank")
+            # drop anything the previous run left unread so usage is not attributed to the next one
+            read_performance_log(driver)
+            return True
+        except Exception as e:
+            logging.info(f"Failed to reset pooled driver: {e}")
+            return False
+
+    def _quit(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logging.error(f"Failed to quit driver: {e}")
+        if self.admission is not None and pooled.lease_id:
+            self.admission.release(pooled.lease_id)
+
+
+driver_pool = DriverPool()
+
+
+@cache
+def attached_driver_class():
+    from selenium import webdriver
+
+    class AttachedDriver(webdriver.Remote):
+        """Drives a chromedriver session owned by another worker process; it never quits the browser"""
+
+        def __init__(self, executor_url, session_id):
+            self._attached_session_id = session_id
+            super().__init__(command_executor=executor_url, options=build_chrome_options())
+
+        def start_session(self, capabilities):
+            self.session_id = self._attached_session_id
+            self.caps = {}
+
+        def quit(self):
+            # the owning worker releases or recycles the browser
+            pass
+
+    return AttachedDriver
+
+
+def attach_driver(executor_url, session_id):
+    return attached_driver_class()(executor_url, session_id)
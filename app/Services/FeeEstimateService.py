@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+from Models.FeeSummary import FeeSummary
+from Models.QueryPriceRequest import QueryPriceRequest
+from Services.MetricsService import FEE_ESTIMATE_CHECKS, FEE_ESTIMATES, county_label
+
+FEE_ESTIMATE_PATH = os.getenv("FEE_ESTIMATE_PATH", "/tmp/fee_estimates.sqlite3")
+# scraped summaries kept per county and city; older ones stop counting once fees change
+FEE_ESTIMATE_WINDOW = int(os.getenv("FEE_ESTIMATE_WINDOW", "50"))
+# below this many summaries for the city, the whole county's are used
+FEE_ESTIMATE_MIN_SAMPLES = int(os.getenv("FEE_ESTIMATE_MIN_SAMPLES", "3"))
+FEE_DISAGREEMENTS_MAX = int(os.getenv("FEE_DISAGREEMENTS_MAX", "1000"))
+
+# the fee page's amount fields, by API name; the other fields are about the vehicle
+AMOUNT_FIELDS = tuple(
+    field.alias for field in FeeSummary.model_fields.values() if field.annotation == Decimal | None
+)
+CONFIDENCE_LEVELS = ((0.8, "high"), (0.6, "medium"), (0.0, "low"))
+
+
+def locality(request: QueryPriceRequest):
+    """County and city: the wheel taxes depend on them, the rest of the fees barely vary"""
+    return request.county.strip().lower(), request.city.strip().lower()
+
+
+def confidence_level(confidence):
+    return next(level for floor, level in CONFIDENCE_LEVELS if confidence >= floor)
+
+
+class FeeEstimates:
+    """Fee table learned from scraped fee summaries, shared by every uvicorn worker.
+
+    An estimate is the most common set of amounts among recent summaries for the request's
+    county and city (the whole county when the city has too few). Its confidence is the share
+    of those summaries that agree, discounted for small samples, so a county where vehicle
+    classes disagree on price gets a low one. Live quotes checked against an estimate and
+    found different are kept for review.
+    """
+
+    def __init__(self, path=FEE_ESTIMATE_PATH, window=FEE_ESTIMATE_WINDOW, min_samples=FEE_ESTIMATE_MIN_SAMPLES):
+        self.path = path
+        self.window = window
+        self.min_samples = min_samples
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fee_observations ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, county TEXT NOT NULL, city TEXT NOT NULL,"
+                " amounts TEXT NOT NULL, observed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS fee_observations_locality ON fee_observations (county, city)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fee_disagreements ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, plate TEXT NOT NULL, county TEXT NOT NULL,"
+                " city TEXT NOT NULL, fields TEXT NOT NULL, estimated TEXT NOT NULL, live TEXT NOT NULL,"
+                " confidence REAL NOT NULL, checked_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def observe(self, request: QueryPriceRequest, fee_summary):
+        """Learn from a scraped fee summary"""
+        county, city = locality(request)
+        amounts = json.dumps({field: fee_summary.get(field, "") for field in AMOUNT_FIELDS}, sort_keys=True)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO fee_observations (county, city, amounts, observed_at) VALUES (?, ?, ?, ?)",
+                    (county, city, amounts, time.time()),
+                )
+                conn.execute(
+                    "DELETE FROM fee_observations WHERE county = ? AND city = ? AND id NOT IN ("
+                    " SELECT id FROM fee_observations WHERE county = ? AND city = ? ORDER BY id DESC LIMIT ?)",
+                    (county, city, county, city, self.window),
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Fee estimate observation failed: {e}")
+
+    def _samples(self, conn, county, city):
+        rows = conn.execute(
+            "SELECT amounts FROM fee_observations WHERE county = ? AND city = ? ORDER BY id DESC LIMIT ?",
+            (county, city, self.window),
+        ).fetchall()
+        if len(rows) >= self.min_samples:
+            return "city", rows
+        rows = conn.execute(
+            "SELECT amounts FROM fee_observations WHERE county = ? ORDER BY id DESC LIMIT ?",
+            (county, self.window),
+        ).fetchall()
+        return "county", rows
+
+    def estimate(self, request: QueryPriceRequest):
+        """A fee summary estimated from the table, marked as such, or None without data"""
+        county, city = locality(request)
+        try:
+            with self._connect() as conn:
+                scope, rows = self._samples(conn, county, city)
+        except sqlite3.Error as e:
+            logging.error(f"Fee estimate lookup failed: {e}")
+            rows = []
+        if not rows:
+            FEE_ESTIMATES.inc(county=county_label(county), outcome="unavailable")
+            return None
+        amounts, agreeing = Counter(row[0] for row in rows).most_common(1)[0]
+        # one summary that agrees with itself is not yet a fee table
+        confidence = round(agreeing / (len(rows) + 1), 2)
+        FEE_ESTIMATES.inc(county=county_label(county), outcome=confidence_level(confidence))
+        return {
+            **{field.alias: "" for field in FeeSummary.model_fields.values()},
+            **json.loads(amounts),
+            "estimate": True,
+            "confidence": confidence,
+            "confidenceLevel": confidence_level(confidence),
+            "samples": len(rows),
+            "scope": scope,
+        }
+
+    def check(self, request: QueryPriceRequest, estimate, fee_summary):
+        """Compare a live quote with the estimate given for it; the amount fields that differ"""
+        county, city = locality(request)
+        disagreed = [field for field in AMOUNT_FIELDS if estimate.get(field, "") != fee_summary.get(field, "")]
+        FEE_ESTIMATE_CHECKS.inc(county=county_label(county), outcome="disagreed" if disagreed else "agreed")
+        if not disagreed:
+            return disagreed
+        logging.warning(
+            f"[Plate: {request.plateNumber}] Live quote disagrees with the {estimate['confidenceLevel']}"
+            f" confidence estimate on {', '.join(disagreed)}"
+        )
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO fee_disagreements (plate, county, city, fields, estimated, live, confidence,"
+                    " checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (request.plateNumber.strip().upper(), county, city, json.dumps(disagreed),
+                     json.dumps({field: estimate.get(field, "") for field in disagreed}),
+                     json.dumps({field: fee_summary.get(field, "") for field in disagreed}),
+                     estimate["confidence"], time.time()),
+                )
+                conn.execute(
+                    "DELETE FROM fee_disagreements WHERE id NOT IN ("
+                    " SELECT id FROM fee_disagreements ORDER BY id DESC LIMIT ?)",
+                    (FEE_DISAGREEMENTS_MAX,),
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Fee disagreement store failed: {e}")
+        return disagreed
+
+    def disagreements(self, county=None, limit=100):
+        """Recent live quotes that differed from their estimate, newest first"""
+        where, params = ("WHERE county = ?", [county.strip().lower()]) if county else ("", [])
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT plate, county, city, fields, estimated, live, confidence, checked_at"
+                f" FROM fee_disagreements {where} ORDER BY id DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [
+            {
+                "plate": plate, "county": county, "city": city, "fields": json.loads(fields),
+                "estimated": json.loads(estimated), "live": json.loads(live), "confidence": confidence,
+                "checkedAt": checked_at,
+            }
+            for plate, county, city, fields, estimated, live, confidence, checked_at in rows
+        ]
+
+
+fee_estimates = FeeEstimates()
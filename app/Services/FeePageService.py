@@ -0,0 +1,49 @@
+from Models.FeeSummary import FeeSummary
+from Services.HtmlPageService import parse_html
+
+FEE_SUMMARY_SELECTORS = {
+    "County": ".row > .col-md-2:nth-child(2) div:nth-child(2)",
+    "License": ".row > .col-md-2:nth-child(3) div:nth-child(2)",
+
+    "Make": ".row > .col-md-2:nth-child(4) div:nth-child(2)",
+    "Year": ".row > .col-md-2:nth-child(5) div:nth-child(2)",
+    "Exp Date": ".row > .col-md-2:nth-child(6) div:nth-child(2)",
+
+    "Registration": "#Registration\\ Display",
+    "Online Fee": "#Online\\ Fee\\ Display",
+    "Organ Donor Amount": "#Organ\\ Donor\\ Amount\\ Display",
+    "County Wheel Tax": "#County\\ Wheel\\ Tax\\ Display",
+    "City Wheel Tax": "#City\\ Wheel\\ Tax\\ Display",
+    "Mail Fee": "#Mail\\ Fee\\ Display",
+    "Subtotal": "#Subtotal\\ Display",
+    "Processing Fee": "#Processing\\ Fee\\ Display",
+    "Total": "#Total\\ Display",
+}
+
+# Reads every field in one WebDriver round trip. Elements that are not rendered report no
+# text, matching what WebElement.text returned for them.
+FEE_PAGE_SCRIPT = """
+var selectors = arguments[0], values = {};
+for (var field in selectors) {
+    var el = document.querySelector(selectors[field]);
+    values[field] = el && el.getClientRects().length ? (el.innerText || '').trim() : '';
+}
+return values;
+"""
+
+
+def read_fee_page(driver):
+    """Fee summary of the page the driver is on"""
+    return FeeSummary.from_fee_page(driver.execute_script(FEE_PAGE_SCRIPT, FEE_SUMMARY_SELECTORS))
+
+
+def read_fee_page_html(page):
+    """Fee summary of a parsed HtmlPage (HTTP fast path)"""
+    return FeeSummary.from_fee_page(
+        {field: page.text_or_default(css_selector) for field, css_selector in FEE_SUMMARY_SELECTORS.items()}
+    )
+
+
+def parse_fee_page_html(html: str):
+    """Fee summary of saved fee page HTML, for offline checks of the extraction"""
+    return read_fee_page_html(parse_html(html))
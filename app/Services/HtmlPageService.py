@@ -0,0 +1,355 @@
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr",
+}
+# tags whose start implicitly closes an open sibling of the same kind
+IMPLICIT_CLOSE = {
+    "option": {"option"},
+    "li": {"li"},
+    "p": {"p"},
+    "tr": {"tr", "td", "th"},
+    "td": {"td", "th"},
+    "th": {"td", "th"},
+}
+TEXTLESS_TAGS = {"script", "style", "head", "title", "noscript"}
+# an alert() call opening a statement, with a string literal message
+ALERT_PATTERN = re.compile(r"""\s*(?:window\.)?alert\(\s*(["'])(.*?)(?<!\\)\1\s*\)""", re.S)
+
+
+class HtmlElement:
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = {name: (value if value is not None else "") for name, value in attrs}
+        self.parent = parent
+        self.children = []
+
+    @property
+    def id(self):
+        return self.attrs.get("id")
+
+    @property
+    def classes(self):
+        return self.attrs.get("class", "").split()
+
+    @property
+    def elements(self):
+        return [child for child in self.children if isinstance(child, HtmlElement)]
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+    def iter(self):
+        for child in self.elements:
+            yield child
+            yield from child.iter()
+
+    def raw_text(self):
+        parts = []
+        for child in self.children:
+            if isinstance(child, HtmlElement):
+                if child.tag not in TEXTLESS_TAGS:
+                    parts.append(child.raw_text())
+            else:
+                parts.append(child)
+        return "".join(parts)
+
+    @property
+    def text(self):
+        """Whitespace-collapsed text content, close to what WebDriver reports"""
+        return " ".join(self.raw_text().split())
+
+    def select(self, selector):
+        return select(self, selector)
+
+    def select_one(self, selector):
+        found = self.select(selector)
+        return found[0] if found else None
+
+    def __repr__(self):
+        return f"<{self.tag} {self.attrs}>"
+
+
+class _TreeBuilder(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = HtmlElement("#document", [])
+        self.stack = [self.root]
+        self.scripts = []
+
+    def handle_starttag(self, tag, attrs):
+        closes = IMPLICIT_CLOSE.get(tag)
+        if closes:
+            for index in range(len(self.stack) - 1, 0, -1):
+                open_tag = self.stack[index].tag
+                if open_tag in closes:
+                    del self.stack[index:]
+                    break
+                if open_tag in {"select", "ul", "ol", "table", "tbody", "thead", "form", "div"}:
+                    break
+        element = HtmlElement(tag, attrs, self.stack[-1])
+        self.stack[-1].children.append(element)
+        if tag not in VOID_TAGS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        element = HtmlElement(tag, attrs, self.stack[-1])
+        self.stack[-1].children.append(element)
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+        if self.stack[-1].tag == "script":
+            self.scripts.append(data)
+
+
+class HtmlForm:
+    """Successful-control view of a <form>, as a browser would submit it"""
+
+    def __init__(self, element, base_url):
+        self.element = element
+        self.method = (element.get("method") or "get").lower()
+        self.action = urljoin(base_url, element.get("action") or base_url)
+        self.fields = []
+        for control in element.iter():
+            name = control.get("name")
+            if not name or "disabled" in control.attrs:
+                continue
+            if control.tag == "input":
+                kind = control.get("type", "text").lower()
+                if kind in ("submit", "button", "image", "reset", "file"):
+                    continue
+                if kind in ("checkbox", "radio") and "checked" not in control.attrs:
+                    continue
+                self.fields.append([name, control.get("value", "on" if kind in ("checkbox", "radio") else "")])
+            elif control.tag == "select":
+                options = [option for option in control.iter() if option.tag == "option"]
+                chosen = [option for option in options if "selected" in option.attrs] or options[:1]
+                for option in chosen:
+                    self.fields.append([name, option_value(option)])
+            elif control.tag == "textarea":
+                self.fields.append([name, control.raw_text()])
+
+    def set(self, name, value):
+        for field in self.fields:
+            if field[0] == name:
+                field[1] = value
+                return
+        self.fields.append([name, value])
+
+    def submit_with(self, button):
+        """Include the clicked submit button's name/value, as a browser does"""
+        if button is not None and button.get("name"):
+            self.fields.append([button.get("name"), button.get("value", "")])
+
+    def data(self):
+        return [(name, value) for name, value in self.fields]
+
+
+class HtmlPage:
+
+    def __init__(self, html, url):
+        builder = _TreeBuilder()
+        builder.feed(html)
+        builder.close()
+        self.url = url
+        self.root = builder.root
+        self.scripts = builder.scripts
+
+    def select(self, selector):
+        return select(self.root, selector)
+
+    def select_one(self, selector):
+        found = self.select(selector)
+        return found[0] if found else None
+
+    def text_or_default(self, selector, default_value=""):
+        element = self.select_one(selector)
+        return element.text if element is not None else default_value
+
+    def form_of(self, element):
+        while element is not None and element.tag != "form":
+            element = element.parent
+        return HtmlForm(element, self.url) if element is not None else None
+
+    def alerts(self):
+        """Messages the page's inline scripts alert() as soon as they run: alerts in comments,
+        in blocks (functions, handlers, if bodies) and behind a condition are not counted"""
+        return [
+            match.group(2)
+            for script in self.scripts
+            for statement in top_level_statements(script)
+            if (match := ALERT_PATTERN.match(statement))
+        ]
+
+
+def top_level_statements(script):
+    """The statements a script runs unconditionally at its top level, without comments; a
+    block ({...}) ends the statement it belongs to and its body is left out"""
+    statements, current, depth, index = [], [], 0, 0
+    while index < len(script):
+        char = script[index]
+        if script.startswith("//", index):
+            index = script.find("\n", index)
+            index = len(script) if index == -1 else index
+            continue
+        if script.startswith("/*", index):
+            index = script.find("*/", index + 2)
+            index = len(script) if index == -1 else index + 2
+            continue
+        if char in "'\"`":
+            end = index + 1
+            while end < len(script) and script[end] != char:
+                end += 2 if script[end] == "\\" else 1
+            if depth == 0:
+                current.append(script[index:end + 1])
+            index = end + 1
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth = max(depth - 1, 0)
+            if depth == 0:
+                statements.append("".join(current))
+                current = []
+        elif depth == 0:
+            if char == ";":
+                statements.append("".join(current))
+                current = []
+            else:
+                current.append(char)
+        index += 1
+    statements.append("".join(current))
+    return [statement for statement in statements if statement.strip()]
+
+
+def option_value(option):
+    return option.get("value", option.text)
+
+
+def parse_html(html, url=""):
+    return HtmlPage(html, url)
+
+
+# --- a small CSS selector engine covering the selectors used against the clerk site ---
+
+_COMPOUND = re.compile(
+    r"""(?P<tag>\*|[a-zA-Z][\w-]*)"""
+    r"""|\#(?P<id>(?:\\.|[\w-])+)"""
+    r"""|\.(?P<cls>(?:\\.|[\w-])+)"""
+    r"""|\[\s*(?P<attr>[\w-]+)\s*(?:(?P<op>[\^$*]?=)\s*(?P<quote>["']?)(?P<value>.*?)(?P=quote))?\s*\]"""
+    r"""|:nth-child\(\s*(?P<nth>\d+)\s*\)"""
+)
+_ESCAPE = re.compile(r"\\(.)")
+
+
+def _unescape(value):
+    return _ESCAPE.sub(r"\1", value)
+
+
+def _parse_compound(text):
+    position, tests = 0, []
+    while position < len(text):
+        match = _COMPOUND.match(text, position)
+        if not match:
+            raise ValueError(f"Unsupported selector: {text!r}")
+        position = match.end()
+        if match.group("tag"):
+            tag = match.group("tag").lower()
+            if tag != "*":
+                tests.append(lambda el, tag=tag: el.tag == tag)
+        elif match.group("id"):
+            tests.append(lambda el, value=_unescape(match.group("id")): el.id == value)
+        elif match.group("cls"):
+            tests.append(lambda el, value=_unescape(match.group("cls")): value in el.classes)
+        elif match.group("attr"):
+            tests.append(_attribute_test(match.group("attr"), match.group("op"), match.group("value")))
+        else:
+            tests.append(lambda el, n=int(match.group("nth")): _nth_child(el) == n)
+    return tests
+
+
+def _attribute_test(name, op, value):
+    if op is None:
+        return lambda el: name in el.attrs
+    if op == "=":
+        return lambda el: el.attrs.get(name) == value
+    if op == "^=":
+        return lambda el: el.attrs.get(name, "").startswith(value)
+    if op == "$=":
+        return lambda el: el.attrs.get(name, "").endswith(value)
+    return lambda el: value in el.attrs.get(name, "")
+
+
+def _nth_child(element):
+    if element.parent is None:
+        return 1
+    return element.parent.elements.index(element) + 1
+
+
+def _tokenize(selector):
+    """Split a complex selector into compounds and combinators, honouring escapes"""
+    tokens, current, index = [], "", 0
+    in_brackets = False
+    while index < len(selector):
+        char = selector[index]
+        if char == "\\" and index + 1 < len(selector):
+            current += selector[index:index + 2]
+            index += 2
+            continue
+        if char == "[":
+            in_brackets = True
+        elif char == "]":
+            in_brackets = False
+        if not in_brackets and (char.isspace() or char == ">"):
+            if current:
+                tokens.append(current)
+                current = ""
+            if char == ">":
+                tokens.append(">")
+            index += 1
+            continue
+        current += char
+        index += 1
+    if current:
+        tokens.append(current)
+
+    steps, combinator = [], " "
+    for token in tokens:
+        if token == ">":
+            combinator = ">"
+            continue
+        steps.append((combinator, _parse_compound(token)))
+        combinator = " "
+    return steps
+
+
+def _matches(element, steps):
+    combinator, tests = steps[-1]
+    if not all(test(element) for test in tests):
+        return False
+    if len(steps) == 1:
+        return True
+    ancestor = element.parent
+    if combinator == ">":
+        return ancestor is not None and ancestor.tag != "#document" and _matches(ancestor, steps[:-1])
+    while ancestor is not None and ancestor.tag != "#document":
+        if _matches(ancestor, steps[:-1]):
+            return True
+        ancestor = ancestor.parent
+    return False
+
+
+def select(root, selector):
+    groups = [_tokenize(part.strip()) for part in selector.split(",") if part.strip()]
+    return [element for element in root.iter() if any(_matches(element, steps) for steps in groups)]
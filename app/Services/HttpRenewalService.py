@@ -0,0 +1,241 @@
+import logging
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import urlencode, urljoin
+import urllib3
+from Models.QueryPriceRequest import QueryPriceRequest
+from Services.AddressService import full_address, prefetch_city_limits
+from Services.HtmlPageService import option_value, parse_html
+from Services.FeePageService import read_fee_page_html
+from Services.DeadlineService import Deadline, no_deadline
+from Services.ClerkErrors import FORM_PAGE_FIELDS, ClerkAlertError, UnrecognizedPageError
+
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_FAST_PATH_TIMEOUT = float(os.getenv("HTTP_FAST_PATH_TIMEOUT", "15"))
+MAX_REDIRECTS = 10
+MAX_PAGE_VISITS = 2
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0 Safari/537.36"
+)
+
+# One connection pool per process, shared by every fast-path query
+http_pool = urllib3.PoolManager(
+    maxsize=HTTP_POOL_MAXSIZE,
+    block=False,
+    retries=False,
+    timeout=urllib3.Timeout(total=HTTP_FAST_PATH_TIMEOUT),
+    headers={"User-Agent": USER_AGENT},
+)
+
+def warm_http_pool(url):
+    """Open a pooled connection to the clerk site so the first fast-path query skips the TLS handshake"""
+    try:
+        http_pool.request("HEAD", url, redirect=False).release_conn()
+    except Exception as e:
+        logging.info(f"Warming the HTTP pool for {url} failed: {e}")
+
+
+class HttpRenewalService:
+    """Browserless price lookup: replays the clerk site's form posts and parses the fee page"""
+
+    def __init__(self, form_data: QueryPriceRequest, pool=None, deadline: Deadline | None = None):
+        self.form_data = form_data
+        self.pool = pool if pool is not None else http_pool
+        self.deadline = deadline if deadline is not None else no_deadline()
+        self.cookies = {}
+        self.visits = {}
+        self.city_limits_lookup = None
+
+    def get_log_prefix(self):
+        return f"[Plate: {self.form_data.plateNumber}]"
+
+    def request(self, method, url, fields=None, referer=None):
+        """Issue a request, following redirects and keeping the session cookies"""
+        body = None
+        for _ in range(MAX_REDIRECTS):
+            headers = {}
+            if self.cookies:
+                headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+            if referer:
+                headers["Referer"] = referer
+            if method == "GET" and fields:
+                url = f"{url}{'&' if '?' in url else '?'}{urlencode(fields)}"
+                fields = None
+            if fields is not None:
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+                body = urlencode(fields)
+            self.deadline.check()
+            try:
+                response = self.pool.request(
+                    method, url, body=body, headers=headers, redirect=False,
+                    timeout=urllib3.Timeout(total=self.deadline.clamp(HTTP_FAST_PATH_TIMEOUT)),
+                )
+            except urllib3.exceptions.HTTPError as e:
+                # connection refused or reset, a timeout, a broken response: the browser may still get through
+                raise UnrecognizedPageError(f"{method} {url} failed: {e}") from e
+            for header in response.headers.getlist("Set-Cookie"):
+                cookie = SimpleCookie()
+                try:
+                    cookie.load(header)
+                except CookieError:
+                    continue
+                for name, morsel in cookie.items():
+                    self.cookies[name] = morsel.value
+            location = response.headers.get("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                referer = url
+                url = urljoin(url, location)
+                if response.status in (301, 302, 303):
+                    method, fields, body = "GET", None, None
+                continue
+            if response.status >= 400:
+                raise UnrecognizedPageError(f"HTTP {response.status} from {url}")
+            charset = response.headers.get("Content-Type", "").partition("charset=")[2] or "utf-8"
+            return parse_html(response.data.decode(charset.strip(), errors="replace"), url)
+        raise UnrecognizedPageError(f"Too many redirects from {url}")
+
+    def submit(self, page, form, button=None):
+        form.submit_with(button)
+        return self.request(form.method.upper(), form.action, form.data(), referer=page.url)
+
+    def identify(self, page):
+        if page.select_one("#shelby_address_verify") and page.select_one("#Total\\ Display"):
+            return "price_page"
+        if page.select_one("#streetnum") or page.select_one("#renewalSearchForm"):
+            return "street_number_page"
+        if page.select_one("#name"):
+            return "form_page"
+        if page.select_one("#newCountyID"):
+            return "county_page"
+        if page.select_one("#Total\\ Display"):
+            return "price_page"
+        if page.select_one("select[name='countylist']"):
+            return "county_list"
+        if page.select_one("form[name^='myform']"):
+            return "services_page"
+        if page.select_one("form[name='expressRenew']"):
+            return "plate_search_page"
+        return None
+
+    def process_query(self, landing_url):
+        """Walk the clerk site from the landing page to the fee page and return the fee summary"""
+        if (self.form_data.county or "").strip().lower() == "hamilton":
+            self.city_limits_lookup = prefetch_city_limits(full_address(self.form_data))
+        page = self.request("GET", landing_url)
+        while True:
+            state = self.identify(page)
+            if state is None:
+                raise UnrecognizedPageError(f"Unrecognized page at {page.url}")
+            self.visits[state] = self.visits.get(state, 0) + 1
+            if self.visits[state] > MAX_PAGE_VISITS:
+                raise UnrecognizedPageError(f"Stuck on {state} at {page.url}")
+            logging.info(f"{self.get_log_prefix()} HTTP fast path on {state}")
+            if state == "price_page":
+                return self.collect_form_data(page)
+            page = getattr(self, f"handle_{state}")(page)
+
+    def handle_county_list(self, page):
+        select = page.select_one("select[name='countylist']")
+        for option in select.select("option"):
+            if self.form_data.county.upper() in option.text.upper():
+                value = option_value(option)
+                break
+        else:
+            raise UnrecognizedPageError(f"County {self.form_data.county!r} not in countylist")
+        form = page.form_of(select)
+        if form is not None:
+            form.set(select.get("name"), value)
+            return self.submit(page, form)
+        # the county list navigates on change, so the option value is the services page URL
+        return self.request("GET", urljoin(page.url, value), referer=page.url)
+
+    def handle_services_page(self, page):
+        form = page.form_of(page.select_one("form[name^='myform']"))
+        if form is None:
+            raise UnrecognizedPageError(f"Services page without a <form> at {page.url}")
+        return self.submit(page, form)
+
+    def handle_plate_search_page(self, page):
+        plate_input = page.select_one("form[name='expressRenew'] input[name='plateNumber']")
+        if plate_input is None:
+            raise UnrecognizedPageError(f"expressRenew form without plateNumber at {page.url}")
+        form = page.form_of(plate_input)
+        if form is None:
+            raise UnrecognizedPageError(f"Plate search page without a <form> at {page.url}")
+        form.set("plateNumber", self.form_data.plateNumber)
+        return self.expect_progress("plate_search_page", self.submit(page, form))
+
+    def handle_street_number_page(self, page):
+        search_form = page.select_one("#renewalSearchForm")
+        if search_form is None:
+            raise UnrecognizedPageError(f"Street number page without #renewalSearchForm at {page.url}")
+        form = page.form_of(search_form)
+        if form is None:
+            raise UnrecognizedPageError(f"Street number page without a <form> at {page.url}")
+        street_input = page.select_one("#streetnum")
+        if street_input is not None:
+            form.set(street_input.get("name", "streetnum"), self.form_data.addressTwo.split(" ")[0])
+        form.set("platenum", self.form_data.plateNumber)
+        return self.expect_progress("street_number_page", self.submit(page, form))
+
+    def expect_progress(self, handled, page):
+        """After a plate search the clerk either moves on or answers with an alert(); the
+        page's alerts count only when it did not move on to another known page"""
+        if self.identify(page) not in (None, handled, "county_list"):
+            return page
+        alerts = page.alerts()
+        if alerts:
+            raise ClerkAlertError(alerts[0])
+        return page
+
+    def handle_form_page(self, page):
+        submit_button = page.select_one("#payrenewal_None")
+        form = page.form_of(submit_button if submit_button is not None else page.select_one("#name"))
+        if form is None:
+            raise UnrecognizedPageError(f"Form page without a <form> at {page.url}")
+        shelby_address_verify = page.select_one("#shelby_address_verify")
+        if shelby_address_verify is not None:
+            # the browser ticks it; without a name it only matters to page scripts, which only the browser runs
+            if not shelby_address_verify.get("name"):
+                raise UnrecognizedPageError("Shelby address check without a name needs the browser")
+            form.set(shelby_address_verify.get("name"), shelby_address_verify.get("value") or "on")
+        for field in FORM_PAGE_FIELDS:
+            self.set_field(page, form, f"#{field}", getattr(self.form_data, field))
+        self.set_field(page, form, "#confirmemail", self.form_data.email)
+        return self.submit(page, form, submit_button)
+
+    def handle_county_page(self, page):
+        select = page.select_one("#newCountyID")
+        form = page.form_of(select)
+        if form is None:
+            raise UnrecognizedPageError(f"County page without a <form> at {page.url}")
+        for option in select.select("option"):
+            if self.form_data.county.upper() in option.text.upper():
+                form.set(select.get("name", "newCountyID"), option_value(option))
+                break
+        return self.submit(page, form, page.select_one("#zipCodeSubmit"))
+
+    def set_field(self, page, form, css_selector, value):
+        element = page.select_one(css_selector)
+        if element is None or not element.get("name"):
+            return
+        if element.tag == "select":
+            # WebDriver send_keys on a <select> picks the option whose text matches what is typed
+            for option in element.select("option"):
+                if option.text.upper().startswith(value.upper()) or option_value(option) == value:
+                    value = option_value(option)
+                    break
+        form.set(element.get("name"), value)
+
+    def collect_form_data(self, page):
+        if page.select_one("#MVCityQty") and self.city_limits_lookup is not None:
+            try:
+                in_limits = self.city_limits_lookup.result(timeout=self.deadline.clamp(HTTP_FAST_PATH_TIMEOUT))
+            except FutureTimeoutError:
+                raise UnrecognizedPageError("City limits lookup did not finish in time") from None
+            if in_limits:
+                # the city wheel tax is recomputed by page scripts, which only the browser runs
+                raise UnrecognizedPageError("Hamilton address inside city limits needs the browser")
+        return read_fee_page_html(page).to_response()
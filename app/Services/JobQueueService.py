@@ -0,0 +1,320 @@
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from Services.MetricsService import JOB_RUN_DURATION, JOB_WAIT_DURATION, JOBS, registry
+
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "/tmp/jobs.sqlite3")
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "50"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+# hosts job results may be POSTed to, comma-separated; none configured means no callbacks
+JOB_CALLBACK_HOSTS = frozenset(
+    host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()
+)
+
+# completions pay for a customer who is waiting at checkout, so they jump ahead of quotes
+JOB_PRIORITIES = {"completion": 0, "quote": 1}
+TIMING_WINDOW = 200
+JOB_OUTCOMES = ("submitted", "rejected", "succeeded", "failed", "lost")
+LOST_JOB_ERROR = "The worker holding this job stopped before finishing it; submit it again"
+
+
+def _worker_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class QueueFullError(Exception):
+
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InvalidCallbackError(ValueError):
+    """A callback URL the server will not POST to: not https, or not an allowed host"""
+
+
+def check_callback_url(callback_url, allowed_hosts=JOB_CALLBACK_HOSTS):
+    """Refuse callback URLs that could point the server at its own network"""
+    if callback_url is None:
+        return
+    parts = urlsplit(callback_url)
+    if parts.scheme != "https" or not parts.hostname:
+        raise InvalidCallbackError("callback_url must be an https URL")
+    if parts.hostname.lower() not in allowed_hosts:
+        raise InvalidCallbackError(f"callback_url host {parts.hostname!r} is not allowed")
+
+
+class _RefuseRedirects(urllib.request.HTTPRedirectHandler):
+    """A redirect could send the result to a host the allow-list never saw"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_RefuseRedirects)
+
+
+class Job:
+
+    def __init__(self, kind, func, request, callback_url=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.request = request
+        self.callback_url = callback_url
+        self.submitted_at = time.time()
+
+
+class JobStore:
+    """Job status and results in SQLite, so any uvicorn worker can answer a poll.
+
+    Each row records the worker process holding the job: the queue itself lives in that
+    worker's memory, so its queued and running jobs are lost when it stops.
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, ttl=JOB_RESULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, status_code INTEGER,"
+                " result TEXT, error TEXT, submitted_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+                " expires_at REAL NOT NULL, worker_pid INTEGER)"
+            )
+            conn.execute("BEGIN IMMEDIATE")
+            if "worker_pid" not in [column[1] for column in conn.execute("PRAGMA table_info(jobs)")]:
+                conn.execute("ALTER TABLE jobs ADD COLUMN worker_pid INTEGER")
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def save(self, job, status, status_code=None, result=None, error=None, started_at=None, finished_at=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, status, status_code, result, error, submitted_at,"
+                " started_at, finished_at, expires_at, worker_pid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, status, status_code, None if result is None else json.dumps(result), error,
+                 job.submitted_at, started_at, finished_at, time.time() + self.ttl, os.getpid()),
+            )
+            conn.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ? AND expires_at > ?", (job_id, time.time())).fetchone()
+        if row is None:
+            return None
+        record = {key: row[key] for key in row.keys() if key not in ("expires_at", "worker_pid")}
+        record["result"] = json.loads(record["result"]) if record["result"] else None
+        return record
+
+    def fail_lost(self):
+        """Mark queued and running jobs as failed when the worker holding them is gone, or is
+        this one: called as a worker starts (a new process may reuse a dead worker's pid) and
+        as it stops. Returns the kind of each job marked."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, kind, worker_pid FROM jobs WHERE status IN ('queued', 'running') AND expires_at > ?",
+                    (now,),
+                ).fetchall()
+                lost = [
+                    (job_id, kind) for job_id, kind, worker_pid in rows
+                    if worker_pid is None or worker_pid == os.getpid() or not _worker_alive(worker_pid)
+                ]
+                conn.executemany(
+                    "UPDATE jobs SET status = 'failed', status_code = 503, error = ?, finished_at = ? WHERE id = ?",
+                    [(LOST_JOB_ERROR, now, job_id) for job_id, _ in lost],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return [kind for _, kind in lost]
+
+    def counts(self):
+        """Unexpired jobs by status, across every worker"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE expires_at > ? GROUP BY status", (time.time(),)
+            ).fetchall()
+        return dict(rows)
+
+
+class JobQueue:
+    """Bounded priority queue drained by a fixed set of worker threads, one per uvicorn worker"""
+
+    def __init__(self, store: JobStore, max_depth=JOB_QUEUE_MAX_DEPTH, workers=JOB_WORKERS):
+        self.store = store
+        self.max_depth = max_depth
+        self.workers = workers
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self._run_times = deque(maxlen=TIMING_WINDOW)
+
+    def _fail_lost(self):
+        try:
+            lost = self.store.fail_lost()
+        except sqlite3.Error as e:
+            logging.error(f"Failing lost jobs failed: {e}")
+            return
+        for kind in lost:
+            JOBS.inc(kind=kind, outcome="lost")
+        if lost:
+            logging.info(f"Marked {len(lost)} jobs failed whose worker stopped before finishing them")
+
+    def start(self):
+        if self._threads:
+            return
+        self._fail_lost()
+        with self._condition:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up, for the Retry-After header"""
+        with self._condition:
+            average_run = sum(self._run_times) / len(self._run_times) if self._run_times else 30.0
+            depth = len(self._heap)
+        return max(1, math.ceil(average_run * (depth - self.max_depth + 1) / max(1, self.workers)))
+
+    def submit(self, kind, func, request, callback_url=None):
+        check_callback_url(callback_url)
+        job = Job(kind, func, request, callback_url)
+        with self._condition:
+            full = len(self._heap) >= self.max_depth
+            if not full:
+                self.store.save(job, "queued")
+                heapq.heappush(self._heap, (JOB_PRIORITIES.get(kind, 1), next(self._sequence), job))
+                self._condition.notify()
+        JOBS.inc(kind=kind, outcome="rejected" if full else "submitted")
+        if full:
+            raise QueueFullError(self.retry_after())
+        return job
+
+    def record(self, kind, result, callback_url=None):
+        """Store an already-known result (e.g. a cached quote) as a finished job"""
+        check_callback_url(callback_url)
+        job = Job(kind, None, None, callback_url)
+        now = time.time()
+        self.store.save(job, "succeeded", 200, result, started_at=now, finished_at=now)
+        if callback_url:
+            threading.Thread(target=self._callback, args=(job,), daemon=True).start()
+        return job
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+            self._run(job)
+
+    def _run(self, job):
+        started_at = time.time()
+        self.store.save(job, "running", started_at=started_at)
+        try:
+            result = job.func(job.request)
+            status, status_code, error = "succeeded", 200, None
+        except Exception as e:
+            result = None
+            status, status_code = "failed", getattr(e, "status_code", 500)
+            error = str(getattr(e, "detail", e))
+            logging.error(f"Job {job.id} ({job.kind}) failed: {error}")
+        finished_at = time.time()
+        with self._condition:
+            self._run_times.append(finished_at - started_at)
+        JOB_WAIT_DURATION.observe(started_at - job.submitted_at, kind=job.kind)
+        JOB_RUN_DURATION.observe(finished_at - started_at, kind=job.kind)
+        JOBS.inc(kind=job.kind, outcome=status)
+        self.store.save(job, status, status_code, result, error, started_at, finished_at)
+        if job.callback_url:
+            self._callback(job)
+
+    def _callback(self, job):
+        payload = json.dumps(self.store.get(job.id)).encode()
+        request = urllib.request.Request(
+            job.callback_url, data=payload, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            with _callback_opener.open(request, timeout=JOB_CALLBACK_TIMEOUT):
+                pass
+        except Exception as e:
+            logging.error(f"Callback for job {job.id} to {job.callback_url} failed: {e}")
+
+    def depth(self):
+        """Jobs waiting in this worker's queue"""
+        with self._condition:
+            return len(self._heap)
+
+    def stats(self):
+        """The whole container's jobs: states from the store, outcomes and timings summed over
+        every worker's metrics. The limits are per uvicorn worker."""
+        statuses = self.store.counts()
+        outcomes = dict.fromkeys(JOB_OUTCOMES, 0)
+        for (_, outcome), count in registry.totals(JOBS.name).items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+        return {
+            "queue_depth": statuses.get("queued", 0),
+            "running": statuses.get("running", 0),
+            "max_depth_per_worker": self.max_depth,
+            "threads_per_worker": self.workers,
+            **outcomes,
+            "avg_wait_seconds": _average(registry.totals(JOB_WAIT_DURATION.name)),
+            "avg_run_seconds": _average(registry.totals(JOB_RUN_DURATION.name)),
+        }
+
+    def close(self):
+        """Stop taking jobs; whatever this worker still holds is marked failed in the store"""
+        with self._condition:
+            self._closed = True
+            self._heap.clear()
+            self._condition.notify_all()
+        self._fail_lost()
+
+
+def _average(histogram_totals):
+    total = sum(value[1] for value in histogram_totals.values())
+    count = sum(value[2] for value in histogram_totals.values())
+    return total / count if count else 0.0
+
+
+job_queue = JobQueue(JobStore())
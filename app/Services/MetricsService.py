@@ -0,0 +1,392 @@
+"""Minimal Prometheus-style metrics.
+
+Every uvicorn worker keeps its own registry and periodically writes a snapshot to
+METRICS_DIR; /metrics sums the snapshots of all live workers, so one scrape covers the
+whole container whichever worker answers it. Gauges are therefore reported as the sum
+across workers (active browsers, busy threads, ...).
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/vrs_metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# The values a county label takes besides "other": it comes from request input, and every
+# distinct value would be another series in every worker's snapshot
+TENNESSEE_COUNTIES = frozenset((
+    "anderson", "bedford", "benton", "bledsoe", "blount", "bradley", "campbell", "cannon", "carroll", "carter",
+    "cheatham", "chester", "claiborne", "clay", "cocke", "coffee", "crockett", "cumberland", "davidson",
+    "decatur", "dekalb", "dickson", "dyer", "fayette", "fentress", "franklin", "gibson", "giles", "grainger",
+    "greene", "grundy", "hamblen", "hamilton", "hancock", "hardeman", "hardin", "hawkins", "haywood",
+    "henderson", "henry", "hickman", "houston", "humphreys", "jackson", "jefferson", "johnson", "knox", "lake",
+    "lauderdale", "lawrence", "lewis", "lincoln", "loudon", "macon", "madison", "marion", "marshall", "maury",
+    "mcminn", "mcnairy", "meigs", "monroe", "montgomery", "moore", "morgan", "obion", "overton", "perry",
+    "pickett", "polk", "putnam", "rhea", "roane", "robertson", "rutherford", "scott", "sequatchie", "sevier",
+    "shelby", "smith", "stewart", "sullivan", "sumner", "tipton", "trousdale", "unicoi", "union", "van buren",
+    "warren", "washington", "wayne", "weakley", "white", "williamson", "wilson",
+))
+
+
+def county_label(county):
+    """Metric label for a county: "other" unless it is one of Tennessee's, in lower case"""
+    county = (county or "").strip().lower()
+    return county if county in TENNESSEE_COUNTIES else "other"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self):
+        if self.function is not None:
+            try:
+                self.set(self.function())
+            except Exception as e:
+                logging.error(f"Gauge {self.name} callback failed: {e}")
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (1 if value <= bound else 0) for c, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block took; an outcome label not given is "ok", or "error"
+        when the block raised"""
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            if "outcome" in self.labelnames:
+                labels.setdefault("outcome", outcome)
+            self.observe(time.monotonic() - started, **labels)
+
+
+class Registry:
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.metrics = {}
+        self._flusher = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def write_snapshot(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+
+    def start_flusher(self, interval=METRICS_FLUSH_INTERVAL):
+        def run():
+            while True:
+                try:
+                    self.write_snapshot()
+                except Exception as e:
+                    logging.error(f"Writing metrics snapshot failed: {e}")
+                time.sleep(interval)
+
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=run, daemon=True)
+            self._flusher.start()
+
+    def _worker_snapshots(self):
+        snapshots = [self.snapshot()]
+        if not os.path.isdir(self.directory):
+            return snapshots
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            pid = int(filename.split(".")[0])
+            if pid == os.getpid():
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                os.remove(path)
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def _merged(self):
+        merged = {}
+        for snapshot in self._worker_snapshots():
+            for name, values in snapshot.items():
+                target = merged.setdefault(name, {})
+                for key, value in values.items():
+                    if isinstance(value, (list, tuple)):
+                        counts, total, count = value
+                        previous = target.get(key, [[0] * len(counts), 0.0, 0])
+                        target[key] = [[a + b for a, b in zip(previous[0], counts)], previous[1] + total, previous[2] + count]
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def totals(self, name):
+        """A counter or gauge summed over every worker, keyed by its label values"""
+        return {tuple(json.loads(key)): value for key, value in self._merged().get(name, {}).items()}
+
+    def render(self):
+        """Prometheus text exposition of every worker's metrics, summed"""
+        merged = self._merged()
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, json.loads(key)))
+                if metric.kind == "histogram":
+                    counts, total, count = value
+                    for bound, bucket_count in zip(metric.buckets, counts):
+                        lines.append(f"{name}_bucket{_labels(labels + [('le', bound)])} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+registry = Registry()
+
+STAGE_DURATION = registry.histogram(
+    "renewal_stage_duration_seconds", "Time spent in each renewal flow stage",
+    ("stage", "county", "outcome"),
+)
+WAIT_DURATION = registry.histogram(
+    "renewal_wait_duration_seconds", "Time spent in condition-based waits", ("step", "outcome"),
+)
+FORM_VALIDATION_ERRORS = registry.counter(
+    "renewal_form_validation_errors_total", "swal2 validation dialogs shown after submit_form", ("county",),
+)
+FORM_RETRIES = registry.counter(
+    "renewal_form_retries_total", "Form resubmissions after a validation dialog", ("county",),
+)
+CLERK_ALERTS = registry.counter(
+    "renewal_clerk_alerts_total", "JavaScript alerts raised by the clerk site", ("stage", "county"),
+)
+CENSUS_DURATION = registry.histogram(
+    "census_geocode_duration_seconds", "Census geocoder request latency", ("endpoint", "outcome"),
+)
+GEOCODE_CACHE_LOOKUPS = registry.counter(
+    "geocode_cache_lookups_total", "City-limits geocode cache lookups", ("result",),
+)
+BROWSER_LAUNCH_DURATION = registry.histogram(
+    "browser_launch_duration_seconds", "Time to launch a Chrome driver", ("outcome",),
+)
+HTTP_FAST_PATH = registry.counter(
+    "http_fast_path_total", "Price queries attempted over plain HTTP", ("outcome",),
+)
+THREAD_POOL_BUSY = registry.gauge(
+    "thread_pool_busy_threads", "Renewal threads currently running",
+)
+BLOCKED_REQUESTS = registry.counter(
+    "browser_blocked_requests_total", "Browser requests blocked by the DevTools block list", ("resource_type",),
+)
+TRANSFERRED_BYTES = registry.counter(
+    "browser_transferred_bytes_total", "Bytes the browser downloaded from the network", ("resource_type",),
+)
+BROWSER_ADMISSIONS = registry.counter(
+    "browser_admissions_total", "Browser launch requests by admission outcome (admitted, queued, shed)",
+    ("outcome",),
+)
+BROWSER_RECYCLES = registry.counter(
+    "browser_recycles_total", "Pooled browsers quit instead of reused", ("reason",),
+)
+COALESCED_REQUESTS = registry.counter(
+    "coalesced_price_queries_total", "Price queries that shared another request's browser run", ("scope",),
+)
+COLD_START_DURATION = registry.histogram(
+    "cold_start_duration_seconds", "Seconds from process start to the end of each start-up phase, per worker",
+    ("phase",),
+)
+STEP_RETRIES = registry.counter(
+    "renewal_step_retries_total", "Page steps handled again after a transient failure or revisit", ("step", "reason"),
+)
+STEP_RETRY_DURATION = registry.histogram(
+    "renewal_step_retry_duration_seconds", "Backoff plus handler time of each page step retry", ("step",),
+)
+SESSION_RESTARTS = registry.counter(
+    "renewal_session_restarts_total", "Browser flows started over in a new session after an unrecoverable page",
+    ("county",),
+)
+QUOTE_CACHE_LOOKUPS = registry.counter(
+    "quote_cache_lookups_total", "Quote cache lookups by result (hit, miss)", ("result",),
+)
+ALERT_CACHE_LOOKUPS = registry.counter(
+    "alert_cache_lookups_total", "Clerk alert cache lookups by result and cached alert category",
+    ("result", "category"),
+)
+COUNTY_PROFILE_RUNS = registry.counter(
+    "county_profile_runs_total", "Completed runs folded into county flow profiles (learned, matched, diverged)",
+    ("county", "outcome"),
+)
+SPECULATIVE_SESSIONS = registry.counter(
+    "speculative_sessions_total",
+    "Warm-up sessions by outcome (started, skipped, parked, alert, failed, attached, broken)",
+    ("outcome",),
+)
+FEE_ESTIMATES = registry.counter(
+    "fee_estimates_total", "Fee-table estimates served by confidence level, or unavailable without data",
+    ("county", "outcome"),
+)
+FEE_ESTIMATE_CHECKS = registry.counter(
+    "fee_estimate_checks_total", "Live quotes compared with the estimate given for them (agreed, disagreed)",
+    ("county", "outcome"),
+)
+ABANDONED_RUNS = registry.counter(
+    "renewal_runs_abandoned_total", "Browser runs stopped early because the caller left or the deadline passed",
+    ("reason",),
+)
+REQUESTS = registry.counter(
+    "renewal_requests_total", "Renewal requests by endpoint and status", ("endpoint", "status"),
+)
+JOBS = registry.counter(
+    "jobs_total", "Background jobs by kind and outcome (submitted, rejected, succeeded, failed, lost)",
+    ("kind", "outcome"),
+)
+JOB_WAIT_DURATION = registry.histogram(
+    "job_wait_duration_seconds", "Time background jobs spent queued before a worker thread took them", ("kind",),
+)
+JOB_RUN_DURATION = registry.histogram(
+    "job_run_duration_seconds", "Time background jobs took to run", ("kind",),
+)
+
+
+def _observe_stage(stage, county, started, outcome):
+    STAGE_DURATION.observe(time.monotonic() - started, stage=stage, county=county, outcome=outcome)
+    if outcome == "alert":
+        CLERK_ALERTS.inc(stage=stage, county=county)
+
+
+def _stage_outcome(result):
+    return "alert" if isinstance(result, str) and result else "ok"
+
+
+def timed_stage(stage):
+    """Record a RenewalService step in the stage histogram. A step that returns a string
+    is reporting clerk alert text, which is counted as an alert outcome. Works on the
+    coroutine methods of the DevTools engine as well."""
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                county = county_label(self.form_data.county)
+                started = time.monotonic()
+                outcome = "error"
+                try:
+                    result = await method(self, *args, **kwargs)
+                    outcome = _stage_outcome(result)
+                    return result
+                finally:
+                    _observe_stage(stage, county, started, outcome)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            county = county_label(self.form_data.county)
+            started = time.monotonic()
+            outcome = "error"
+            try:
+                result = method(self, *args, **kwargs)
+                outcome = _stage_outcome(result)
+                return result
+            finally:
+                _observe_stage(stage, county, started, outcome)
+        return wrapper
+    return decorator
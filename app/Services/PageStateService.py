@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import os
+import time
+from Services.MetricsService import STAGE_DURATION, STEP_RETRIES, STEP_RETRY_DURATION
+
+PAGE_FLOW_TIMEOUT = float(os.getenv("PAGE_FLOW_TIMEOUT", "90"))
+PAGE_STATE_TIMEOUT = float(os.getenv("PAGE_STATE_TIMEOUT", "15"))
+# a step is handled at most 1 + PAGE_STEP_RETRIES times before the page counts as stuck
+PAGE_STEP_RETRIES = int(os.getenv("PAGE_STEP_RETRIES", "2"))
+PAGE_RETRY_BACKOFF = float(os.getenv("PAGE_RETRY_BACKOFF", "0.5"))
+PAGE_RETRY_BACKOFF_MAX = float(os.getenv("PAGE_RETRY_BACKOFF_MAX", "4"))
+# fresh browser sessions a flow may start over in once its page state is unrecoverable
+PAGE_FLOW_RESTARTS = int(os.getenv("PAGE_FLOW_RESTARTS", "1"))
+MAX_STATE_VISITS = 1 + PAGE_STEP_RETRIES
+
+# States that mean "look again": the page is mid-navigation or not one we know yet
+TRANSIENT_STATES = ("loading", "unknown")
+
+# Legacy StepTimings names for the waits that replaced fixed sleeps, so reports stay comparable
+STATE_WAIT_STEPS = {"county_list": "county_selection", "form_page": "submit_form"}
+
+# Identifies the clerk page in one round trip; the order matters where pages share elements
+PAGE_STATE_SCRIPT = """
+var q = function (s) { return document.querySelector(s); };
+var shown = function (el) { return !!el && el.getClientRects().length > 0; };
+var state;
+if (location.href.replace(/\\/\\//g, '/').indexOf('renewalconfirm') !== -1) state = 'successful_payment';
+else if (q('#payrenewal_None') && shown(q('div.swal2-header'))) state = 'validation_dialog';
+else if (q('#shelby_address_verify') && q('#Total\\\\ Display')) state = 'price_page';
+else if (q('#streetnum') || q('#renewalSearchForm')) state = 'street_number_page';
+else if (q('#name')) state = 'form_page';
+else if (q('#newCountyID')) state = 'county_page';
+else if (q('#Total\\\\ Display')) state = 'price_page';
+else if (q("select[name='countylist']")) state = 'county_list';
+else if (q("form[name^='myform']")) state = 'services_page';
+else if (q("form[name='expressRenew']")) state = 'plate_search_page';
+else if (document.readyState !== 'complete') state = 'loading';
+else state = 'unknown';
+return state;
+"""
+
+PAGE_IDLE_SCRIPT = (
+    "return document.readyState === 'complete' "
+    "&& (!window.jQuery || window.jQuery.active === 0);"
+)
+
+
+class PageFlowError(Exception):
+    """The browser flow could not reach its target page"""
+
+
+class PageStateMachine:
+    """Drives a RenewalService through the clerk site one detected page at a time.
+
+    Each step probes the page once, runs only the service's handle_<state> method for it and
+    then waits for the page to change, stopping as soon as a target state is reached.
+
+    The page reached so far is the checkpoint. A handler failing with one of the service's
+    TRANSIENT_ERRORS, or a page coming back (a validation dialog sends the flow back to the
+    form), is retried from the current page after an exponential backoff. Anything else, or
+    a step out of retries, raises PageFlowError for the service to start a new session.
+    """
+
+    def __init__(self, service, timeout=PAGE_FLOW_TIMEOUT, state_timeout=PAGE_STATE_TIMEOUT):
+        self.service = service
+        self.timeout = timeout
+        self.state_timeout = state_timeout
+        self.alert_text = None
+        self.visits = {}
+        self.trace = []
+        self.retries = {}
+        self._failures = {}
+        self._started = None
+
+    def restart(self):
+        """Start counting visits afresh for a new browser session; the trace and retry totals carry over"""
+        self.visits = {}
+        self._failures = {}
+        self.alert_text = None
+        self.trace.append({"state": "session_restart", "at": round(self.elapsed(), 3) if self._started else 0.0})
+
+    def detect(self):
+        """The current page state; 'clerk_alert' when the site answered with an alert()"""
+        from selenium.common.exceptions import UnexpectedAlertPresentException, WebDriverException
+
+        try:
+            return self.service.driver.execute_script(PAGE_STATE_SCRIPT) or "unknown"
+        except UnexpectedAlertPresentException as e:
+            # chromedriver dismisses the alert and reports its text with the exception
+            self.alert_text = e.alert_text or self.alert_text
+            return "clerk_alert"
+        except WebDriverException:
+            return "loading"
+
+    def wait_for_state(self, previous, step):
+        """Wait until the page settles on a state other than the one just handled"""
+        def changed(driver):
+            state = self.detect()
+            return state if state not in TRANSIENT_STATES and state != previous else False
+
+        state = self.service.wait_for_condition(step, changed, timeout=self.state_timeout)
+        if state:
+            return state
+        state = self.detect()
+        if state in TRANSIENT_STATES:
+            raise PageFlowError(f"Page did not settle after {previous or 'navigation'} at {self.current_url()}")
+        return state
+
+    def current_url(self):
+        try:
+            return self.service.driver.current_url
+        except Exception:
+            return "unknown url"
+
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    def _refusal(self, state, entered_at):
+        """Why the flow may not handle state now, or None when it may"""
+        if entered_at > self.timeout:
+            return f"Gave up on {state} after {self.timeout}s"
+        self.visits[state] = self.visits.get(state, 0) + 1
+        if self.visits[state] > MAX_STATE_VISITS:
+            return f"Stuck on {state}"
+        if not hasattr(self.service, f"handle_{state}"):
+            return f"No handler for {state}"
+        logging.info(f"{self.service.get_log_prefix()} Page state {state}")
+        return None
+
+    def _backoff(self, state):
+        """Seconds to wait before handling state again; 0 on its first visit"""
+        attempt = self.visits[state] - 1
+        if attempt < 1:
+            return 0.0
+        reason = self._failures.pop(state, "revisit")
+        retries = self.retries.setdefault(state, {"count": 0, "seconds": 0.0, "reasons": {}})
+        retries["count"] += 1
+        retries["reasons"][reason] = retries["reasons"].get(reason, 0) + 1
+        STEP_RETRIES.inc(step=state, reason=reason)
+        delay = min(PAGE_RETRY_BACKOFF_MAX, PAGE_RETRY_BACKOFF * 2 ** (attempt - 1))
+        logging.info(f"{self.service.get_log_prefix()} Retrying {state} ({reason}) in {delay:.2f}s")
+        return delay
+
+    def _transient_failure(self, state, error):
+        self._failures[state] = type(error).__name__
+        logging.info(f"{self.service.get_log_prefix()} Transient failure on {state}: {error!r}")
+
+    def _record(self, state, entered_at, started, outcome, retry_delay=0.0):
+        handled = time.monotonic() - started
+        self.trace.append({
+            "state": state, "at": round(entered_at, 3), "handler_seconds": round(handled, 3), "outcome": outcome,
+        })
+        STAGE_DURATION.observe(
+            handled, stage=state, county=self.service.county_label(self.service.form_data), outcome=outcome,
+        )
+        if self.visits.get(state, 0) > 1:
+            # time spent retrying: the backoff plus the repeated handler run
+            self.retries[state]["seconds"] = round(self.retries[state]["seconds"] + retry_delay + handled, 3)
+            STEP_RETRY_DURATION.observe(retry_delay + handled, step=state)
+
+    def _reached(self, state, targets, entered_at):
+        if state in targets:
+            self.trace.append({"state": state, "at": round(entered_at, 3)})
+            return True
+        return False
+
+    def run(self, targets):
+        """Handle pages until one of the target states is reached, and return it"""
+        targets = (targets,) if isinstance(targets, str) else tuple(targets)
+        self._started = time.monotonic()
+        state = self.wait_for_state(None, "initial_page")
+        while True:
+            entered_at = self.elapsed()
+            if self._reached(state, targets, entered_at):
+                return state
+            self.service.deadline.check()
+            refusal = self._refusal(state, entered_at)
+            if refusal:
+                raise PageFlowError(f"{refusal} at {self.current_url()}")
+            delay = self._backoff(state)
+            if delay:
+                self.service.deadline.sleep(delay)
+            started = time.monotonic()
+            outcome = "error"
+            try:
+                getattr(self.service, f"handle_{state}")()
+                outcome = "ok"
+            except getattr(self.service, "TRANSIENT_ERRORS", ()) as e:
+                outcome = "transient"
+                self._transient_failure(state, e)
+            except Exception:
+                if state == "clerk_alert":
+                    outcome = "alert"
+                raise
+            finally:
+                self._record(state, entered_at, started, outcome, delay)
+            if outcome == "transient":
+                # resume from whatever page the failed step left the browser on
+                state = self.wait_for_state(None, f"{state}_recovery")
+                continue
+            state = self.wait_for_state(state, STATE_WAIT_STEPS.get(state, f"{state}_transition"))
+
+
+class AsyncPageStateMachine(PageStateMachine):
+    """PageStateMachine for the DevTools engine: the same probe, handlers and limits, with the
+    service's tab and handle_<state> methods awaited instead of called"""
+
+    async def detect(self):
+        tab = self.service.tab
+        alert_text = tab.take_dialog_text()
+        if alert_text is None:
+            try:
+                return await tab.execute_script(PAGE_STATE_SCRIPT) or "unknown"
+            except Exception:
+                # the execution context is torn down while a navigation commits
+                alert_text = tab.take_dialog_text()
+                if alert_text is None:
+                    return "loading"
+        # the tab accepts dialogs as they open, as chromedriver dismisses them
+        self.alert_text = alert_text
+        return "clerk_alert"
+
+    async def wait_for_state(self, previous, step):
+        async def changed():
+            state = await self.detect()
+            return state if state not in TRANSIENT_STATES and state != previous else False
+
+        state = await self.service.wait_for_condition(step, changed, timeout=self.state_timeout)
+        if state:
+            return state
+        state = await self.detect()
+        if state in TRANSIENT_STATES:
+            raise PageFlowError(
+                f"Page did not settle after {previous or 'navigation'} at {await self.current_url()}"
+            )
+        return state
+
+    async def current_url(self):
+        try:
+            return await self.service.tab.current_url()
+        except Exception:
+            return "unknown url"
+
+    async def run(self, targets):
+        targets = (targets,) if isinstance(targets, str) else tuple(targets)
+        self._started = time.monotonic()
+        state = await self.wait_for_state(None, "initial_page")
+        while True:
+            entered_at = self.elapsed()
+            if self._reached(state, targets, entered_at):
+                return state
+            self.service.deadline.check()
+            refusal = self._refusal(state, entered_at)
+            if refusal:
+                raise PageFlowError(f"{refusal} at {await self.current_url()}")
+            delay = self._backoff(state)
+            if delay:
+                await asyncio.sleep(self.service.deadline.clamp(delay))
+                self.service.deadline.check()
+            started = time.monotonic()
+            outcome = "error"
+            try:
+                await getattr(self.service, f"handle_{state}")()
+                outcome = "ok"
+            except getattr(self.service, "TRANSIENT_ERRORS", ()) as e:
+                outcome = "transient"
+                self._transient_failure(state, e)
+            except Exception:
+                if state == "clerk_alert":
+                    outcome = "alert"
+                raise
+            finally:
+                self._record(state, entered_at, started, outcome, delay)
+            if outcome == "transient":
+                state = await self.wait_for_state(None, f"{state}_recovery")
+                continue
+            state = await self.wait_for_state(state, STATE_WAIT_STEPS.get(state, f"{state}_transition"))
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from Models.QueryPriceRequest import QueryPriceRequest
+from Services.AddressService import normalize_address
+from Services.MetricsService import QUOTE_CACHE_LOOKUPS, registry
+
+QUOTE_CACHE_PATH = os.getenv("QUOTE_CACHE_PATH", "/tmp/quote_cache.sqlite3")
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "900"))
+QUOTE_CACHE_MAX_ENTRIES = int(os.getenv("QUOTE_CACHE_MAX_ENTRIES", "10000"))
+
+
+def quote_key(request: QueryPriceRequest):
+    """Plate + county + normalized address; other form fields do not change the fee"""
+    address = normalize_address(f"{request.addressTwo} {request.city} {request.state} {request.zip}")
+    raw = f"{request.plateNumber.strip().upper()}|{request.county.strip().lower()}|{address}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class QuoteCache:
+    """Fee summaries shared by every uvicorn worker through a SQLite file in WAL mode"""
+
+    def __init__(self, path=QUOTE_CACHE_PATH, ttl=QUOTE_CACHE_TTL, max_entries=QUOTE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quotes ("
+                " key TEXT PRIMARY KEY, plate TEXT NOT NULL, county TEXT NOT NULL,"
+                " fee_summary TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS quotes_expires_at ON quotes (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS quotes_plate ON quotes (plate, county)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, request: QueryPriceRequest):
+        """A read only: hits and misses are counted in the worker's metrics, not in SQLite"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT fee_summary FROM quotes WHERE key = ? AND expires_at > ?",
+                    (quote_key(request), time.time()),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Quote cache lookup failed: {e}")
+            return None
+        QUOTE_CACHE_LOOKUPS.inc(result="hit" if row else "miss")
+        return json.loads(row[0]) if row else None
+
+    def put(self, request: QueryPriceRequest, fee_summary):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO quotes (key, plate, county, fee_summary, created_at, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (quote_key(request), request.plateNumber.strip().upper(), request.county.strip().lower(),
+                     json.dumps(fee_summary), now, now + self.ttl),
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logging.error(f"Quote cache store failed: {e}")
+
+    def _evict(self, conn, now):
+        expired = conn.execute("DELETE FROM quotes WHERE expires_at <= ?", (now,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM quotes WHERE key IN ("
+            " SELECT key FROM quotes ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        return expired + overflow
+
+    def evict_expired(self):
+        with self._connect() as conn:
+            return self._evict(conn, time.time())
+
+    def _filter(self, plate=None, county=None):
+        clauses, params = [], []
+        if plate:
+            clauses.append("plate = ?")
+            params.append(plate.strip().upper())
+        if county:
+            clauses.append("county = ?")
+            params.append(county.strip().lower())
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def invalidate(self, plate=None, county=None):
+        """Drop cached quotes matching every filter given (a plate, a county, or both), or everything"""
+        where, params = self._filter(plate, county)
+        with self._connect() as conn:
+            return conn.execute(f"DELETE FROM quotes{where}", params).rowcount
+
+    def stats(self):
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM quotes WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        lookups = registry.totals(QUOTE_CACHE_LOOKUPS.name)
+        hits, misses = lookups.get(("hit",), 0), lookups.get(("miss",), 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": entries,
+        }
+
+
+quote_cache = QuoteCache()
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import time
+from Services.MetricsService import COLD_START_DURATION
+
+READINESS_DIR = os.getenv("READINESS_DIR", "/tmp/vrs_ready")
+
+_imported_at = time.monotonic()
+
+
+def process_age_seconds():
+    """Seconds since this process was started, including interpreter start-up and imports"""
+    try:
+        with open("/proc/self/stat") as f:
+            # the command name may contain spaces; fields after it are space separated
+            started_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - started_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.monotonic() - _imported_at
+
+
+def _worker_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Readiness:
+    """Start-up progress of each uvicorn worker, shared through one small file per worker,
+    so /ready reports the whole container whichever worker answers it"""
+
+    def __init__(self, directory=READINESS_DIR):
+        self.directory = directory
+        self.phases = {}
+        self.ready = False
+        self.error = None
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"ready": self.ready, "phases": self.phases, "error": self.error}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def phase(self, name):
+        """Record that a start-up phase finished, as seconds since the process started"""
+        elapsed = process_age_seconds()
+        self.phases[name] = round(elapsed, 3)
+        COLD_START_DURATION.observe(elapsed, phase=name)
+        logging.info(f"Cold start: {name} done after {elapsed:.2f}s")
+        try:
+            self._write()
+        except OSError as e:
+            logging.error(f"Writing readiness failed: {e}")
+
+    def fail(self, error):
+        self.error = str(error)
+
+    def mark_ready(self):
+        self.ready = True
+        self.phase("ready")
+
+    def workers(self):
+        """Start-up state of every live worker, keyed by pid"""
+        workers = {}
+        if not os.path.isdir(self.directory):
+            return workers
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            pid = int(filename.split(".")[0])
+            path = os.path.join(self.directory, filename)
+            if not _worker_alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    workers[pid] = json.load(f)
+            except (OSError, ValueError):
+                workers[pid] = {"ready": False}
+        return workers
+
+    def container_ready(self):
+        workers = self.workers()
+        return bool(workers) and all(worker.get("ready") for worker in workers.values())
+
+
+readiness = Readiness()
@@ -1,261 +1,300 @@
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import Select
-from selenium.webdriver.chrome.options import Options
 from Models.QueryPriceRequest import QueryPriceRequest
 from Models.CompleteTransactionRequest import CompleteTransactionRequest
-from Services.AddressService import is_in_city_limits
+from Services.AddressService import (
+    CENSUS_TIMEOUT, CITY_LIMITS_WAIT, full_address, is_in_city_limits, prefetch_city_limits,
+)
+from Services.DriverPoolService import DRIVER_POOL_ACQUIRE_TIMEOUT, driver_pool
+from Services.DeadlineService import Deadline, DeadlineExceededError, RunCancelledError, no_deadline
+from Services.StepTimingService import StepTimings
+from Services.FeePageService import read_fee_page
+from Services.ResourceBlockingService import collect_resource_usage
+from Services.MetricsService import (
+    FORM_RETRIES, FORM_VALIDATION_ERRORS, SESSION_RESTARTS, STAGE_DURATION, WAIT_DURATION, county_label,
+    timed_stage,
+)
+from Services.PageStateService import PAGE_FLOW_RESTARTS, PAGE_IDLE_SCRIPT, PageFlowError, PageStateMachine
+from Services.ClerkErrors import FORM_PAGE_FIELDS, ClerkAlertError
+from Services.CountyProfileService import SELECT_VALUE_SCRIPT, county_profiles
+from selenium.common.exceptions import (
+    ElementClickInterceptedException, ElementNotInteractableException, NoSuchElementException,
+    StaleElementReferenceException, TimeoutException, WebDriverException,
+)
 import time
-import os
-
 
 class RenewalService:
-
-    def __init__(self, form_data: QueryPriceRequest | CompleteTransactionRequest):
+    # handler failures retried on the same page: it was still rendering, or re-rendered under us
+    TRANSIENT_ERRORS = (
+        TimeoutException, StaleElementReferenceException, NoSuchElementException,
+        ElementNotInteractableException, ElementClickInterceptedException,
+    )
+
+    def __init__(self, form_data: QueryPriceRequest | CompleteTransactionRequest, driver=None,
+                 timings: StepTimings | None = None, deadline: Deadline | None = None):
         logging.basicConfig(level=logging.INFO)
         plate_info = f" [Plate: {form_data.plateNumber}]" if hasattr(form_data, 'plateNumber') else ""
         logging.info(f"Initializing RenewalService{plate_info}")
 
-        options = Options()
-        options.add_argument("--headless")  # Add this line to enable headless mode
-        options.add_argument("--no-sandbox")  # Optional: For environments like Docker
-        options.add_argument("--disable-dev-shm-usage")  # Optional: Prevents memory issues in headless mode
-        prefs = {"profile.managed_default_content_settings.images": 2}
-        options.add_experimental_option("prefs", prefs)
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-software-rasterizer")
-        options.add_argument("--disable-background-timer-throttling")
-        options.add_argument("--disable-backgrounding-occluded-windows")
-        options.add_argument("--disable-client-side-phishing-detection")
-        options.add_argument("--disable-default-apps")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-sync")
-
-        self.driver = webdriver.Chrome(options=options)
+        # every wait below is bounded by what is left of the request's budget
+        self.deadline = deadline if deadline is not None else no_deadline()
+        if driver is None:
+            driver = self.acquire_driver(form_data)
+        self.driver = driver
 
         self.form_data = form_data
+        self.timings = timings if timings is not None else StepTimings()
+        self.city_limits_lookup = None
+        self.landing_url = None
+        self.page_flow = PageStateMachine(self)
+        self.county_profile = county_profiles.get(form_data.county) or {}
+        # what this run saw of its county, for record_county_profile
+        self.profile_observations = {}
+
+    def release(self, discard=False):
+        """Hand the browser back to the pool once the request is finished with it"""
+        if self.driver is None:
+            return
+        driver, self.driver = self.driver, None
+        usage = collect_resource_usage(driver)
+        logging.info(f"{self.get_log_prefix()} Browser network usage: {usage.report()}")
+        driver_pool.release(driver, discard=discard)
+
+    def acquire_driver(self, form_data):
+        self.deadline.check()
+        with STAGE_DURATION.time(stage="driver_start", county=self.county_label(form_data)):
+            return driver_pool.acquire(timeout=self.deadline.clamp(DRIVER_POOL_ACQUIRE_TIMEOUT))
+
+    @staticmethod
+    def county_label(form_data):
+        return county_label(form_data.county)
+
+    @timed_stage("driver_get")
+    def open_landing_page(self, url):
+        self.landing_url = url
+        self.driver.get(url)
 
     def get_log_prefix(self):
         """Helper method to create consistent log prefix with plate number"""
         return f"[Plate: {self.form_data.plateNumber}]" if hasattr(self.form_data, 'plateNumber') else ""
 
+    def within_deadline(self, condition):
+        """condition, made to stop the wait it is polled in once the run is cancelled or overdue"""
+        def checked(driver):
+            self.deadline.check()
+            return condition(driver)
+        return checked
+
     def wait_for_element(self, locator, timeout=10):
         logging.info(f"{self.get_log_prefix()} Waiting for element: {locator}")
-        return WebDriverWait(self.driver, timeout).until(EC.presence_of_element_located(locator))
-
-    def fill_form_page(self):
-        logging.info(f"{self.get_log_prefix()} Filling out the form page")
+        return WebDriverWait(self.driver, self.deadline.clamp(timeout)).until(
+            self.within_deadline(EC.presence_of_element_located(locator))
+        )
 
-        try:
-            form_fields = {
-                "name": self.form_data.name,
-                "addressTwo": self.form_data.addressTwo,
-                "city": self.form_data.city,
-                "state": self.form_data.state,
-                "homePhone0": self.form_data.homePhone0,
-                "homePhone1": self.form_data.homePhone1,
-                "homePhone2": self.form_data.homePhone2,
-                "email": self.form_data.email,
-                "zip": self.form_data.zip
-            }
-            
+    def wait_for_condition(self, step, condition, timeout=10):
+        """Wait for a page condition instead of sleeping; returns None on timeout"""
+        started = time.monotonic()
+        with self.timings.measure(step):
             try:
-                shelby_address_verify = self.driver.find_element(By.CSS_SELECTOR, "#shelby_address_verify")
-                self.driver.execute_script("arguments[0].click();", shelby_address_verify)
-                form_fields["confirmEmail"] = self.form_data.email #confirm email needed on shelby address verify
-                logging.info(f"{self.get_log_prefix()} Shelby address verified successfully")
-            except Exception as e:
-                pass
-
-            for field, value in form_fields.items():
-                if field == 'zip':
-                    try:
-
-                        zip_element = WebDriverWait(self.driver, 10).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, "#zip"))
-                        )
-
-                        # Once the name element is found, send the name to the input field
-                        zip_element.send_keys(value)
-                        time.sleep(2)
-                    except Exception as e:
-                        
-                        time.sleep(2)
-                else:
-                    try:
-                        
-                        element = self.wait_for_element((By.CSS_SELECTOR, f"#{field}"))
-                        element.send_keys(value)
-                    except Exception as e:
-                       pass
-
-            confirm_email = self.wait_for_element((By.CSS_SELECTOR, "#confirmemail"))
-            confirm_email.send_keys(self.form_data.email)
-
-            self.submit_form()
-
-        except Exception as e:
-            
-            pass
-
-        logging.info(f"{self.get_log_prefix()} Form page filled successfully")
-
-    def submit_form(self, attempt=0):
-        logging.info(f"{self.get_log_prefix()} Submitting the form")
+                result, outcome = WebDriverWait(self.driver, self.deadline.clamp(timeout), poll_frequency=0.1).until(
+                    self.within_deadline(condition)
+                ), "met"
+            except TimeoutException:
+                logging.info(f"{self.get_log_prefix()} Timed out waiting for {step}")
+                result, outcome = None, "timeout"
+        WAIT_DURATION.observe(time.monotonic() - started, step=step, outcome=outcome)
+        return result
+
+    def wait_for_page_idle(self, step, timeout=10):
+        """Wait until the document is loaded and no jQuery requests are in flight"""
+        return self.wait_for_condition(step, lambda driver: driver.execute_script(PAGE_IDLE_SCRIPT), timeout)
+
+    def run_until(self, *targets):
+        """Drive the clerk site from the current page until one of the target page states,
+        starting over in a fresh browser when the page state is unrecoverable"""
+        restarts = 0
+        while True:
+            try:
+                return self.page_flow.run(targets)
+            except (PageFlowError, WebDriverException) as e:
+                if restarts >= PAGE_FLOW_RESTARTS or self.landing_url is None:
+                    raise
+                self.deadline.check()
+                restarts += 1
+                logging.info(f"{self.get_log_prefix()} Restarting the browser session: {e}")
+                self.restart_session()
+
+    def restart_session(self):
+        SESSION_RESTARTS.inc(county=self.county_label(self.form_data))
+        # the browser may be wedged on the page it gave up on, so it is not reused
+        self.release(discard=True)
+        self.driver = self.acquire_driver(self.form_data)
+        self.page_flow.restart()
+        self.open_landing_page(self.landing_url)
+
+    def first_visit(self, state):
+        """Whether the flow is handling state for the first time; retries do not trust the profile"""
+        return self.page_flow.visits.get(state, 0) <= 1
+
+    def select_by_profile(self, state, css_selector, field):
+        """Select the county by the value its profile stored; the option text, or None"""
+        value = self.county_profile.get(field)
+        if not value or not self.first_visit(state):
+            return None
+        selected = self.driver.execute_script(SELECT_VALUE_SCRIPT, css_selector, value)
+        if selected is None:
+            logging.info(f"{self.get_log_prefix()} Profiled {field} {value!r} is gone, matching by text")
+            return None
+        self.profile_observations[field] = value
+        return selected
 
-        try:
-            submit_button = self.driver.find_element(By.ID, "payrenewal_None")
-            self.driver.execute_script("arguments[0].click();", submit_button)
-            time.sleep(4)
+    def record_county_profile(self):
+        """Fold what this run saw on its way to the fee page into the county's profile"""
+        county_profiles.learn(self.form_data.county, self.profile_observations)
 
-            try:
-                validation_error = self.driver.find_element(By.CSS_SELECTOR, "div.swal2-header")
-                if attempt < 3:
-                    logging.info(f"{self.get_log_prefix()} Validation error found, retrying form submission")
-                    self.retry_form_submission(attempt)
-                else:
-                    logging.error(f"{self.get_log_prefix()} Max attempts reached. Form submission failed.")
-                    
-            except Exception as e:
-              
-                pass
-        except Exception as e:
-           
-            pass
+    def check_current_page(self):
+        logging.info(f"{self.get_log_prefix()} Checking current page: {self.driver.current_url}")
+        return self.page_flow.detect()
 
-        logging.info(f"{self.get_log_prefix()} Form submitted successfully")
+    def handle_county_list(self):
+        selected = self.select_by_profile("county_list", "select[name='countylist']", "countylist_value")
+        if selected:
+            logging.info(f"{self.get_log_prefix()} Selected county: {selected}")
+            return
+        select_element = Select(self.driver.find_element(By.CSS_SELECTOR, "select[name='countylist']"))
+        for option in select_element.options:
+            if self.form_data.county.upper() in option.text.upper():
+                self.profile_observations["countylist_value"] = option.get_attribute("value")
+                # selecting a county navigates to its online services page
+                select_element.select_by_visible_text(option.text)
+                logging.info(f"{self.get_log_prefix()} Selected county: {option.text}")
+                return
+        raise PageFlowError(f"County {self.form_data.county!r} not in countylist")
+
+    def handle_services_page(self):
+        # the first service form is Plate Renewals
+        self.driver.find_element(By.CSS_SELECTOR, "form[name^='myform']").submit()
+        logging.info(f"{self.get_log_prefix()} Opened Plate Renewals")
+
+    def handle_plate_search_page(self):
+        plate_input = self.driver.find_element(By.CSS_SELECTOR, "input[name='plateNumber']")
+        plate_input.send_keys(self.form_data.plateNumber)
+        self.driver.execute_script("document.expressRenew.submit();")
 
-    def retry_form_submission(self, attempt=0):
-        logging.info(f"{self.get_log_prefix()} Retrying form submission")
+    def handle_street_number_page(self):
+        for street_input in self.driver.find_elements(By.CSS_SELECTOR, "#streetnum"):
+            street_input.send_keys(self.form_data.addressTwo.split(" ")[0])
+        self.driver.find_element(By.CSS_SELECTOR, "input[name='platenum']").send_keys(self.form_data.plateNumber)
+        form = self.driver.find_element(By.CSS_SELECTOR, "#renewalSearchForm")
+        self.driver.execute_script("arguments[0].submit();", form)
 
-        try:
-            ok_button = self.driver.find_element(By.CSS_SELECTOR, "button.swal2-confirm.swal2-styled")
-            self.driver.execute_script("arguments[0].click();", ok_button)
-            self.submit_form(attempt + 1)
-        except Exception as e:
-            pass
+    def handle_clerk_alert(self):
+        alert_text = self.page_flow.alert_text or self.handle_alert()
+        logging.info(f"{self.get_log_prefix()} Clerk site alert: {alert_text}")
+        raise ClerkAlertError(alert_text)
 
-        logging.info(f"{self.get_log_prefix()} Form submission retried successfully")
+    def handle_form_page(self):
+        """Fill the renewal form and submit it; on a retry every field is typed again from scratch"""
+        logging.info(f"{self.get_log_prefix()} Filling out the form page")
+        # counties profiled without the Shelby checkbox skip the probe until their form comes back
+        if self.county_profile.get("shelby_address_verify") is not False or not self.first_visit("form_page"):
+            shelby_address_verify = self.driver.find_elements(By.CSS_SELECTOR, "#shelby_address_verify")
+            self.profile_observations["shelby_address_verify"] = bool(shelby_address_verify)
+            if shelby_address_verify:
+                self.driver.execute_script(
+                    "if (!arguments[0].checked) arguments[0].click();", shelby_address_verify[0],
+                )
+
+        for field in FORM_PAGE_FIELDS:
+            self.fill_field(f"#{field}", getattr(self.form_data, field))
+            if field == "zip":
+                # the zip field triggers a lookup on the clerk site; wait for it to settle
+                self.wait_for_page_idle("zip_lookup")
+        self.fill_field("#confirmemail", self.form_data.email)
+
+        submit_button = self.driver.find_element(By.ID, "payrenewal_None")
+        self.driver.execute_script("arguments[0].click();", submit_button)
+
+    def fill_field(self, css_selector, value):
+        for element in self.driver.find_elements(By.CSS_SELECTOR, css_selector):
+            if element.tag_name.lower() in ("input", "textarea"):
+                element.clear()
+            element.send_keys(value)
+
+    def handle_validation_dialog(self):
+        """Dismiss the swal2 validation dialog; the form page handler then resubmits"""
+        logging.info(f"{self.get_log_prefix()} Validation error found, retrying form submission")
+        FORM_VALIDATION_ERRORS.inc(county=self.county_label(self.form_data))
+        FORM_RETRIES.inc(county=self.county_label(self.form_data))
+        ok_button = self.driver.find_element(By.CSS_SELECTOR, "button.swal2-confirm.swal2-styled")
+        self.driver.execute_script("arguments[0].click();", ok_button)
+
+    def handle_county_page(self):
+        if not self.select_by_profile("county_page", "#newCountyID", "county_page_value"):
+            select_element = Select(self.driver.find_element(By.ID, "newCountyID"))
+            for option in select_element.options:
+                if self.form_data.county in option.text:
+                    self.profile_observations["county_page_value"] = option.get_attribute("value")
+                    select_element.select_by_visible_text(option.text)
+                    break
+        self.driver.find_element(By.ID, "zipCodeSubmit").click()
+        logging.info(f"{self.get_log_prefix()} County selected successfully")
 
     def handle_alert(self):
         logging.info(f"{self.get_log_prefix()} Handling alert")
 
         try:
-            WebDriverWait(self.driver, 5).until(EC.alert_is_present())
+            WebDriverWait(self.driver, self.deadline.clamp(5)).until(EC.alert_is_present())
             alert = self.driver.switch_to.alert
             alert_text = alert.text
             alert.accept()
             return alert_text
-        except Exception as e:
+        except Exception:
             return None
 
         logging.info(f"{self.get_log_prefix()} Alert handled successfully")
 
-    def search_plate_number(self):
-        logging.info(f"{self.get_log_prefix()} Searching for plate number")
-
-        plate_input = self.wait_for_element((By.CSS_SELECTOR,
-                                             "input[name='plateNumber']"))
-        plate_input.send_keys(self.form_data.plateNumber)
-
-        self.driver.execute_script("document.expressRenew.submit();")
-        return self.handle_alert()
-
-        logging.info(f"{self.get_log_prefix()} Plate number searched successfully")
-        
-    def beginning_county_selection(self):
-        logging.info(f"{self.get_log_prefix()} Beginning county selection 2")
-
-        try:
-            select_element = Select(self.wait_for_element((By.CSS_SELECTOR,
-                                             "select[name='countylist']")))
-            for option in select_element.options:
-                if self.form_data.county.upper() in option.text.upper():
-                    select_element.select_by_visible_text(option.text)
-                    logging.info(f"{self.get_log_prefix()} Selected county: {option.text}")
-                    break
-        except Exception as e:
-            pass
-       
-        time.sleep(2) 
-        # should take us to the available online services, let's find the plate renewals link and click it
-        try:
-            forms = self.driver.find_elements(By.CSS_SELECTOR, "form[name^='myform']")
-            if forms:
-                plate_renewal_form = forms[0]
-                plate_renewal_form.submit()
-            # plate_renewal_link = self.wait_for_element((By.CSS_SELECTOR, "span:contains('Plate Renewals')"))
-            # plate_renewal_link.click()
-            logging.info(f"{self.get_log_prefix()} Clicked on Plate Renewals link")
-        except Exception as e:
-            logging.error(f"{self.get_log_prefix()} Error clicking on Plate Renewals link: {e}") 
-
-
-    def county_selection_element(self):
-        logging.info(f"{self.get_log_prefix()} Selecting county")
-        try:
-            select_element = Select(self.wait_for_element((By.ID, "newCountyID")))
-            for option in select_element.options:
-                if self.form_data.county in option.text:
-                    select_element.select_by_visible_text(option.text)
-                    break
-            submit_button = self.driver.find_element(By.ID, "zipCodeSubmit")
-            submit_button.click()
-        except Exception as e:
-            pass
-
-        logging.info(f"{self.get_log_prefix()} County selected successfully")
-
+    @timed_stage("collect_form_data")
     def collect_form_data(self):
         logging.info(f"{self.get_log_prefix()} Collecting form data")
         try:
-            WebDriverWait(self.driver, 15).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "#Total\\ Display"))
+            WebDriverWait(self.driver, self.deadline.clamp(15)).until(
+                self.within_deadline(EC.presence_of_element_located((By.CSS_SELECTOR, "#Total\\ Display")))
             )
             self.apply_hamilton_city_qty()
-            fee_summary = {
-                "County": self.get_element_text_or_default(".row > .col-md-2:nth-child(2) div:nth-child(2)"),
-                "License": self.get_element_text_or_default(".row > .col-md-2:nth-child(3) div:nth-child(2)"),
-
-                "Make": self.get_element_text_or_default(".row > .col-md-2:nth-child(4) div:nth-child(2)"),
-                "Year": self.get_element_text_or_default(".row > .col-md-2:nth-child(5) div:nth-child(2)"),
-                "Exp Date": self.get_element_text_or_default(".row > .col-md-2:nth-child(6) div:nth-child(2)"),
-
-                "Registration": self.get_element_text_or_default("#Registration\\ Display").replace("$", ""),
-                "Online Fee": self.get_element_text_or_default("#Online\\ Fee\\ Display").replace("$", ""),
-                "Organ Donor Amount": self.get_element_text_or_default("#Organ\\ Donor\\ Amount\\ Display").replace("$", ""),
-                "County Wheel Tax": self.get_element_text_or_default("#County\\ Wheel\\ Tax\\ Display").replace("$", ""),
-                "City Wheel Tax": self.get_element_text_or_default("#City\\ Wheel\\ Tax\\ Display").replace("$", ""),
-                "Mail Fee": self.get_element_text_or_default("#Mail\\ Fee\\ Display").replace("$", ""),
-                "Subtotal": self.get_element_text_or_default("#Subtotal\\ Display").replace("$", ""),
-                "Processing Fee": self.get_element_text_or_default("#Processing\\ Fee\\ Display").replace("$", ""),
-                "Total": self.get_element_text_or_default("#Total\\ Display").replace("$", "")
-            }
-            return fee_summary
+            return read_fee_page(self.driver).to_response()
+        except (DeadlineExceededError, RunCancelledError):
+            raise
         except Exception as e:
             logging.error(f"{self.get_log_prefix()} collect_form_data failed: {e}")
             return None
 
         logging.info(f"{self.get_log_prefix()} Form data collected successfully")
 
+    def is_hamilton(self):
+        return (self.form_data.county or "").strip().lower() == "hamilton"
+
+    def start_city_limits_lookup(self):
+        """Kick off the Census lookup while the browser navigates, so it is ready at the fee page"""
+        if self.is_hamilton() and self.city_limits_lookup is None:
+            self.city_limits_lookup = prefetch_city_limits(full_address(self.form_data))
+
     def apply_hamilton_city_qty(self):
-        if (self.form_data.county or "").strip().lower() != "hamilton":
+        if not self.is_hamilton():
             return
-        full_address = (
-            f"{self.form_data.addressTwo}, {self.form_data.city}, "
-            f"{self.form_data.state} {self.form_data.zip}"
-        )
-        in_limits = is_in_city_limits(full_address)
+        with STAGE_DURATION.time(stage="census_lookup", county="hamilton"):
+            in_limits = self.city_limits()
         if not in_limits:
             logging.info(
                 f"{self.get_log_prefix()} Hamilton county, in_limits={in_limits} — leaving MVCityQty alone"
             )
             return
         try:
+            total_before = self.get_element_text_or_default("#Total\\ Display")
             el = self.driver.find_element(By.ID, "MVCityQty")
             self.driver.execute_script(
                 "arguments[0].value = '1'; "
@@ -263,11 +302,27 @@ class RenewalService:
                 "arguments[0].dispatchEvent(new Event('input', {bubbles: true}));",
                 el,
             )
-            time.sleep(1)
+            # the clerk page recomputes the total once the city quantity changes
+            self.wait_for_condition("hamilton_total_recompute", lambda driver: (
+                driver.find_element(By.CSS_SELECTOR, "#Total\\ Display").text != total_before
+            ), timeout=3)
             logging.info(f"{self.get_log_prefix()} Set MVCityQty=1 (Hamilton, in city limits)")
         except Exception as e:
             logging.error(f"{self.get_log_prefix()} Failed to set MVCityQty: {e}")
 
+    def city_limits(self):
+        """is_in_city_limits for the form's address, waiting no longer than the run may; None
+        (inconclusive, as when Census is down) when the answer does not come in time"""
+        self.deadline.check()
+        if self.city_limits_lookup is None:
+            return is_in_city_limits(full_address(self.form_data), self.deadline.clamp(CENSUS_TIMEOUT))
+        try:
+            return self.city_limits_lookup.result(timeout=self.deadline.clamp(CITY_LIMITS_WAIT))
+        except FutureTimeoutError:
+            self.deadline.check()
+            logging.error(f"{self.get_log_prefix()} City limits lookup did not finish in {CITY_LIMITS_WAIT:g}s")
+            return None
+
     def get_element_text_or_default(self, css_selector, default_value=""):
         logging.info(f"{self.get_log_prefix()} Getting text for element: {css_selector}")
 
@@ -280,7 +335,7 @@ class RenewalService:
         logging.info(f"{self.get_log_prefix()} Handling pop-up in payment processing")
                                 
         try:
-            pop_up_text=self.wait_for_element((By.CSS_SELECTOR,"#swal2-title"))
+            self.wait_for_element((By.CSS_SELECTOR,"#swal2-title"))
 
             pop_ok_button=self.wait_for_element((By.CSS_SELECTOR, "button.swal2-confirm.swal2-styled"))
             pop_ok_button.click()
@@ -290,15 +345,20 @@ class RenewalService:
 
                 check_terms_condition.click()
             except Exception as e:
-                print(f"Having error in checking terms {e}")
+                logging.warning(f"{self.get_log_prefix()} Could not check the payment terms: {e}")
             
-        except Exception as e:
+        except Exception:
             pass
 
         logging.info(f"{self.get_log_prefix()} Pop-up handled successfully")
 
+    @timed_stage("handle_payment_processing")
     def handle_payment_processing(self):
         logging.info(f"{self.get_log_prefix()} Handling payment processing")
+        self.deadline.check()
+        # from here the card is being charged: stopping half way could take the payment
+        # without the confirmation, so the run is no longer cancellable
+        self.deadline = no_deadline()
 
         try:
             fee_summary=self.collect_form_data()
@@ -326,7 +386,7 @@ class RenewalService:
             
             alert_text = self.handle_alert()
             
-            print(f" Alert text found here is the alert text {alert_text}")
+            logging.info(f"{self.get_log_prefix()} Payment alert text: {alert_text}")
             if alert_text:
                 return alert_text
              
@@ -338,65 +398,8 @@ class RenewalService:
 
         logging.info(f"{self.get_log_prefix()} Payment processed successfully")
 
-    def has_shelby_address_verify(self):
-        return bool(self.driver.find_elements(By.CSS_SELECTOR, "#shelby_address_verify"))
-
-    def check_current_page(self):
-        logging.info(f"{self.get_log_prefix()} Checking current page: {self.driver.current_url}")
-        try:
-            normalized_url = self.driver.current_url.replace('//', '/')
-            if 'renewalconfirm' in normalized_url:
-                return "successful_payment"
-            if 'expresspay=Y' in normalized_url:
-                return "fee_page"
-            street_input = self.driver.find_elements(By.CSS_SELECTOR, "#streetnum")
-            if street_input:
-                return "street_number_page"
-            if self.driver.find_elements(By.CSS_SELECTOR, "#name"):
-                return "form_page"
-            if self.driver.find_element(By.CSS_SELECTOR, "#Total\\ Display"):
-                return "price_page"
-            return "form_page"
-        except Exception as e:
-
-            return None
-
     def select_dropdown_option(self, selector, option_value):
         logging.info(f"{self.get_log_prefix()} Selecting dropdown option: {selector} -> {option_value}")
 
         select_element = Select(self.wait_for_element((By.CSS_SELECTOR, selector)))
         select_element.select_by_visible_text(option_value)
-
-    def fill_street_number_page(self):
-        logging.info(f"{self.get_log_prefix()} Filling out the street number page")
-
-        try:
-            try:
-                street_input = self.wait_for_element((By.CSS_SELECTOR, "#streetnum"))
-                street_num = self.form_data.addressTwo.split(" ")[0]
-                street_input.send_keys(street_num)
-            except Exception as e:
-                logging.error(f"{self.get_log_prefix()} Street number input not found: {e}")
-                pass 
-
-
-            plate_input = self.driver.find_element(By.CSS_SELECTOR, "input[name='platenum']")
-            plate_input.send_keys(self.form_data.plateNumber)
-
-            form = self.driver.find_element(By.CSS_SELECTOR, "#renewalSearchForm")
-            self.driver.execute_script("arguments[0].submit();", form)
-            
-            alert_text = self.handle_alert()
-            
-            print(f" Alert text found here is the alert text {alert_text}")
-            if alert_text:
-                return alert_text 
-
-            # Collect additional form information
-            # self.collect_form_data()
-
-        except Exception as e:
-            pass
-
-        logging.info(f"{self.get_log_prefix()} Street number page filled successfully")
-        
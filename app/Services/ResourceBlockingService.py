@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+from Services.MetricsService import BLOCKED_REQUESTS, TRANSFERRED_BYTES
+
+RESOURCE_BLOCKING_ENABLED = os.getenv("RESOURCE_BLOCKING", "true").lower() in ("1", "true", "yes")
+# Chrome buffers every network event for the usage counters, which costs memory per request;
+# turn it on to measure what the blocking saves, not in production
+RESOURCE_USAGE_LOG_ENABLED = os.getenv("RESOURCE_USAGE_LOG", "false").lower() in ("1", "true", "yes")
+
+# Stylesheets are not blocked by default: the fee page and WebElement.text rely on CSS visibility
+DEFAULT_BLOCKED_RESOURCE_TYPES = "Image,Font,Media"
+DEFAULT_BLOCKED_URL_PATTERNS = ",".join((
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+    "*hotjar.com*", "*clarity.ms*", "*newrelic.com*", "*nr-data.net*",
+))
+
+# DevTools blocks by URL only, so resource types are approximated by file extension
+RESOURCE_TYPE_PATTERNS = {
+    "Image": ("*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.svg*", "*.ico*", "*.bmp*"),
+    "Font": ("*.woff*", "*.ttf*", "*.otf*", "*.eot*"),
+    "Media": ("*.mp4*", "*.webm*", "*.mp3*", "*.ogg*", "*.wav*"),
+    "Stylesheet": ("*.css*",),
+}
+
+# Network.loadingFailed.blockedReason for requests stopped by Network.setBlockedURLs
+BLOCKED_BY_DEVTOOLS = "inspector"
+
+
+def _split(value: str):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+class ResourceBlockPolicy:
+    """Which requests the headless browser may make; allow patterns win over deny patterns"""
+
+    def __init__(self, blocked_patterns=(), allowed_patterns=(), blocked_resource_types=()):
+        self.blocked_patterns = list(blocked_patterns)
+        self.allowed_patterns = list(allowed_patterns)
+        self.blocked_resource_types = list(blocked_resource_types)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            _split(os.getenv("BLOCKED_URL_PATTERNS", DEFAULT_BLOCKED_URL_PATTERNS)),
+            _split(os.getenv("ALLOWED_URL_PATTERNS", "")),
+            _split(os.getenv("BLOCKED_RESOURCE_TYPES", DEFAULT_BLOCKED_RESOURCE_TYPES)),
+        )
+
+    def deny_patterns(self):
+        patterns = list(self.blocked_patterns)
+        for resource_type in self.blocked_resource_types:
+            patterns.extend(RESOURCE_TYPE_PATTERNS.get(resource_type, ()))
+        return list(dict.fromkeys(patterns))
+
+    def url_patterns(self):
+        """Network.setBlockedURLs urlPatterns; the first matching pattern decides"""
+        return (
+            [{"urlPattern": pattern, "block": False} for pattern in self.allowed_patterns]
+            + [{"urlPattern": pattern, "block": True} for pattern in self.deny_patterns()]
+        )
+
+
+resource_block_policy = ResourceBlockPolicy.from_env()
+
+
+def apply_resource_blocking(driver, policy: ResourceBlockPolicy = resource_block_policy):
+    """Install the block list on a freshly launched driver; it holds across navigations"""
+    if not RESOURCE_BLOCKING_ENABLED or not policy.deny_patterns():
+        return
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        if policy.allowed_patterns:
+            try:
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urlPatterns": policy.url_patterns()})
+                return
+            except Exception:
+                # Chrome before urlPatterns support only takes a deny list
+                logging.info("This Chrome ignores ALLOWED_URL_PATTERNS; blocking by deny list only")
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": policy.deny_patterns()})
+    except Exception as e:
+        logging.error(f"Failed to install resource blocking: {e}")
+
+
+async def apply_tab_resource_blocking(tab, policy: ResourceBlockPolicy = resource_block_policy):
+    """apply_resource_blocking for a DevToolsTab, whose Network domain the tab enables itself"""
+    if not RESOURCE_BLOCKING_ENABLED or not policy.deny_patterns():
+        return
+    try:
+        if policy.allowed_patterns:
+            try:
+                await tab.send("Network.setBlockedURLs", {"urlPatterns": policy.url_patterns()})
+                return
+            except Exception:
+                logging.info("This Chrome ignores ALLOWED_URL_PATTERNS; blocking by deny list only")
+        await tab.send("Network.setBlockedURLs", {"urls": policy.deny_patterns()})
+    except Exception as e:
+        logging.error(f"Failed to install resource blocking: {e}")
+
+
+class ResourceUsage:
+    """Requests made and blocked during one run, read from Chrome's performance log"""
+
+    def __init__(self):
+        self.requests = 0
+        self.transferred_bytes = 0
+        self.blocked = {}
+        self.transferred_by_type = {}
+        self._resource_types = {}
+
+    @property
+    def blocked_requests(self):
+        return sum(self.blocked.values())
+
+    def add_entries(self, entries):
+        """Add Chrome performance log entries (the chromedriver engine)"""
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.add_event(message.get("method"), message.get("params", {}))
+
+    def add_event(self, method, params):
+        """Add one Network domain event, as logged or as received over DevTools"""
+        if method == "Network.requestWillBeSent":
+            self.requests += 1
+            self._resource_types[params.get("requestId")] = params.get("type", "Other")
+        elif method == "Network.loadingFinished":
+            size = int(params.get("encodedDataLength") or 0)
+            resource_type = self._resource_types.get(params.get("requestId"), "Other")
+            self.transferred_bytes += size
+            self.transferred_by_type[resource_type] = self.transferred_by_type.get(resource_type, 0) + size
+        elif method == "Network.loadingFailed" and params.get("blockedReason") == BLOCKED_BY_DEVTOOLS:
+            resource_type = params.get("type") or self._resource_types.get(params.get("requestId"), "Other")
+            self.blocked[resource_type] = self.blocked.get(resource_type, 0) + 1
+
+    def record_metrics(self):
+        for resource_type, count in self.blocked.items():
+            BLOCKED_REQUESTS.inc(count, resource_type=resource_type)
+        for resource_type, size in self.transferred_by_type.items():
+            TRANSFERRED_BYTES.inc(size, resource_type=resource_type)
+
+    def report(self):
+        return {
+            "requests": self.requests,
+            "transferred_bytes": self.transferred_bytes,
+            "blocked_requests": self.blocked_requests,
+            "blocked_by_type": dict(self.blocked),
+        }
+
+
+def read_performance_log(driver):
+    """Drain the driver's performance log; entries are only returned once"""
+    if not RESOURCE_USAGE_LOG_ENABLED:
+        return []
+    try:
+        return driver.get_log("performance")
+    except Exception as e:
+        logging.info(f"Performance log unavailable: {e}")
+        return []
+
+
+def collect_resource_usage(driver):
+    """Usage since the log was last drained, also added to the Prometheus counters"""
+    usage = ResourceUsage()
+    usage.add_entries(read_performance_log(driver))
+    usage.record_metrics()
+    return usage
@@ -0,0 +1,236 @@
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from Models.QueryPriceRequest import QueryPriceRequest
+from Services.DriverPoolService import attach_driver, driver_pool
+from Services.QuoteCacheService import quote_key
+
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "/tmp/parked_sessions.sqlite3")
+PARKED_SESSION_TTL = float(os.getenv("PARKED_SESSION_TTL", "300"))
+PARKED_SESSION_CLAIM_TTL = float(os.getenv("PARKED_SESSION_CLAIM_TTL", "180"))
+PARKED_SESSION_MAX = int(os.getenv("PARKED_SESSION_MAX", "2"))
+PARKED_SESSION_SWEEP_INTERVAL = float(os.getenv("PARKED_SESSION_SWEEP_INTERVAL", "5"))
+PARKED_SESSION_POLL_INTERVAL = 0.2
+# browsers a warm-up left part-way through a plate search: short-lived and few, so
+# guesses about a customer's next request never hold browsers real requests need
+SPECULATIVE_SESSION_PATH = os.getenv("SPECULATIVE_SESSION_PATH", "/tmp/speculative_sessions.sqlite3")
+SPECULATIVE_SESSION_TTL = float(os.getenv("SPECULATIVE_SESSION_TTL", "60"))
+SPECULATIVE_SESSION_MAX = int(os.getenv("SPECULATIVE_SESSION_MAX", "2"))
+
+
+def plate_search_key(request):
+    """Plate + county: all a warm-up knows of the query that will follow it"""
+    raw = f"{request.plateNumber.strip().upper()}|{request.county.strip().lower()}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ParkedSession:
+    """A browser left on the fee page, claimed by the request that completes the payment"""
+
+    def __init__(self, token, driver, owned):
+        self.token = token
+        self.driver = driver
+        self.owned = owned
+
+
+class ParkedSessionStore:
+    """Registry of browsers parked on the fee page between a price query and its completion.
+
+    The browser stays in the pool of the worker that ran the query; the registry lives in
+    SQLite so a completion handled by another uvicorn worker can attach to the same
+    chromedriver session. Only the owning worker releases the browser, once the session is
+    finished or has expired.
+
+    Sessions are matched to the request that claims them by key(request). A slot can be
+    reserved before the browser gets to the page it is parked on, so the cap also covers
+    browsers still on their way there.
+    """
+
+    def __init__(self, path=SESSION_STORE_PATH, ttl=PARKED_SESSION_TTL, max_parked=PARKED_SESSION_MAX,
+                 key=quote_key):
+        self.path = path
+        self.ttl = ttl
+        self.max_parked = max_parked
+        self.key = key
+        self._drivers = {}
+        self._lock = threading.Lock()
+        self._sweeper = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parked_sessions ("
+                " token TEXT PRIMARY KEY, owner_pid INTEGER NOT NULL, executor_url TEXT NOT NULL,"
+                " session_id TEXT NOT NULL, request_key TEXT NOT NULL, status TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @property
+    def parked_count(self):
+        with self._lock:
+            return len(self._drivers)
+
+    def reserve(self, request):
+        """Hold a slot for a browser that will be parked for request; its token, or None when at capacity"""
+        token = secrets.token_urlsafe(24)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            live = conn.execute(
+                "SELECT COUNT(*) FROM parked_sessions WHERE status != 'done' AND expires_at > ?", (now,)
+            ).fetchone()[0]
+            if live >= self.max_parked:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute(
+                "INSERT INTO parked_sessions VALUES (?, ?, '', '', ?, 'reserved', ?)",
+                (token, os.getpid(), self.key(request), now + self.ttl),
+            )
+            conn.execute("COMMIT")
+        return token
+
+    def park(self, driver, request: QueryPriceRequest, token=None):
+        """Keep the driver on its current page and return a token, or None when at capacity
+        (or when the reserved slot expired meanwhile)"""
+        if token is None:
+            token = self.reserve(request)
+            if token is None:
+                return None
+        with self._connect() as conn:
+            parked = conn.execute(
+                "UPDATE parked_sessions SET executor_url = ?, session_id = ?, status = 'parked', expires_at = ?"
+                " WHERE token = ? AND status = 'reserved' AND expires_at > ?",
+                (driver.service.service_url, driver.session_id, time.time() + self.ttl, token, time.time()),
+            ).rowcount
+        if not parked:
+            return None
+        with self._lock:
+            self._drivers[token] = driver
+        return token
+
+    def cancel(self, token):
+        """Give back a reserved slot whose browser will not be parked after all"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM parked_sessions WHERE token = ? AND status = 'reserved'", (token,))
+
+    def _await_parked(self, key, wait):
+        """Token of the newest session parked for key, waiting up to wait seconds for one still
+        on its way there"""
+        give_up_at = time.monotonic() + wait
+        while True:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT token, status FROM parked_sessions WHERE request_key = ?"
+                    " AND status IN ('parked', 'reserved') AND expires_at > ?"
+                    " ORDER BY status = 'parked' DESC, expires_at DESC LIMIT 1",
+                    (key, time.time()),
+                ).fetchone()
+            if row is None:
+                return None
+            token, status = row
+            if status == "parked":
+                return token
+            if time.monotonic() >= give_up_at:
+                return None
+            time.sleep(PARKED_SESSION_POLL_INTERVAL)
+
+    def claim(self, token, request: QueryPriceRequest, wait=0):
+        """Take a parked session with the same key as request, or None if it is gone; without
+        a token, the newest one parked for the key"""
+        if token is None:
+            token = self._await_parked(self.key(request), wait)
+            if token is None:
+                return None
+        now = time.time()
+        with self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE parked_sessions SET status = 'claimed', expires_at = ?"
+                " WHERE token = ? AND request_key = ? AND status = 'parked' AND expires_at > ?",
+                (now + PARKED_SESSION_CLAIM_TTL, token, self.key(request), now),
+            ).rowcount
+            if not claimed:
+                return None
+            owner_pid, executor_url, session_id = conn.execute(
+                "SELECT owner_pid, executor_url, session_id FROM parked_sessions WHERE token = ?", (token,)
+            ).fetchone()
+        if owner_pid == os.getpid():
+            with self._lock:
+                driver = self._drivers.get(token)
+            if driver is not None:
+                return ParkedSession(token, driver, owned=True)
+        try:
+            return ParkedSession(token, attach_driver(executor_url, session_id), owned=False)
+        except Exception as e:
+            logging.error(f"Failed to attach to parked session: {e}")
+            self.finish(ParkedSession(token, None, owned=False), discard=True)
+            return None
+
+    def finish(self, session: ParkedSession, discard=False):
+        """Mark a claimed session done; the owning worker hands the browser back to its pool"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE parked_sessions SET status = ? WHERE token = ?",
+                ("discard" if discard else "done", session.token),
+            )
+        if session.owned:
+            self._release(session.token)
+
+    def sweep(self):
+        """Release this worker's browsers whose sessions were finished elsewhere or expired"""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT token, status, expires_at FROM parked_sessions WHERE owner_pid = ?", (os.getpid(),)
+            ).fetchall()
+            # rows left behind by workers that no longer exist
+            conn.execute("DELETE FROM parked_sessions WHERE expires_at < ?", (now - self.ttl,))
+        for token, status, expires_at in rows:
+            if status in ("done", "discard") or expires_at <= now:
+                if status not in ("done", "discard"):
+                    logging.info("Parked session expired, releasing its browser")
+                self._release(token, discard=status == "discard")
+
+    def _release(self, token, discard=False):
+        with self._lock:
+            driver = self._drivers.pop(token, None)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM parked_sessions WHERE token = ?", (token,))
+        if driver is not None:
+            driver_pool.release(driver, discard=discard)
+
+    def start_sweeper(self, interval=PARKED_SESSION_SWEEP_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logging.error(f"Parked session sweep failed: {e}")
+
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=run, daemon=True)
+            self._sweeper.start()
+
+    def close(self):
+        with self._lock:
+            tokens = list(self._drivers)
+        for token in tokens:
+            self._release(token, discard=True)
+
+
+parked_sessions = ParkedSessionStore()
+speculative_sessions = ParkedSessionStore(
+    SPECULATIVE_SESSION_PATH, SPECULATIVE_SESSION_TTL, SPECULATIVE_SESSION_MAX, key=plate_search_key,
+)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from fastapi import HTTPException
+from Services.MetricsService import COALESCED_REQUESTS
+
+SINGLE_FLIGHT_PATH = os.getenv("SINGLE_FLIGHT_PATH", "/tmp/single_flight.sqlite3")
+# a run older than this is presumed lost and the next caller runs the query itself
+SINGLE_FLIGHT_STALE_AFTER = float(os.getenv("SINGLE_FLIGHT_STALE_AFTER", "180"))
+SINGLE_FLIGHT_RESULT_TTL = float(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "30"))
+SINGLE_FLIGHT_POLL_INTERVAL = 0.2
+
+
+def _worker_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SingleFlight:
+    """Collapses concurrent identical runs into one.
+
+    Callers in the same worker await the leader's future. Callers in other workers see the
+    leader's row in SQLite and poll it until the leader stores the outcome there. Either
+    way every caller gets the leader's result, or the leader's error re-raised. The SQLite
+    calls run in threads so a busy lock never stalls the worker's event loop.
+    """
+
+    def __init__(self, path=SINGLE_FLIGHT_PATH, stale_after=SINGLE_FLIGHT_STALE_AFTER,
+                 result_ttl=SINGLE_FLIGHT_RESULT_TTL):
+        self.path = path
+        self.stale_after = stale_after
+        self.result_ttl = result_ttl
+        self._inflight = {}
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS flights ("
+                " key TEXT PRIMARY KEY, worker_pid INTEGER NOT NULL, status TEXT NOT NULL,"
+                " status_code INTEGER, result TEXT, error TEXT, started_at REAL NOT NULL, finished_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _claim(self, key):
+        """Become the container-wide leader for key, or return the live leader's pid"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute("DELETE FROM flights WHERE finished_at < ?", (now - self.result_ttl,))
+                    row = conn.execute(
+                        "SELECT worker_pid, status, started_at FROM flights WHERE key = ?", (key,)
+                    ).fetchone()
+                    leader = None
+                    if row is not None:
+                        worker_pid, status, started_at = row
+                        if status == "running" and now - started_at < self.stale_after and _worker_alive(worker_pid):
+                            leader = worker_pid
+                    if leader is None:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO flights (key, worker_pid, status, started_at)"
+                            " VALUES (?, ?, 'running', ?)",
+                            (key, os.getpid(), now),
+                        )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logging.error(f"Single-flight claim failed, running uncoalesced: {e}")
+            return None
+        return leader
+
+    def _finish(self, key, status, status_code, result=None, error=None):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE flights SET status = ?, status_code = ?, result = ?, error = ?, finished_at = ?"
+                    " WHERE key = ? AND worker_pid = ?",
+                    (status, status_code, None if result is None else json.dumps(result), error, time.time(),
+                     key, os.getpid()),
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Single-flight result store failed: {e}")
+
+    def _abandon(self, key):
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM flights WHERE key = ? AND worker_pid = ?", (key, os.getpid()))
+        except sqlite3.Error as e:
+            logging.error(f"Single-flight abandon failed: {e}")
+
+    def _outcome(self, key):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT worker_pid, status, status_code, result, error, started_at FROM flights WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+    async def _follow(self, key, func):
+        """Wait for another worker's run of key; take over if that run is lost"""
+        while True:
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+            try:
+                row = await asyncio.to_thread(self._outcome, key)
+            except sqlite3.Error as e:
+                logging.error(f"Single-flight poll failed, running uncoalesced: {e}")
+                return await func()
+            if row is None:
+                return await self._lead(key, func)
+            worker_pid, status, status_code, result, error, started_at = row
+            if status == "succeeded":
+                return json.loads(result)
+            if status == "failed":
+                raise HTTPException(status_code=status_code, detail=error)
+            if time.time() - started_at >= self.stale_after or not _worker_alive(worker_pid):
+                logging.info(f"Single-flight leader {worker_pid} lost its run, taking over")
+                return await self._lead(key, func)
+
+    async def _lead(self, key, func):
+        leader = await asyncio.to_thread(self._claim, key)
+        if leader is not None:
+            COALESCED_REQUESTS.inc(scope="container")
+            return await self._follow(key, func)
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # let followers in other workers take over instead of waiting for a stale run
+            await asyncio.to_thread(self._abandon, key)
+            raise
+        except HTTPException as ex:
+            await asyncio.to_thread(self._finish, key, "failed", ex.status_code, error=str(ex.detail))
+            raise
+        except Exception as ex:
+            await asyncio.to_thread(
+                self._finish, key, "failed", getattr(ex, "status_code", 500), error=str(getattr(ex, "detail", ex)),
+            )
+            raise
+        await asyncio.to_thread(self._finish, key, "succeeded", 200, result=result)
+        return result
+
+    async def run(self, key, func):
+        """Await func() once per key across the container, sharing its outcome with every caller"""
+        while (inflight := self._inflight.get(key)) is not None:
+            COALESCED_REQUESTS.inc(scope="worker")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # the leader was cancelled, not this caller: start over, possibly as the leader
+
+        inflight = asyncio.get_running_loop().create_future()
+        self._inflight[key] = inflight
+        try:
+            result = await self._lead(key, func)
+        except asyncio.CancelledError:
+            inflight.cancel()
+            raise
+        except Exception as ex:
+            inflight.set_exception(ex)
+            # mark the exception retrieved so a run without followers does not warn
+            inflight.exception()
+            raise
+        else:
+            inflight.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+
+quote_flights = SingleFlight()
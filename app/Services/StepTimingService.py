@@ -0,0 +1,47 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds the flow used to sleep unconditionally at each wait point
+LEGACY_FIXED_DELAYS = {
+    "zip_lookup": 2.0,
+    "submit_form": 4.0,
+    "county_selection": 2.0,
+    "hamilton_total_recompute": 1.0,
+}
+
+
+class StepTimings:
+    """Wall-clock record of each wait point and step in a single renewal run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = []
+
+    def record(self, step, elapsed):
+        with self._lock:
+            self.entries.append((step, elapsed))
+
+    @contextmanager
+    def measure(self, step):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(step, time.monotonic() - started)
+
+    def report(self):
+        """Per-step totals and the time saved against the legacy fixed sleeps"""
+        with self._lock:
+            entries = list(self.entries)
+        summary = {}
+        for step, elapsed in entries:
+            row = summary.setdefault(step, {"step": step, "count": 0, "elapsed": 0.0})
+            row["count"] += 1
+            row["elapsed"] += elapsed
+        for row in summary.values():
+            fixed_delay = LEGACY_FIXED_DELAYS.get(row["step"])
+            if fixed_delay is not None:
+                row["fixed_delay"] = fixed_delay * row["count"]
+                row["saved"] = row["fixed_delay"] - row["elapsed"]
+        return list(summary.values())
@@ -0,0 +1,251 @@
+"""Replay renewal payloads at a fixed arrival rate and report latency percentiles,
+throughput and peak memory.
+
+By default the flow runs in this process against a mock clerk site started on a free port
+(HTTP_FAST_PATH=false forces the browser path):
+
+    python benchmarks/load_benchmark.py payloads.jsonl --rate 2 --requests 100 --latency 0.2
+
+With --target the payloads are posted to a running service instead; start it with
+RENEWAL_SERVICE_URL pointing at benchmarks/mock_clerk_site.py and pass --pid so the
+service's RSS (including its Chrome processes) is sampled:
+
+    python benchmarks/load_benchmark.py payloads.jsonl --target http://127.0.0.1:8080 --pid 1234
+
+Latency is measured from each request's scheduled start, so time spent queued behind a
+saturated service is counted rather than hidden.
+
+--engine devtools runs in-process price queries on the asyncio DevTools engine instead of
+Selenium, so both engines can be compared on the same payloads and mock settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_clerk_site import MockClerkSite, add_mock_arguments, mock_config
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+ENDPOINTS = {"query": "/query/price/tennessee", "complete": "/complete/tennessee"}
+
+
+def load_payloads(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def process_rss(pid):
+    """Resident set size in bytes of pid and all of its descendants"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class RssSampler:
+    """Track the peak RSS of a process tree on a background thread"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_rss(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, process_rss(self.pid))
+        if not self.peak and self.pid == os.getpid():
+            # no /proc (macOS): fall back to this process's own high-water mark
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def http_runner(target, endpoint, timeout):
+    url = target.rstrip("/") + ENDPOINTS[endpoint]
+
+    def run(payload):
+        request = urllib.request.Request(
+            url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return run
+
+
+class EventLoopThread:
+    """An asyncio loop on a background thread, so the replay threads can submit coroutines"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def in_process_runner(endpoint, engine="selenium"):
+    sys.path.insert(0, APP_DIR)
+    from fastapi import HTTPException
+    from Main import process_renewal_completion, process_renewal_query, process_renewal_query_async
+    from Models.CompleteTransactionRequest import CompleteTransactionRequest
+    from Models.QueryPriceRequest import QueryPriceRequest
+
+    loop_thread = None
+    if endpoint == "query" and engine == "devtools":
+        loop_thread = EventLoopThread()
+        model, func = QueryPriceRequest, lambda request: loop_thread.run(process_renewal_query_async(request))
+    elif endpoint == "query":
+        model, func = QueryPriceRequest, process_renewal_query
+    else:
+        model, func = CompleteTransactionRequest, process_renewal_completion
+
+    def run(payload):
+        try:
+            func(model(**payload))
+            return 200
+        except HTTPException as e:
+            return e.status_code
+        except Exception:
+            return 500
+    run.loop_thread = loop_thread
+    return run
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def replay(run, payloads, rate, total, concurrency):
+    """Start one request every 1/rate seconds (open loop) and collect (status, latency) pairs"""
+    results = []
+    lock = threading.Lock()
+
+    def timed(payload, scheduled):
+        status = run(payload)
+        with lock:
+            results.append((status, time.monotonic() - scheduled))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index in range(total):
+            scheduled = started + index / rate
+            pause = scheduled - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            executor.submit(timed, payloads[index % len(payloads)], scheduled)
+    return results, time.monotonic() - started
+
+
+def summarize(results, wall_time, peak_rss):
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(results),
+        "statuses": statuses,
+        "wall_seconds": wall_time,
+        "throughput_per_second": statuses.get("200", 0) / wall_time if wall_time else 0.0,
+        "p50_seconds": percentile(latencies, 0.50),
+        "p95_seconds": percentile(latencies, 0.95),
+        "p99_seconds": percentile(latencies, 0.99),
+        "max_seconds": latencies[-1] if latencies else 0.0,
+        "peak_rss_mib": peak_rss / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("payloads", help="JSONL file with one request body per line")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="query")
+    parser.add_argument("--rate", type=float, default=1.0, help="requests started per second")
+    parser.add_argument("--requests", type=int, default=50, help="total requests, cycling through the payloads")
+    parser.add_argument("--concurrency", type=int, default=32, help="maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=180.0, help="per-request timeout with --target")
+    parser.add_argument("--target", help="base URL of a running service; runs in process when omitted")
+    parser.add_argument("--pid", type=int, help="service process to sample RSS from (with --target)")
+    parser.add_argument("--json", dest="json_path", help="also write the summary to this file")
+    parser.add_argument("--engine", choices=("selenium", "devtools"), default="selenium",
+                        help="browser engine for in-process price queries")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads)
+    site = None
+    if args.target:
+        run = http_runner(args.target, args.endpoint, args.timeout)
+    else:
+        site = MockClerkSite(mock_config(args))
+        os.environ["RENEWAL_SERVICE_URL"] = site.start()
+        os.environ["BROWSER_ENGINE"] = args.engine
+        run = in_process_runner(args.endpoint, args.engine)
+
+    try:
+        with RssSampler(args.pid or os.getpid()) as sampler:
+            results, wall_time = replay(run, payloads, args.rate, args.requests, args.concurrency)
+    finally:
+        if site is not None:
+            from Services.DriverPoolService import driver_pool
+            driver_pool.close()
+            if run.loop_thread is not None:
+                from Services.DevToolsService import devtools_engine
+                run.loop_thread.run(devtools_engine.close())
+                run.loop_thread.stop()
+            site.stop()
+
+    summary = summarize(results, wall_time, sampler.peak)
+    summary["engine"] = args.engine
+    if site is not None:
+        summary["mock_page_hits"] = site.stats()
+    print(f"requests      {summary['requests']}  {summary['statuses']}")
+    print(f"throughput    {summary['throughput_per_second']:.2f} ok/s over {wall_time:.1f}s")
+    print(f"latency       p50 {summary['p50_seconds']:.2f}s  p95 {summary['p95_seconds']:.2f}s  "
+          f"p99 {summary['p99_seconds']:.2f}s  max {summary['max_seconds']:.2f}s")
+    print(f"peak RSS      {summary['peak_rss_mib']:.0f} MiB")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""Local stand-in for the county clerk renewal site.
+
+Serves the pages RenewalService and HttpRenewalService drive -- county list, online
+services, street number search, Shelby address verification, the renewal form, county
+confirmation, the fee page (with Hamilton's MVCityQty recompute), the payment iframe and
+renewalconfirm -- with configurable latency and failure rates, so the renewal flow can be
+benchmarked without touching RENEWAL_SERVICE_URL.
+
+    python benchmarks/mock_clerk_site.py --port 8765 --latency 0.3 --error-rate 0.02
+    RENEWAL_SERVICE_URL=http://127.0.0.1:8765/ uvicorn Main:app ...
+
+Plates starting with NOTFOUND always answer the search with an alert, and card number
+4000000000000002 is always declined.
+"""
+import argparse
+import html
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+COUNTIES = (
+    "Anderson", "Bedford", "Benton", "Bledsoe", "Blount", "Bradley", "Campbell", "Cannon", "Carroll",
+    "Carter", "Cheatham", "Chester", "Claiborne", "Clay", "Cocke", "Coffee", "Crockett", "Cumberland",
+    "Davidson", "Decatur", "DeKalb", "Dickson", "Dyer", "Fayette", "Fentress", "Franklin", "Gibson",
+    "Giles", "Grainger", "Greene", "Grundy", "Hamblen", "Hamilton", "Hancock", "Hardeman", "Hardin",
+    "Hawkins", "Haywood", "Henderson", "Henry", "Hickman", "Houston", "Humphreys", "Jackson", "Jefferson",
+    "Johnson", "Knox", "Lake", "Lauderdale", "Lawrence", "Lewis", "Lincoln", "Loudon", "McMinn", "McNairy",
+    "Macon", "Madison", "Marion", "Marshall", "Maury", "Meigs", "Monroe", "Montgomery", "Moore", "Morgan",
+    "Obion", "Overton", "Perry", "Pickett", "Polk", "Putnam", "Rhea", "Roane", "Robertson", "Rutherford",
+    "Scott", "Sequatchie", "Sevier", "Shelby", "Smith", "Stewart", "Sullivan", "Sumner", "Tipton",
+    "Trousdale", "Unicoi", "Union", "Van Buren", "Warren", "Washington", "Wayne", "White", "Williamson",
+    "Wilson",
+)
+DECLINED_ACCOUNT = "4000000000000002"
+NOT_FOUND_PREFIX = "NOTFOUND"
+REGISTRATION_FEE = 2900
+ONLINE_FEE = 100
+MAIL_FEE = 200
+CITY_WHEEL_TAX = 3000
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.0
+    jitter: float = 0.5
+    page_latency: dict = field(default_factory=dict)
+    error_rate: float = 0.0
+    alert_rate: float = 0.0
+    validation_rate: float = 0.0
+    decline_rate: float = 0.0
+    seed: int | None = None
+
+
+def county_name(county_id: str):
+    try:
+        return COUNTIES[int(county_id)]
+    except (ValueError, IndexError):
+        return ""
+
+
+def dollars(cents: int):
+    return f"${cents // 100:,}.{cents % 100:02d}"
+
+
+def county_wheel_tax(county: str):
+    """A stable per-county wheel tax between $0 and $80"""
+    return (zlib.crc32(county.encode()) % 9) * 1000
+
+
+def hidden(**fields):
+    return "".join(
+        f'<input type="hidden" name="{name}" value="{html.escape(str(value))}">' for name, value in fields.items()
+    )
+
+
+def layout(title: str, body: str):
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head>"
+        f"<body><div class=\"container\">{body}</div></body></html>"
+    )
+
+
+def alert_page(text: str):
+    return layout("Notice", f"<script>alert({text!r}); history.back();</script>")
+
+
+def county_list_page():
+    options = "".join(f'<option value="{index}">{name}</option>' for index, name in enumerate(COUNTIES))
+    return layout("Tennessee County Clerk", (
+        '<form action="/services" method="get">'
+        '<select name="countylist" onchange="this.form.submit()">'
+        f'<option value="">Select a county</option>{options}</select></form>'
+    ))
+
+
+def services_page(county_id: str):
+    return layout(f"{county_name(county_id)} County Clerk", (
+        f'<form name="myform1" action="/renewal/search" method="post">{hidden(county=county_id)}'
+        '<span>Plate Renewals</span></form>'
+        f'<form name="myform2" action="/renewal/dealer" method="post">{hidden(county=county_id)}'
+        '<span>Dealer Services</span></form>'
+    ))
+
+
+def street_number_page(county_id: str):
+    return layout("Renew Plate", (
+        f'<form id="renewalSearchForm" action="/renewal/lookup" method="post">{hidden(county=county_id)}'
+        '<label>Street number <input id="streetnum" name="streetnum" type="text"></label>'
+        '<label>Plate <input name="platenum" type="text"></label>'
+        '<button type="submit">Search</button></form>'
+    ))
+
+
+def form_page(county_id: str, plate: str, reject_first_submit: bool):
+    fields = "".join(
+        f'<input id="{name}" name="{name}" type="text">'
+        for name in ("name", "addressTwo", "city", "homePhone0", "homePhone1", "homePhone2", "email")
+    )
+    # the real form validates client side with a sweetalert2 dialog before posting
+    validation = (
+        "<script>var rejected = false;"
+        "document.getElementById('payrenewal_None').addEventListener('click', function (e) {"
+        " if (rejected) return; rejected = true; e.preventDefault();"
+        " var d = document.createElement('div');"
+        " d.innerHTML = '<div class=\"swal2-header\"><h2 id=\"swal2-title\">Please check the form</h2></div>'"
+        " + '<button class=\"swal2-confirm swal2-styled\">OK</button>';"
+        " d.querySelector('button').onclick = function () { d.remove(); };"
+        " document.body.appendChild(d); });</script>"
+    ) if reject_first_submit else ""
+    return layout("Renewal Details", (
+        f'<form id="renewalForm" action="/renewal/county" method="post">{hidden(county=county_id, plate=plate)}'
+        f"{fields}"
+        '<input id="confirmemail" name="confirmEmail" type="text">'
+        '<select id="state" name="state"><option value="">--</option>'
+        '<option value="TN">TN - Tennessee</option><option value="GA">GA - Georgia</option></select>'
+        '<input id="zip" name="zip" type="text">'
+        '<button id="payrenewal_None" name="payrenewal" value="1" type="submit">Pay Renewal</button>'
+        f"</form>{validation}"
+    ))
+
+
+def county_page(county_id: str, plate: str):
+    options = "".join(
+        f'<option value="{index}"{" selected" if str(index) == county_id else ""}>{name}</option>'
+        for index, name in enumerate(COUNTIES)
+    )
+    return layout("Confirm County", (
+        f'<form action="/renewal/fees?expresspay=Y" method="post">{hidden(plate=plate)}'
+        f'<select id="newCountyID" name="newCountyID">{options}</select>'
+        '<input type="submit" id="zipCodeSubmit" name="zipCodeSubmit" value="Continue"></form>'
+    ))
+
+
+def fee_page(county_id: str, plate: str):
+    county = county_name(county_id)
+    wheel_tax = county_wheel_tax(county)
+    subtotal = REGISTRATION_FEE + ONLINE_FEE + wheel_tax + MAIL_FEE
+    processing = round(subtotal * 0.0275)
+    summary = "".join(
+        f'<div class="col-md-2"><div>{label}</div><div>{html.escape(value)}</div></div>'
+        for label, value in (
+            ("Owner", "ON FILE"), ("County", county), ("License", plate), ("Make", "TOYT"),
+            ("Year", "2019"), ("Exp Date", "12/31/2026"),
+        )
+    )
+    amounts = "".join(
+        f'<div>{label} <span id="{label} Display">{dollars(cents)}</span></div>'
+        for label, cents in (
+            ("Registration", REGISTRATION_FEE), ("Online Fee", ONLINE_FEE), ("Organ Donor Amount", 0),
+            ("County Wheel Tax", wheel_tax), ("City Wheel Tax", 0), ("Mail Fee", MAIL_FEE),
+            ("Subtotal", subtotal), ("Processing Fee", processing), ("Total", subtotal + processing),
+        )
+    )
+    city_qty = (
+        '<label>Inside city limits <input id="MVCityQty" name="MVCityQty" type="text" value="0"></label>'
+        "<script>document.getElementById('MVCityQty').addEventListener('change', function () {"
+        f" var city = (parseInt(this.value, 10) || 0) * {CITY_WHEEL_TAX}, subtotal = {subtotal} + city,"
+        " processing = Math.round(subtotal * 0.0275),"
+        " fmt = function (c) { return '$' + (c / 100).toLocaleString('en-US', {minimumFractionDigits: 2}); };"
+        " document.getElementById('City Wheel Tax Display').innerText = fmt(city);"
+        " document.getElementById('Subtotal Display').innerText = fmt(subtotal);"
+        " document.getElementById('Processing Fee Display').innerText = fmt(processing);"
+        " document.getElementById('Total Display').innerText = fmt(subtotal + processing); });</script>"
+    ) if county == "Hamilton" else ""
+    shelby_verify = (
+        '<label><input id="shelby_address_verify" type="checkbox"> My address is correct</label>'
+        if county == "Shelby" else ""
+    )
+    return layout("Renewal Fees", (
+        f'<div class="row">{summary}</div>{amounts}{city_qty}{shelby_verify}'
+        '<label><input id="acceptTerms_credit" type="checkbox"> I accept the payment terms</label>'
+        f'<iframe id="iframe" src="/payment/form?plate={html.escape(plate)}" width="600" height="400"></iframe>'
+    ))
+
+
+def payment_form_page(plate: str):
+    months = "".join(f"<option>{month:02d}</option>" for month in range(1, 13))
+    years = "".join(f"<option>{year % 100:02d}</option>" for year in range(2024, 2040))
+    return layout("Payment", (
+        f'<form action="/payment/submit" method="post" target="_top">{hidden(plate=plate)}'
+        '<input id="payment-account" name="account" type="text">'
+        f'<label id="payment-expmonth-label"><select name="expmonth">{months}</select></label>'
+        f'<label id="payment-expyear-label"><select name="expyear">{years}</select></label>'
+        '<label id="payment-cv-label"><input name="cv" type="text"></label>'
+        '<button id="payment-submit-button" type="submit">Pay</button></form>'
+    ))
+
+
+def confirmation_page(plate: str):
+    return layout("Renewal Confirmed", f"<h1>Thank you</h1><p>Plate {html.escape(plate)} has been renewed.</p>")
+
+
+class MockClerkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockClerkServer"
+
+    def do_GET(self):
+        self.route("GET", {})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.route("POST", parse_qs(self.rfile.read(length).decode("utf-8", errors="replace")))
+
+    def route(self, method, form):
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in {**parse_qs(url.query), **form}.items()}
+        page = url.path.strip("/").replace("/", "_") or "landing"
+        site = self.server.site
+        if page == "__stats":
+            return self.respond(200, repr(site.stats()), "text/plain")
+        site.count(page)
+        site.delay(page)
+
+        if site.chance(site.config.error_rate):
+            return self.respond(503, layout("Service Unavailable", "<h1>Service Unavailable</h1>"))
+
+        if page == "landing":
+            body = county_list_page()
+        elif page == "services":
+            body = services_page(params.get("countylist", ""))
+        elif page == "renewal_search":
+            body = street_number_page(params.get("county", ""))
+        elif page == "renewal_lookup":
+            body = self.lookup(params)
+        elif page == "renewal_county":
+            body = county_page(params.get("county", ""), params.get("plate", ""))
+        elif page == "renewal_fees":
+            body = fee_page(params.get("newCountyID", ""), params.get("plate", ""))
+        elif page == "payment_form":
+            body = payment_form_page(params.get("plate", ""))
+        elif page == "payment_submit":
+            if params.get("account") == DECLINED_ACCOUNT or site.chance(site.config.decline_rate):
+                body = alert_page("Your card was declined.")
+            else:
+                return self.redirect(f"/renewalconfirm?plate={params.get('plate', '')}")
+        elif page == "renewalconfirm":
+            body = confirmation_page(params.get("plate", ""))
+        else:
+            return self.respond(404, layout("Not Found", "<h1>Not Found</h1>"))
+        self.respond(200, body)
+
+    def lookup(self, params):
+        site = self.server.site
+        county_id, plate = params.get("county", ""), params.get("platenum", "").strip().upper()
+        if not plate or plate.startswith(NOT_FOUND_PREFIX) or site.chance(site.config.alert_rate):
+            return alert_page("No record found for the plate number and street number entered.")
+        if county_name(county_id) == "Shelby":
+            # Shelby verifies the address on file and goes straight to the fees
+            return fee_page(county_id, plate)
+        return form_page(county_id, plate, site.chance(site.config.validation_rate))
+
+    def respond(self, status, body, content_type="text/html; charset=utf-8"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if self.path == "/":
+            self.send_header("Set-Cookie", f"PHPSESSID={random.getrandbits(64):x}; path=/")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockClerkServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, site):
+        super().__init__(address, MockClerkHandler)
+        self.site = site
+
+
+class MockClerkSite:
+    """The mock site on a background thread, for use from benchmarks"""
+
+    def __init__(self, config: MockConfig | None = None, host="127.0.0.1", port=0):
+        self.config = config if config is not None else MockConfig()
+        self.server = MockClerkServer((host, port), self)
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-clerk-site", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def chance(self, rate):
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def delay(self, page):
+        latency = self.config.page_latency.get(page, self.config.latency)
+        if latency <= 0:
+            return
+        with self._lock:
+            spread = self._random.uniform(-self.config.jitter, self.config.jitter)
+        time.sleep(max(0.0, latency * (1 + spread)))
+
+    def count(self, page):
+        with self._lock:
+            self._counts[page] = self._counts.get(page, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def page_latency(value):
+    page, _, seconds = value.partition("=")
+    if not seconds:
+        raise argparse.ArgumentTypeError("expected PAGE=SECONDS, e.g. renewal_fees=1.5")
+    return page, float(seconds)
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency varies by +/- this fraction")
+    parser.add_argument("--page-latency", type=page_latency, action="append", default=[], metavar="PAGE=SECONDS",
+                        help="latency for one page (landing, services, renewal_lookup, renewal_fees, ...)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of responses that are HTTP 503")
+    parser.add_argument("--alert-rate", type=float, default=0.0, help="fraction of plate searches that alert")
+    parser.add_argument("--validation-rate", type=float, default=0.0,
+                        help="fraction of forms that reject the first submit with a swal2 dialog")
+    parser.add_argument("--decline-rate", type=float, default=0.0, help="fraction of payments declined")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible runs")
+
+
+def mock_config(args):
+    return MockConfig(
+        latency=args.latency, jitter=args.jitter, page_latency=dict(args.page_latency),
+        error_rate=args.error_rate, alert_rate=args.alert_rate, validation_rate=args.validation_rate,
+        decline_rate=args.decline_rate, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    site = MockClerkSite(mock_config(args), args.host, args.port)
+    print(f"Mock clerk site listening on {site.url}")
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Run price queries against RENEWAL_SERVICE_URL and report how much time the
+condition-based waits saved compared to the fixed sleeps they replaced.
+
+Queries go straight to the Selenium flow (process_renewal_query_in_browser): the HTTP
+fast path, the caches and warmed-up sessions would answer without the browser waits
+this measures.
+
+    RENEWAL_SERVICE_URL=https://secure.tncountyclerk.com/ \
+        python benchmarks/wait_benchmark.py payloads.jsonl --runs 3
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from Main import process_renewal_query_in_browser  # noqa: E402
+from Models.QueryPriceRequest import QueryPriceRequest  # noqa: E402
+from Services.DriverPoolService import driver_pool  # noqa: E402
+from Services.StepTimingService import StepTimings  # noqa: E402
+
+
+def load_payloads(path):
+    with open(path) as f:
+        return [QueryPriceRequest(**json.loads(line)) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("payloads", help="JSONL file with one QueryPriceRequest body per line")
+    parser.add_argument("--runs", type=int, default=1, help="times to replay each payload")
+    args = parser.parse_args()
+
+    timings = StepTimings()
+    try:
+        for request in load_payloads(args.payloads):
+            for _ in range(args.runs):
+                try:
+                    process_renewal_query_in_browser(request, timings=timings)
+                except Exception as e:
+                    print(f"[Plate: {request.plateNumber}] query failed: {e}", file=sys.stderr)
+    finally:
+        driver_pool.close()
+
+    print(f"{'step':<26}{'count':>7}{'waited s':>11}{'fixed s':>10}{'saved s':>10}")
+    for row in sorted(timings.report(), key=lambda r: r["step"]):
+        print(f"{row['step']:<26}{row['count']:>7}{row['elapsed']:>11.2f}"
+              f"{row.get('fixed_delay', 0.0):>10.2f}{row.get('saved', 0.0):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,54 @@
 import { Container } from "@cloudflare/containers";
 
+// Uvicorn answers /health as soon as it imports; /ready waits for the workers' warm browsers
+const READY_POLL_INTERVAL_MS = 500;
+const READY_TIMEOUT_MS = 90_000;
+const PROBE_PATHS = new Set(["/health", "/ready"]);
+
 export class VehicleRenewalContainer extends Container {
   defaultPort = 80;
   sleepAfter = "5m";
+  private ready = false;
 
   override onStart(): void {
+    this.ready = false;
     console.log("Vehicle renewal container started");
   }
 
   override onStop(): void {
+    this.ready = false;
     console.log("Vehicle renewal container stopped");
   }
 
   override onError(error: unknown): void {
     console.error("Container error:", error);
   }
+
+  override async fetch(request: Request): Promise<Response> {
+    const path = new URL(request.url).pathname;
+    if (!this.ready && !PROBE_PATHS.has(path)) {
+      await this.waitUntilReady();
+    }
+    return await this.containerFetch(request);
+  }
+
+  private async waitUntilReady(): Promise<void> {
+    const deadline = Date.now() + READY_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      try {
+        const response = await this.containerFetch(new Request("http://container/ready"));
+        if (response.ok) {
+          this.ready = true;
+          return;
+        }
+      } catch {
+        // the server is not listening yet
+      }
+      await new Promise((resolve) => setTimeout(resolve, READY_POLL_INTERVAL_MS));
+    }
+    // forward anyway: a request served slowly beats one refused after waiting this long
+    console.error(`Container not ready after ${READY_TIMEOUT_MS}ms, forwarding anyway`);
+  }
 }
 
 export default {
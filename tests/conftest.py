@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# the app imports its modules from app/, as uvicorn runs it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+# keep the shared SQLite stores and metrics snapshots out of the real /tmp paths
+_state_dir = tempfile.mkdtemp(prefix="vehicle-renewal-tests-")
+for _name in (
+    "ALERT_CACHE_PATH", "BROWSER_ADMISSION_PATH", "COUNTY_PROFILE_PATH", "FEE_ESTIMATE_PATH",
+    "GEOCODE_CACHE_PATH", "JOB_STORE_PATH", "QUOTE_CACHE_PATH", "SESSION_STORE_PATH", "SINGLE_FLIGHT_PATH",
+    "SPECULATIVE_SESSION_PATH",
+):
+    os.environ.setdefault(_name, os.path.join(_state_dir, f"{_name.lower()}.sqlite3"))
+os.environ.setdefault("METRICS_DIR", os.path.join(_state_dir, "metrics"))
+os.environ.setdefault("READINESS_DIR", os.path.join(_state_dir, "readiness"))
@@ -0,0 +1,40 @@
+from decimal import Decimal
+
+from Services.FeePageService import parse_fee_page_html, read_fee_page_html
+from Services.HtmlPageService import parse_html
+
+FEE_PAGE = """
+<div class="row">
+  <div class="col-md-2"><div>Plate</div></div>
+  <div class="col-md-2"><div>County</div><div>KNOX</div></div>
+  <div class="col-md-2"><div>License</div><div>ABC123</div></div>
+  <div class="col-md-2"><div>Make</div><div>TOYT</div></div>
+  <div class="col-md-2"><div>Year</div><div>2019</div></div>
+  <div class="col-md-2"><div>Exp Date</div><div>11/30/2026</div></div>
+</div>
+<span id="Registration Display">$1,229.00</span>
+<span id="Online Fee Display">$ 2.00</span>
+<span id="County Wheel Tax Display">Call the clerk</span>
+<span id="Mail Fee Display"></span>
+<span id="Total Display">$1,236.50</span>
+"""
+
+
+def test_fee_page_fields_and_amounts():
+    fee_summary = parse_fee_page_html(FEE_PAGE)
+    assert (fee_summary.county, fee_summary.license, fee_summary.exp_date) == ("KNOX", "ABC123", "11/30/2026")
+    assert fee_summary.registration == Decimal("1229.00")
+    assert fee_summary.online_fee == Decimal("2.00")
+    assert fee_summary.county_wheel_tax is None
+    assert fee_summary.total == Decimal("1236.50")
+
+
+def test_response_keeps_the_fee_page_text():
+    response = read_fee_page_html(parse_html(FEE_PAGE)).to_response()
+    assert response["Registration"] == "1,229.00"
+    assert response["Online Fee"] == "2.00"
+    assert response["County Wheel Tax"] == "Call the clerk"
+    assert response["Mail Fee"] == ""
+    assert response["City Wheel Tax"] == ""
+    assert response["Total"] == "1,236.50"
+    assert response["Make"] == "TOYT"
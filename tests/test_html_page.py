@@ -0,0 +1,80 @@
+from Services.HtmlPageService import parse_html, top_level_statements
+
+FORM_PAGE = """
+<html><body>
+<form id="renewalForm" name="myform1" action="/renewal/county" method="post">
+  <input type="hidden" name="county" value="47">
+  <input id="name" name="name" type="text" value="">
+  <input id="agree" name="agree" type="checkbox" value="yes" checked>
+  <input id="optout" name="optout" type="checkbox">
+  <input name="disabled" value="x" disabled>
+  <select id="state" name="state">
+    <option value="">--
+    <option value="TN" selected>TN - Tennessee
+    <option>GA
+  </select>
+  <textarea name="notes">first line</textarea>
+  <button id="payrenewal_None" name="payrenewal" value="1" type="submit">Pay Renewal</button>
+</form>
+<div class="fees"><span id="Total Display">$ 1,234.50</span></div>
+<ul><li class="a b">one<li>two</ul>
+</body></html>
+"""
+
+
+def test_implicitly_closed_options_and_list_items():
+    page = parse_html(FORM_PAGE)
+    assert [option.text for option in page.select("#state option")] == ["--", "TN - Tennessee", "GA"]
+    assert [item.text for item in page.select("ul > li")] == ["one", "two"]
+
+
+def test_form_collects_successful_controls():
+    page = parse_html(FORM_PAGE, "https://clerk.example/renewal/form")
+    form = page.form_of(page.select_one("#name"))
+    assert form.method == "post"
+    assert form.action == "https://clerk.example/renewal/county"
+    assert form.data() == [
+        ("county", "47"), ("name", ""), ("agree", "yes"), ("state", "TN"), ("notes", "first line"),
+    ]
+    form.set("name", "Jane Doe")
+    form.submit_with(page.select_one("#payrenewal_None"))
+    assert ("name", "Jane Doe") in form.data()
+    assert form.data()[-1] == ("payrenewal", "1")
+
+
+def test_form_of_element_outside_a_form():
+    page = parse_html(FORM_PAGE)
+    assert page.form_of(page.select_one("ul")) is None
+
+
+def test_selectors():
+    page = parse_html(FORM_PAGE)
+    assert page.select_one("#Total\\ Display").text == "$ 1,234.50"
+    assert page.text_or_default("#Missing\\ Display", "n/a") == "n/a"
+    assert len(page.select("form[name^='myform'] input[type=checkbox]")) == 2
+    assert page.select_one("li.a.b").text == "one"
+    assert [el.get("id") for el in page.select("#name, #state")] == ["name", "state"]
+    assert page.select_one("div.fees > span:nth-child(1)").id == "Total Display"
+    assert page.select("body > span") == []
+
+
+def test_alerts_run_at_the_top_level():
+    page = parse_html("<script>alert('Plate not found'); history.back();</script>")
+    assert page.alerts() == ["Plate not found"]
+
+
+def test_alerts_skip_comments_and_conditional_code():
+    page = parse_html("""<script>
+        // alert("commented");
+        /* alert("block comment") */
+        if (missing) { alert("branch"); }
+        if (missing) alert("bare branch");
+        document.getElementById('x').onclick = function () { alert("handler"); };
+        var text = "alert('in a string'); {";
+    </script>""")
+    assert page.alerts() == []
+
+
+def test_top_level_statements_drop_blocks_and_comments():
+    statements = top_level_statements("var a = 1; /* b */ if (a) { alert('x'); } // c\nalert('y')")
+    assert [statement.strip() for statement in statements] == ["var a = 1", "if (a)", "alert('y')"]
@@ -0,0 +1,167 @@
+from urllib.parse import urlparse
+
+import pytest
+import urllib3
+
+from Models.QueryPriceRequest import QueryPriceRequest
+from Services.HtmlPageService import parse_html
+from Services.ClerkErrors import ClerkAlertError, UnrecognizedPageError
+from Services.HttpRenewalService import HttpRenewalService
+
+LANDING_URL = "https://clerk.example/"
+
+COUNTY_LIST = """
+<form action="/services" method="get"><select name="countylist">
+<option value="">Select a county</option><option value="18">Davidson</option><option value="46">Knox</option>
+<option value="78">Shelby</option></select></form>
+"""
+SERVICES = """
+<form name="myform1" action="/renewal/search" method="post"><input type="hidden" name="county" value="46"></form>
+"""
+PLATE_SEARCH = """
+<form name="expressRenew" action="/renewal/express" method="post"><input name="plateNumber" type="text"></form>
+<script>if (document.expressRenew.plateNumber.value === '') { alert('Enter a plate number'); }</script>
+"""
+STREET_NUMBER = """
+<form id="renewalSearchForm" action="/renewal/lookup" method="post">
+<input id="streetnum" name="streetnum" type="text"><input name="platenum" type="text"></form>
+<script>
+// alert("No record found for the plate number and street number entered.");
+function validate(form) { if (!form.streetnum.value) alert('Enter a street number'); }
+</script>
+"""
+FORM_PAGE = """
+<form id="renewalForm" action="/renewal/county" method="post">
+<input id="name" name="name"><input id="addressTwo" name="addressTwo"><input id="city" name="city">
+<select id="state" name="state"><option value="">--</option><option value="TN">TN - Tennessee</option></select>
+<input id="zip" name="zip"><input id="email" name="email"><input id="confirmemail" name="confirmEmail">
+<button id="payrenewal_None" name="payrenewal" value="1" type="submit">Pay Renewal</button>
+</form>
+<script>document.getElementById('payrenewal_None').onclick = function () { alert('Please check the form'); };</script>
+"""
+COUNTY_PAGE = """
+<form action="/renewal/fees" method="post"><select id="newCountyID" name="newCountyID">
+<option value="18">Davidson</option><option value="46">Knox</option><option value="78">Shelby</option></select>
+<input type="submit" id="zipCodeSubmit" name="zipCodeSubmit" value="Continue"></form>
+"""
+FEE_PAGE = """
+<div class="col-md-2"><div>County</div><div>KNOX</div></div>
+<span id="Registration Display">$29.00</span><span id="Total Display">$36.50</span>
+"""
+REJECTION = "<script>alert('No record found for the plate number and street number entered.'); history.back();</script>"
+
+
+class FakePool:
+    """Answers each path with a canned page and records the requests"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def request(self, method, url, body=None, headers=None, redirect=True, timeout=None):
+        self.requests.append((method, url, body))
+        page = self.pages[urlparse(url).path]
+        return urllib3.HTTPResponse(
+            body=page.encode(), headers={"Content-Type": "text/html; charset=utf-8"}, status=200,
+            preload_content=True,
+        )
+
+
+def query(**overrides):
+    fields = dict(
+        plateNumber="ABC123", county="Knox", name="Jane Doe", addressTwo="123 Main St", city="Knoxville",
+        state="TN", zip="37902", homePhone0="865", homePhone1="555", homePhone2="0100", email="a@b.com",
+        confirmEmail="a@b.com",
+    )
+    return QueryPriceRequest(**{**fields, **overrides})
+
+
+def clerk_site(**overrides):
+    pages = {
+        "/": COUNTY_LIST, "/services": SERVICES, "/renewal/search": PLATE_SEARCH,
+        "/renewal/express": STREET_NUMBER, "/renewal/lookup": FORM_PAGE, "/renewal/county": COUNTY_PAGE,
+        "/renewal/fees": FEE_PAGE,
+    }
+    return FakePool({**pages, **overrides})
+
+
+def test_identifies_each_page():
+    service = HttpRenewalService(query(), pool=clerk_site())
+    states = [service.identify(parse_html(html)) for html in (
+        COUNTY_LIST, SERVICES, PLATE_SEARCH, STREET_NUMBER, FORM_PAGE, COUNTY_PAGE, FEE_PAGE, REJECTION,
+    )]
+    assert states == [
+        "county_list", "services_page", "plate_search_page", "street_number_page", "form_page", "county_page",
+        "price_page", None,
+    ]
+
+
+def test_walks_to_the_fee_page_past_conditional_alerts():
+    pool = clerk_site()
+    fee_summary = HttpRenewalService(query(), pool=pool).process_query(LANDING_URL)
+    assert fee_summary["Total"] == "36.50"
+    assert [urlparse(url).path for _, url, _ in pool.requests] == [
+        "/", "/services", "/renewal/search", "/renewal/express", "/renewal/lookup", "/renewal/county",
+        "/renewal/fees",
+    ]
+    assert "platenum=ABC123" in pool.requests[4][2]
+    assert "streetnum=123" in pool.requests[4][2]
+
+
+@pytest.mark.parametrize("path", ["/renewal/express", "/renewal/lookup"])
+def test_rejection_page_is_a_clerk_alert(path):
+    service = HttpRenewalService(query(), pool=clerk_site(**{path: REJECTION}))
+    with pytest.raises(ClerkAlertError) as raised:
+        service.process_query(LANDING_URL)
+    assert raised.value.alert_text == "No record found for the plate number and street number entered."
+
+
+def test_search_page_shown_again_with_an_alert_is_a_clerk_alert():
+    rejected = STREET_NUMBER + "<script>alert('Plate is not eligible for online renewal');</script>"
+    service = HttpRenewalService(query(), pool=clerk_site(**{"/renewal/lookup": rejected}))
+    with pytest.raises(ClerkAlertError) as raised:
+        service.process_query(LANDING_URL)
+    assert raised.value.alert_text == "Plate is not eligible for online renewal"
+
+
+def test_unknown_page_falls_back():
+    service = HttpRenewalService(query(), pool=clerk_site(**{"/renewal/lookup": "<p>Down for maintenance</p>"}))
+    with pytest.raises(UnrecognizedPageError):
+        service.process_query(LANDING_URL)
+
+
+class BrokenPool(FakePool):
+    """A clerk site that resets the connection once the plate search is posted"""
+
+    def request(self, method, url, body=None, headers=None, redirect=True, timeout=None):
+        if urlparse(url).path == "/renewal/express":
+            raise urllib3.exceptions.ProtocolError("Connection aborted.", ConnectionResetError(104, "reset"))
+        return super().request(method, url, body, headers, redirect, timeout)
+
+
+def test_transport_error_falls_back():
+    service = HttpRenewalService(query(), pool=BrokenPool(clerk_site().pages))
+    with pytest.raises(UnrecognizedPageError):
+        service.process_query(LANDING_URL)
+
+
+def test_street_number_page_without_a_form_falls_back():
+    page = STREET_NUMBER.replace("<form id", "<div id").replace("</form>", "</div>")
+    service = HttpRenewalService(query(), pool=clerk_site(**{"/renewal/express": page}))
+    with pytest.raises(UnrecognizedPageError):
+        service.process_query(LANDING_URL)
+
+
+def test_form_page_ticks_the_shelby_address_check():
+    page = FORM_PAGE.replace("</form>", '<input id="shelby_address_verify" name="addressVerify" type="checkbox"></form>')
+    pool = clerk_site(**{"/renewal/lookup": page})
+    HttpRenewalService(query(county="Shelby"), pool=pool).process_query(LANDING_URL)
+    form_post = next(body for _, url, body in pool.requests if urlparse(url).path == "/renewal/county")
+    assert "addressVerify=on" in form_post
+
+
+def test_form_page_with_a_scripted_shelby_address_check_falls_back():
+    page = FORM_PAGE.replace("</form>", '<input id="shelby_address_verify" type="checkbox"></form>')
+    service = HttpRenewalService(query(county="Shelby"), pool=clerk_site(**{"/renewal/lookup": page}))
+    with pytest.raises(UnrecognizedPageError, match="Shelby"):
+        service.process_query(LANDING_URL)
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from Services.JobQueueService import LOST_JOB_ERROR, Job, JobQueue, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(path=str(tmp_path / "jobs.sqlite3"))
+
+
+def held_by(store, pid, status="queued"):
+    job = Job("quote", None, None)
+    store.save(job, status)
+    with sqlite3.connect(store.path) as conn:
+        conn.execute("UPDATE jobs SET worker_pid = ? WHERE id = ?", (pid, job.id))
+    return job
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_fail_lost_fails_jobs_of_stopped_workers_and_this_one(store):
+    dead = held_by(store, dead_pid(), "running")
+    own = held_by(store, os.getpid())
+    other = held_by(store, os.getppid())
+    done = Job("quote", None, None)
+    store.save(done, "succeeded", 200, {"Total": "36.50"})
+
+    assert store.fail_lost() == ["quote", "quote"]
+    for job in (dead, own):
+        record = store.get(job.id)
+        assert (record["status"], record["status_code"], record["error"]) == ("failed", 503, LOST_JOB_ERROR)
+    assert store.get(other.id)["status"] == "queued"
+    assert store.get(done.id)["status"] == "succeeded"
+    assert store.counts() == {"failed": 2, "queued": 1, "succeeded": 1}
+
+
+def test_close_fails_the_jobs_still_queued(store):
+    queue = JobQueue(store, workers=0)
+    lost_before = queue.stats()["lost"]
+    jobs = [queue.submit("quote", lambda request: None, None) for _ in range(3)]
+    assert queue.stats()["queue_depth"] == 3
+
+    queue.close()
+    assert [store.get(job.id)["status"] for job in jobs] == ["failed"] * 3
+    stats = queue.stats()
+    assert (stats["queue_depth"], stats["lost"] - lost_before) == (0, 3)
+
+
+def test_adds_the_worker_column_to_an_existing_store(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, status_code INTEGER,"
+            " result TEXT, error TEXT, submitted_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO jobs VALUES ('old', 'quote', 'queued', NULL, NULL, NULL, 0, NULL, NULL, 1e12)")
+    store = JobStore(path=path)
+    assert store.fail_lost() == ["quote"]
+    assert store.get("old")["status"] == "failed"
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from Services.MetricsService import Histogram, county_label
+
+
+def observed(histogram):
+    return {tuple(json.loads(key)): count for key, (_, _, count) in histogram.snapshot().items()}
+
+
+def test_time_records_the_outcome_of_the_block():
+    histogram = Histogram("stage_seconds", "", ("stage", "outcome"))
+    with histogram.time(stage="driver_start"):
+        pass
+    with pytest.raises(TimeoutError):
+        with histogram.time(stage="driver_start"):
+            raise TimeoutError("no browser")
+    with histogram.time(stage="driver_start", outcome="alert"):
+        pass
+    assert observed(histogram) == {
+        ("driver_start", "ok"): 1, ("driver_start", "error"): 1, ("driver_start", "alert"): 1,
+    }
+
+
+def test_time_without_an_outcome_label():
+    histogram = Histogram("wait_seconds", "", ("step",))
+    with histogram.time(step="zip_lookup"):
+        pass
+    assert observed(histogram) == {("zip_lookup",): 1}
+
+
+def test_county_label_is_a_tennessee_county_or_other():
+    assert county_label(" Van Buren ") == "van buren"
+    assert county_label("SHELBY") == "shelby"
+    assert county_label("Shelby County") == "other"
+    assert county_label("") == "other"
+    assert county_label(None) == "other"
@@ -0,0 +1,34 @@
+import pytest
+
+from Models.QueryPriceRequest import QueryPriceRequest
+from Services.QuoteCacheService import QuoteCache
+
+
+def query(plate, county):
+    return QueryPriceRequest(
+        plateNumber=plate, county=county, name="Jane Doe", addressTwo="123 Main St", city="Knoxville",
+        state="TN", zip="37902", homePhone0="865", homePhone1="555", homePhone2="0100", email="a@b.com",
+        confirmEmail="a@b.com",
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = QuoteCache(path=str(tmp_path / "quotes.sqlite3"))
+    for plate, county in (("ABC123", "Knox"), ("ABC123", "Shelby"), ("XYZ789", "Knox"), ("XYZ789", "Davidson")):
+        cache.put(query(plate, county), {"Total": "36.50"})
+    return cache
+
+
+@pytest.mark.parametrize("filters, invalidated, kept", [
+    ({"plate": "abc123"}, 2, [("XYZ789", "Knox"), ("XYZ789", "Davidson")]),
+    ({"county": "KNOX"}, 2, [("ABC123", "Shelby"), ("XYZ789", "Davidson")]),
+    ({"plate": "ABC123", "county": "Knox"}, 1, [("ABC123", "Shelby"), ("XYZ789", "Knox"), ("XYZ789", "Davidson")]),
+    ({}, 4, []),
+])
+def test_invalidate_applies_each_filter(cache, filters, invalidated, kept):
+    assert cache.invalidate(**filters) == invalidated
+    remaining = [(plate, county) for plate, county in (
+        ("ABC123", "Knox"), ("ABC123", "Shelby"), ("XYZ789", "Knox"), ("XYZ789", "Davidson"),
+    ) if cache.get(query(plate, county))]
+    assert remaining == kept